@@ -0,0 +1,106 @@
+# benchmarks/bench_decode.py
+"""
+Microbenchmark: single-pass decode_cmd vs. the old two-pass validate_cmd + to_command.
+
+    python -m benchmarks.bench_decode [-n 200000] [-r 7]   (from the repo root)
+
+Each variant is timed -r times (runs interleaved) and the best run is reported.
+"""
+from __future__ import annotations
+
+import json
+import timeit
+from typing import Any, Dict, Tuple
+
+from common.message_schema import decode_cmd
+
+SAMPLE = json.dumps({
+    "type": "cmd",
+    "seq": 12345,
+    "ts": 1700000000.123456,
+    "confidence": 0.93,
+    "estop": False,
+    "torque": True,
+    "joints": {"1": 2048, "2": 1900, "3": 2210, "4": 2001, "5": 2100, "6": 1500},
+    "features": {"wrist_x": 0.51, "wrist_y": 0.47, "index_mcp_y": 0.44, "pinch": 0.3, "roll": 0.52, "home": 0.0},
+})
+
+
+# Reference copy of the pre-decode_cmd implementation (validate, throw away, convert again)
+def _legacy_validate(msg: Dict[str, Any]) -> Tuple[bool, str]:
+    for k in ["type", "seq", "ts", "confidence", "estop", "torque", "joints", "features"]:
+        if k not in msg:
+            return False, f"Missing key: {k}"
+    if msg["type"] != "cmd":
+        return False, "type must be 'cmd'"
+    try:
+        if int(msg["seq"]) < 0:
+            return False, "seq must be >= 0"
+        float(msg["ts"])
+        conf = float(msg["confidence"])
+        if not (0.0 <= conf <= 1.0):
+            return False, "confidence must be in [0,1]"
+        bool(msg["estop"])
+        bool(msg["torque"])
+        joints = msg["joints"]
+        if not isinstance(joints, dict):
+            return False, "joints must be a dict"
+        for k, v in joints.items():
+            mid = int(k)
+            if mid < 1 or mid > 253:
+                return False, f"Invalid motor id: {mid}"
+            int(v)
+        feats = msg["features"]
+        if not isinstance(feats, dict):
+            return False, "features must be a dict"
+        for fk, fv in feats.items():
+            _ = str(fk)
+            float(fv)
+    except Exception as e:
+        return False, f"Type conversion error: {e}"
+    return True, "ok"
+
+
+def _legacy_to_command(msg: Dict[str, Any]) -> tuple:
+    return (
+        int(msg["seq"]),
+        float(msg["ts"]),
+        float(msg["confidence"]),
+        bool(msg["estop"]),
+        bool(msg["torque"]),
+        {int(k): int(v) for k, v in msg["joints"].items()},
+        {str(k): float(v) for k, v in msg["features"].items()},
+    )
+
+
+def _legacy(msg: Dict[str, Any]) -> tuple:
+    ok, _ = _legacy_validate(msg)
+    return _legacy_to_command(msg)
+
+
+def main() -> int:
+    import argparse
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=200_000, help="iterations per timing run")
+    ap.add_argument("-r", "--repeat", type=int, default=7, help="timing runs per variant (best is kept)")
+    args = ap.parse_args()
+
+    msg = json.loads(SAMPLE)
+    variants = [("validate_cmd+to_command (legacy)", _legacy), ("decode_cmd", decode_cmd)]
+    # Runs of the two variants are interleaved so a load change on the machine hits both alike
+    best = {name: float("inf") for name, _ in variants}
+    for _ in range(max(1, args.repeat)):
+        for name, fn in variants:
+            best[name] = min(best[name], timeit.timeit(lambda: fn(msg), number=args.n))
+    results = {name: t / args.n * 1e6 for name, t in best.items()}
+    for name, us in results.items():
+        print(f"{name:36s} {us:7.3f} us/msg")
+
+    legacy, new = results.values()
+    print(f"speedup: {legacy / new:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
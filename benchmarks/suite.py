@@ -0,0 +1,430 @@
+# benchmarks/suite.py
+"""
+Hot-path benchmark suite with regression tracking. Run from the repo root:
+
+    python -m benchmarks.suite                          # all benchmarks -> bench_results.json
+    python -m benchmarks.suite -k safety -k tick        # only names containing "safety" or "tick"
+    python -m benchmarks.suite --baseline base.json     # also compare, exit 1 on regression
+    python -m benchmarks.suite --compare base.json new.json   # compare two stored runs
+
+Each benchmark times single calls (or small fixed batches for sub-microsecond work) with
+perf_counter_ns and reports p50/p99/mean latency per call and throughput in calls/s.
+Benchmarks whose dependencies are missing (e.g. numpy for the laptop side) are reported as skipped.
+"""
+from __future__ import annotations
+
+import gc
+import json
+import platform
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from common.config import JointCalib, load_yaml
+from common.message_schema import NUM_JOINTS, TeleopCommand
+
+Setup = Callable[[], Tuple[Callable[[], object], Callable[[], None]]]
+
+
+@dataclass
+class BenchResult:
+    name: str
+    calls: int
+    p50_us: float
+    p99_us: float
+    mean_us: float
+    throughput_per_s: float
+
+
+def measure(name: str, fn: Callable[[], object], calls: int, inner: int = 1, warmup: int = 200) -> BenchResult:
+    """Time `calls` samples of `inner` back-to-back calls; latencies are per call."""
+    for _ in range(warmup):
+        fn()
+    samples: List[int] = [0] * calls
+    clock = time.perf_counter_ns
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        t_start = clock()
+        if inner == 1:
+            for i in range(calls):
+                t0 = clock()
+                fn()
+                samples[i] = clock() - t0
+        else:
+            rng = range(inner)
+            for i in range(calls):
+                t0 = clock()
+                for _ in rng:
+                    fn()
+                samples[i] = clock() - t0
+        total_ns = clock() - t_start
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    samples.sort()
+    per = 1e-3 / inner
+    return BenchResult(
+        name=name,
+        calls=calls * inner,
+        p50_us=samples[len(samples) // 2] * per,
+        p99_us=samples[min(len(samples) - 1, int(len(samples) * 0.99))] * per,
+        mean_us=sum(samples) / len(samples) * per,
+        throughput_per_s=calls * inner / (total_ns * 1e-9) if total_ns else 0.0,
+    )
+
+
+# ---- fixtures ----
+
+def _calib() -> Dict[int, JointCalib]:
+    # Synthetic calibration so the suite doesn't depend on the robot's calibration file
+    return {mid: JointCalib(motor_id=mid, range_min=500, range_max=3500, homing_offset=0)
+            for mid in range(1, NUM_JOINTS + 1)}
+
+
+def _command(seq: int) -> TeleopCommand:
+    return TeleopCommand(
+        seq=seq,
+        ts=time.time(),
+        confidence=0.93,
+        estop=False,
+        torque=True,
+        joints=[2048 + (seq * 7 + i * 31) % 200 for i in range(NUM_JOINTS)],
+        features={"wrist_x": 0.51, "wrist_y": 0.47, "index_mcp_y": 0.44, "pinch": 0.3, "roll": 0.52, "home": 0.0},
+    )
+
+
+# ---- benchmarks: each setup returns (call, teardown) ----
+
+def bench_features() -> Tuple[Callable[[], object], Callable[[], None]]:
+    import numpy as np
+
+    from laptop.features import FeatureExtractor
+
+    cfg = load_yaml("config/mapping.yaml")["features"]
+    fx = FeatureExtractor(
+        ema_alpha=cfg["ema_alpha"],
+        dz_wrist_xy=cfg["deadzone_wrist_xy"],
+        dz_roll=cfg["deadzone_roll"],
+        dz_pinch=cfg["deadzone_pinch"],
+    )
+    lms = np.random.default_rng(0).random((21, 3), dtype=np.float32)
+    return (lambda: fx.extract(lms)), (lambda: None)
+
+
+def bench_mapping() -> Tuple[Callable[[], object], Callable[[], None]]:
+    from laptop.mapping import HandToJointMapper
+
+    mapper = HandToJointMapper(load_yaml("config/mapping.yaml"), _calib())
+    feats = {"wrist_x": 0.61, "wrist_y": 0.42, "index_mcp_y": 0.5, "pinch": 0.3, "roll": 0.55}
+    return (lambda: mapper.map(feats)), (lambda: None)
+
+
+def bench_hands_batch() -> Tuple[Callable[[], object], Callable[[], None]]:
+    # Two-hand frame, both hands visible (the app's path): features and joints for both arms,
+    # one batch each
+    import numpy as np
+
+    from laptop.features import FeatureExtractor
+    from laptop.mapping import HandToJointMapper
+
+    mapping_cfg = load_yaml("config/mapping.yaml")
+    cfg = mapping_cfg["features"]
+    fx = FeatureExtractor(
+        ema_alpha=cfg["ema_alpha"],
+        dz_wrist_xy=cfg["deadzone_wrist_xy"],
+        dz_roll=cfg["deadzone_roll"],
+        dz_pinch=cfg["deadzone_pinch"],
+        slots=2,
+    )
+    mapper = HandToJointMapper(mapping_cfg, [_calib(), _calib()])
+    lms = np.random.default_rng(0).random((2, 21, 3), dtype=np.float32)
+    return (lambda: mapper.map_batch(fx.extract_batch(lms))), (lambda: None)
+
+
+def bench_decode_cmd() -> Tuple[Callable[[], object], Callable[[], None]]:
+    from benchmarks.bench_decode import SAMPLE
+    from common.message_schema import decode_cmd
+
+    msg = json.loads(SAMPLE)
+    return (lambda: decode_cmd(msg)), (lambda: None)
+
+
+def bench_validate_to_command() -> Tuple[Callable[[], object], Callable[[], None]]:
+    from benchmarks.bench_decode import SAMPLE
+    from common.message_schema import to_command, validate_cmd
+
+    msg = json.loads(SAMPLE)
+
+    def call():
+        ok, _ = validate_cmd(msg)
+        return to_command(msg) if ok else None
+
+    return call, (lambda: None)
+
+
+def bench_wire_decode() -> Tuple[Callable[[], object], Callable[[], None]]:
+    from common.wire import decode_frame, encode_command
+
+    frame = encode_command(_command(1))
+    return (lambda: decode_frame(frame)), (lambda: None)
+
+
+def bench_ndjson_framing() -> Tuple[Callable[[], object], Callable[[], None]]:
+    """One recv worth of 16 NDJSON lines split into lines by the Pi's StreamFramer."""
+    from benchmarks.bench_decode import SAMPLE
+    from pi.framing import StreamFramer
+
+    chunk = ((SAMPLE + "\n") * 16).encode("utf-8")
+    rx = StreamFramer()
+
+    def call():
+        rx.feed(chunk)
+        return rx.lines()
+
+    return call, (lambda: None)
+
+
+def bench_safety_apply() -> Tuple[Callable[[], object], Callable[[], None]]:
+    from pi.safety import SafetyLayer
+
+    safety = SafetyLayer(_calib(), stale_timeout_s=0.35, hard_stop_timeout_s=1.0)
+    joints = _command(1).joints_by_id()
+    return (lambda: safety.apply(seq=1, estop=False, torque=True, confidence_ok=True,
+                                 joints=joints, home_req=False)), (lambda: None)
+
+
+def bench_safety_envelope() -> Tuple[Callable[[], object], Callable[[], None]]:
+    from pi.safety import JointLimits, SafetyLayer
+
+    limits = {mid: JointLimits(max_velocity=3000.0, max_accel=30000.0) for mid in range(1, NUM_JOINTS + 1)}
+    safety = SafetyLayer(_calib(), stale_timeout_s=0.35, hard_stop_timeout_s=1.0, limits=limits)
+    safety.reset_motion({mid: 2048 for mid in range(1, NUM_JOINTS + 1)})
+    poses = [{mid: 1500 for mid in range(1, NUM_JOINTS + 1)}, {mid: 2600 for mid in range(1, NUM_JOINTS + 1)}]
+    state = {"t": 0.0, "k": 0}
+
+    def call():
+        # Alternate between two far-apart poses so the velocity/accel limits stay engaged
+        state["t"] += 0.01
+        state["k"] += 1
+        return safety.limit_motion(dict(poses[(state["k"] // 50) & 1]), state["t"])
+
+    return call, (lambda: None)
+
+
+def bench_csv_logger() -> Tuple[Callable[[], object], Callable[[], None]]:
+    from pi.logger import CSVLogger
+
+    tmp = tempfile.TemporaryDirectory()
+    logger = CSVLogger(tmp.name)
+    logger.start()
+    c = _command(1)
+    cmd = c.joints_by_id()
+
+    def call():
+        logger.write(seq=c.seq, confidence=c.confidence, mode="TRACK", estop=False, torque=True,
+                     features=c.features, cmd=cmd, pos=cmd)
+
+    def teardown():
+        logger.stop()
+        tmp.cleanup()
+
+    return call, teardown
+
+
+def bench_flight_logger() -> Tuple[Callable[[], object], Callable[[], None]]:
+    from pi.control import LATENCY_STAGES
+    from pi.flight_log import FlightLogger
+
+    tmp = tempfile.TemporaryDirectory()
+    logger = FlightLogger(tmp.name, latency_stages=LATENCY_STAGES)
+    logger.start()
+    c = _command(1)
+    cmd = c.joints_by_id()
+    lat = [1.0] * len(LATENCY_STAGES)
+
+    def call():
+        logger.write(seq=c.seq, confidence=c.confidence, mode="TRACK", estop=False, torque=True,
+                     features=c.features, cmd=cmd, pos=cmd, latency=lat)
+
+    def teardown():
+        logger.stop()
+        tmp.cleanup()
+
+    return call, teardown
+
+
+def bench_telemetry_read() -> Tuple[Callable[[], object], Callable[[], None]]:
+    """One full telemetry read + decode on the simulated bus (wire time accounted, not waited)."""
+    from pi.dxl_driver import DxlConfig
+    from pi.sim_bus import SimDynamixelBus
+    from pi.telemetry import TelemetryReader
+
+    ids = list(range(1, NUM_JOINTS + 1))
+    cfg = DxlConfig(device="sim", baudrate=1_000_000, protocol_version=2.0, addr_torque_enable=64,
+                    addr_goal_position=116, addr_present_position=132,
+                    len_goal_position=4, len_present_position=4)
+    bus = SimDynamixelBus(cfg, ids, realtime=False)
+    bus.open()
+    bus.torque_all(True)
+    reader = TelemetryReader(bus)
+    return reader.read_once, bus.close
+
+
+def _server_tick(realtime_bus: bool) -> Tuple[Callable[[], object], Callable[[], None]]:
+    """ControlLoop.tick on the simulated bus with a fresh command every tick (worst case)."""
+    from common.mailbox import LatestMailbox
+    from pi.control import LATENCY_STAGES, ControlLoop
+    from pi.dxl_driver import DxlConfig
+    from pi.flight_log import FlightLogger
+    from pi.safety import JointLimits, SafetyLayer
+    from pi.sim_bus import SimDynamixelBus
+    from pi.trajectory import SetpointInterpolator
+
+    ids = list(range(1, NUM_JOINTS + 1))
+    cfg = DxlConfig(device="sim", baudrate=1_000_000, protocol_version=2.0, addr_torque_enable=64,
+                    addr_goal_position=116, addr_present_position=132,
+                    len_goal_position=4, len_present_position=4)
+    bus = SimDynamixelBus(cfg, ids, realtime=realtime_bus)
+    bus.open()
+    bus.torque_all(True)
+    calib = _calib()
+    limits = {mid: JointLimits(max_velocity=3000.0, max_accel=30000.0) for mid in ids}
+    safety = SafetyLayer(calib, stale_timeout_s=0.35, hard_stop_timeout_s=1.0, limits=limits)
+    tmp = tempfile.TemporaryDirectory()
+    logger = FlightLogger(tmp.name, latency_stages=LATENCY_STAGES)
+    logger.start()
+    mailbox: LatestMailbox[TeleopCommand] = LatestMailbox()
+    control = ControlLoop(
+        bus=bus, safety=safety, logger=logger, mailbox=mailbox, ids=ids,
+        home_targets={mid: 2048 for mid in ids},
+        interpolator=SetpointInterpolator(ids, clamp=safety.clamp, mode="linear"),
+    )
+    state = {"seq": 0}
+
+    def call():
+        state["seq"] += 1
+        mailbox.publish(_command(state["seq"]))
+        control.tick()
+
+    def teardown():
+        logger.stop()
+        tmp.cleanup()
+        bus.close()
+
+    return call, teardown
+
+
+# name -> (setup, calls, inner)
+BENCHMARKS: Dict[str, Tuple[Setup, int, int]] = {
+    "features.extract": (bench_features, 20_000, 1),
+    "mapping.map": (bench_mapping, 20_000, 1),
+    "hands.extract_map_batch_2": (bench_hands_batch, 20_000, 1),
+    "schema.decode_cmd": (bench_decode_cmd, 20_000, 10),
+    "schema.validate_cmd+to_command": (bench_validate_to_command, 20_000, 10),
+    "wire.decode_frame": (bench_wire_decode, 20_000, 10),
+    "framing.ndjson_16_lines": (bench_ndjson_framing, 20_000, 1),
+    "safety.apply": (bench_safety_apply, 20_000, 10),
+    "safety.limit_motion": (bench_safety_envelope, 20_000, 1),
+    "logger.csv_write": (bench_csv_logger, 20_000, 1),
+    "logger.flight_write": (bench_flight_logger, 20_000, 1),
+    "telemetry.read_decode": (bench_telemetry_read, 20_000, 1),
+    "server.tick": (lambda: _server_tick(False), 5_000, 1),
+    "server.tick_1mbaud_bus": (lambda: _server_tick(True), 2_000, 1),
+}
+
+
+def run(selected: Optional[List[str]], scale: float) -> Dict[str, object]:
+    results: Dict[str, object] = {}
+    skipped: Dict[str, str] = {}
+    for name, (setup, calls, inner) in BENCHMARKS.items():
+        if selected and not any(k in name for k in selected):
+            continue
+        try:
+            call, teardown = setup()
+        except ImportError as e:
+            skipped[name] = f"missing dependency: {e.name or e}"
+            print(f"{name:34s} skipped ({skipped[name]})")
+            continue
+        try:
+            r = measure(name, call, max(10, int(calls * scale)), inner=inner)
+        finally:
+            teardown()
+        results[name] = asdict(r)
+        print(f"{name:34s} p50={r.p50_us:9.2f}us p99={r.p99_us:9.2f}us "
+              f"mean={r.mean_us:9.2f}us {r.throughput_per_s:12.0f}/s")
+    return {
+        "meta": {
+            "timestamp": time.time(),
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "scale": scale,
+        },
+        "results": results,
+        "skipped": skipped,
+    }
+
+
+def compare(base: Dict[str, object], new: Dict[str, object], threshold: float, p99_threshold: float) -> int:
+    """
+    Print a per-benchmark comparison. A regression is p50 slower by more than `threshold`,
+    throughput lower by more than `threshold`, or p99 slower by more than `p99_threshold`
+    (tails are noisier). Returns the number of regressions.
+    """
+    regressions = 0
+    b_res, n_res = base.get("results", {}), new.get("results", {})
+    print(f"{'benchmark':34s} {'p50 base':>10s} {'p50 new':>10s} {'d p50':>8s} {'d p99':>8s} {'d thr':>8s}")
+    for name in sorted(set(b_res) | set(n_res)):
+        if name not in b_res or name not in n_res:
+            print(f"{name:34s} {'only in ' + ('new' if name in n_res else 'baseline'):>30s}")
+            continue
+        b, n = b_res[name], n_res[name]
+        d50 = n["p50_us"] / b["p50_us"] - 1.0 if b["p50_us"] else 0.0
+        d99 = n["p99_us"] / b["p99_us"] - 1.0 if b["p99_us"] else 0.0
+        dthr = n["throughput_per_s"] / b["throughput_per_s"] - 1.0 if b["throughput_per_s"] else 0.0
+        bad = d50 > threshold or dthr < -threshold or d99 > p99_threshold
+        regressions += bad
+        print(f"{name:34s} {b['p50_us']:10.2f} {n['p50_us']:10.2f} {d50:+8.1%} {d99:+8.1%} {dthr:+8.1%}"
+              f"{'  REGRESSION' if bad else ''}")
+    print(f"{regressions} regression(s) (p50/throughput > {threshold:.0%}, p99 > {p99_threshold:.0%})")
+    return regressions
+
+
+def main() -> int:
+    import argparse
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("-k", action="append", dest="only", help="run benchmarks whose name contains this (repeatable)")
+    ap.add_argument("-o", "--out", default="bench_results.json", help="JSON results file")
+    ap.add_argument("--scale", type=float, default=1.0, help="multiply iteration counts (e.g. 0.1 for a quick run)")
+    ap.add_argument("--baseline", help="compare this run against a stored results file")
+    ap.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two stored results files, no run")
+    ap.add_argument("--threshold", type=float, default=0.15, help="allowed p50/throughput slowdown (fraction)")
+    ap.add_argument("--p99-threshold", type=float, default=0.50, help="allowed p99 slowdown (fraction)")
+    args = ap.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], encoding="utf-8") as f:
+            base = json.load(f)
+        with open(args.compare[1], encoding="utf-8") as f:
+            new = json.load(f)
+        return 1 if compare(base, new, args.threshold, args.p99_threshold) else 0
+
+    res = run(args.only, args.scale)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(res, f, indent=2)
+    print(f"wrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            base = json.load(f)
+        return 1 if compare(base, res, args.threshold, args.p99_threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
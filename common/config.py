@@ -4,7 +4,7 @@ from __future__ import annotations
 import json
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, Optional
 
 import yaml
 
@@ -27,7 +27,7 @@ class JointCalib:
     homing_offset: int
 
 
-def load_calibration(calib_path: str | Path) -> Dict[int, JointCalib]:
+def load_calibration(calib_path: str | Path, motor_ids: Optional[Iterable[int]] = None) -> Dict[int, JointCalib]:
     data = load_json(calib_path)
     # Accept either:
     # 1) {"joints":[{"motor_id":1,"range_min":...}, ...]}
@@ -58,8 +58,8 @@ def load_calibration(calib_path: str | Path) -> Dict[int, JointCalib]:
     else:
         raise ValueError(f"Unsupported calibration JSON format: {calib_path}")
 
-    # Basic sanity check for IDs 1–6
-    for mid in range(1, 7):
+    # Basic sanity check for the arm's IDs (1–6 unless given)
+    for mid in (motor_ids if motor_ids is not None else range(1, 7)):
         if mid not in joints:
             raise ValueError(f"Calibration missing motor_id {mid}. Found: {sorted(joints.keys())}")
 
@@ -0,0 +1,58 @@
+# common/latency.py
+from __future__ import annotations
+
+from array import array
+from typing import Dict, Iterable, List, Tuple
+
+PERCENTILES: Tuple[float, ...] = (50.0, 95.0, 99.0)
+
+
+class RollingHistogram:
+    """
+    Latency samples (ms) over a sliding window of the last `window` values.
+    record() is O(1) into a preallocated ring; percentiles are only computed when asked
+    (stats print), so the hot path never sorts.
+    """
+
+    def __init__(self, window: int = 1000) -> None:
+        self.window = max(1, int(window))
+        self._ring = array("d", [0.0] * self.window)
+        self._n = 0      # total samples ever recorded
+        self.max_ms = 0.0
+
+    def record(self, ms: float) -> None:
+        self._ring[self._n % self.window] = ms
+        self._n += 1
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    @property
+    def count(self) -> int:
+        return self._n
+
+    def percentiles(self, pcts: Iterable[float] = PERCENTILES) -> List[float]:
+        n = min(self._n, self.window)
+        if n == 0:
+            return [0.0 for _ in pcts]
+        s = sorted(self._ring[:n])
+        return [s[min(n - 1, int(n * p / 100.0))] for p in pcts]
+
+
+class StageLatency:
+    """One RollingHistogram per named pipeline stage, in a fixed order for printing and logging."""
+
+    def __init__(self, stages: Iterable[str], window: int = 1000) -> None:
+        self.stages = tuple(stages)
+        self.hist: Dict[str, RollingHistogram] = {s: RollingHistogram(window) for s in self.stages}
+
+    def record(self, stage: str, ms: float) -> None:
+        self.hist[stage].record(ms)
+
+    def summary(self) -> str:
+        parts = []
+        for s in self.stages:
+            h = self.hist[s]
+            if h.count:
+                p50, p95, p99 = h.percentiles()
+                parts.append(f"{s}={p50:.1f}/{p95:.1f}/{p99:.1f}")
+        return " ".join(parts) + " (ms p50/p95/p99)" if parts else "no samples"
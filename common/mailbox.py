@@ -0,0 +1,57 @@
+# common/mailbox.py
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from typing import Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass
+class MailboxStats:
+    published: int = 0
+    taken: int = 0
+    overwritten: int = 0  # items replaced before anyone took them
+
+
+class LatestMailbox(Generic[T]):
+    """
+    Single-slot, latest-wins handoff between one producer and one consumer thread.
+    publish() replaces whatever is in the slot; take() empties it.
+    The consumer therefore never sees a backlog, only the newest item.
+    """
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition(threading.Lock())
+        self._item: Optional[T] = None
+        self._full = False
+        self.stats = MailboxStats()
+
+    def publish(self, item: T) -> bool:
+        """Store item. Returns True if an unread item was overwritten."""
+        with self._cond:
+            overwrote = self._full
+            if overwrote:
+                self.stats.overwritten += 1
+            self._item = item
+            self._full = True
+            self.stats.published += 1
+            self._cond.notify()
+        return overwrote
+
+    def take(self, timeout_s: Optional[float] = None) -> Optional[T]:
+        """
+        Remove and return the newest item, or None if empty.
+        timeout_s=None never blocks; otherwise wait up to timeout_s for an item.
+        """
+        with self._cond:
+            if not self._full and timeout_s is not None:
+                self._cond.wait(timeout_s)
+            if not self._full:
+                return None
+            item = self._item
+            self._item = None
+            self._full = False
+            self.stats.taken += 1
+            return item
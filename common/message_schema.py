@@ -2,69 +2,196 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+NUM_JOINTS = 6  # motor ids 1..NUM_JOINTS; joints[i] is motor id i + 1 (or the arm's i-th motor id)
+MAX_ARM = 255   # arm ids travel as one byte in binary frames
+
+# Laptop pipeline stamps carried in TeleopCommand.trace (laptop monotonic clock, seconds)
+TRACE_STAGES: Tuple[str, ...] = ("capture", "inference", "features", "mapped", "sent")
+TRACE_SENT = TRACE_STAGES.index("sent")
 
 
 @dataclass
 class TeleopCommand:
+    __slots__ = (
+        "seq", "ts", "confidence", "estop", "torque", "joints", "features",
+        # Not dataclass fields (not part of __init__/eq/repr):
+        "arm",        # target arm (index into the Pi's arm list); 0 for single-arm setups
+        "trace",      # Optional[List[float]] in TRACE_STAGES order; "sent" is stamped by the sender
+        "t_rx",       # Pi monotonic time the bytes were received (0 = unknown)
+        "t_decoded",  # Pi monotonic time the command was decoded and published
+    )
+
     seq: int
     ts: float          # sender wall timestamp (seconds)
     confidence: float
     estop: bool
     torque: bool
-    joints: Dict[int, int]  # motor_id -> goal_position ticks
+    joints: List[int]  # goal_position ticks, fixed NUM_JOINTS slots, index = motor_id - 1
     features: Dict[str, float]  # wrist_x, wrist_y, pinch, roll, etc.
 
+    def __post_init__(self) -> None:
+        self.arm = 0
+        self.trace: Optional[List[float]] = None
+        self.t_rx = 0.0
+        self.t_decoded = 0.0
 
-def validate_cmd(msg: Dict[str, Any]) -> Tuple[bool, str]:
-    required = ["type", "seq", "ts", "confidence", "estop", "torque", "joints", "features"]
-    for k in required:
-        if k not in msg:
-            return False, f"Missing key: {k}"
+    def joints_by_id(self, ids: Optional[Sequence[int]] = None) -> Dict[int, int]:
+        """Targets keyed by motor id; `ids` maps slots to an arm's motor ids (default 1..NUM_JOINTS)."""
+        if ids is None:
+            return {i + 1: v for i, v in enumerate(self.joints)}
+        return dict(zip(ids, self.joints))
+
+
+class CommandError(ValueError):
+    """Invalid command message. str(e) starts with the offending field path."""
+
+
+# int()/float() failures on JSON values: wrong type, bad string, or out of range (int(Infinity),
+# float() of a huge integer literal)
+_CONVERT_ERRORS = (TypeError, ValueError, OverflowError)
+
+_REQUIRED = ("type", "seq", "ts", "confidence", "estop", "torque", "joints", "features")
+_REQUIRED_SET = frozenset(_REQUIRED)
+_JOINT_SLOTS: Dict[Any, int] = {str(i + 1): i for i in range(NUM_JOINTS)}
+_JOINT_SLOTS.update({i + 1: i for i in range(NUM_JOINTS)})
+_ALL_JOINTS_SEEN = (1 << NUM_JOINTS) - 1
+
+
+def _joint_slot(k: Any) -> int:
+    slot = _JOINT_SLOTS.get(k)
+    if slot is not None:
+        return slot
+    # Uncommon spellings (" 3", "03", 3.0) — same leniency as int(k)
+    try:
+        mid = int(k)
+    except _CONVERT_ERRORS as e:
+        raise CommandError(f"joints.{k}: invalid motor id: {e}") from None
+    if not (1 <= mid <= NUM_JOINTS):
+        raise CommandError(f"joints.{k}: invalid motor id: {mid}")
+    return mid - 1
+
+
+def decode_cmd(msg: Any) -> TeleopCommand:
+    """
+    Validate a decoded JSON message and build the TeleopCommand in one pass.
+    Every field is converted exactly once. Raises CommandError("<field path>: <reason>").
+    """
+    if type(msg) is not dict:
+        raise CommandError("<root>: message must be an object")
+    if not _REQUIRED_SET.issubset(msg.keys()):
+        missing = next(k for k in _REQUIRED if k not in msg)
+        raise CommandError(f"{missing}: missing key")
     if msg["type"] != "cmd":
-        return False, "type must be 'cmd'"
+        raise CommandError("type: must be 'cmd'")
 
     try:
         seq = int(msg["seq"])
-        if seq < 0:
-            return False, "seq must be >= 0"
-        float(msg["ts"])
+    except _CONVERT_ERRORS as e:
+        raise CommandError(f"seq: {e}") from None
+    if seq < 0:
+        raise CommandError("seq: must be >= 0")
+    try:
+        ts = float(msg["ts"])
+    except _CONVERT_ERRORS as e:
+        raise CommandError(f"ts: {e}") from None
+    try:
         conf = float(msg["confidence"])
-        if not (0.0 <= conf <= 1.0):
-            return False, "confidence must be in [0,1]"
-        bool(msg["estop"])
-        bool(msg["torque"])
-
-        joints = msg["joints"]
-        if not isinstance(joints, dict):
-            return False, "joints must be a dict"
-        for k, v in joints.items():
-            mid = int(k)
-            if mid < 1 or mid > 253:
-                return False, f"Invalid motor id: {mid}"
-            int(v)
-
-        feats = msg["features"]
-        if not isinstance(feats, dict):
-            return False, "features must be a dict"
-        for fk, fv in feats.items():
-            _ = str(fk)
-            float(fv)
-    except Exception as e:
-        return False, f"Type conversion error: {e}"
+    except _CONVERT_ERRORS as e:
+        raise CommandError(f"confidence: {e}") from None
+    if not (0.0 <= conf <= 1.0):
+        raise CommandError("confidence: must be in [0,1]")
 
-    return True, "ok"
+    raw_joints = msg["joints"]
+    if type(raw_joints) is not dict:
+        raise CommandError("joints: must be an object")
+    joints = [0] * NUM_JOINTS
+    seen = 0
+    for k, v in raw_joints.items():
+        slot = _joint_slot(k)
+        try:
+            joints[slot] = int(v)
+        except _CONVERT_ERRORS as e:
+            raise CommandError(f"joints.{k}: {e}") from None
+        seen |= 1 << slot
+    if seen != _ALL_JOINTS_SEEN:
+        missing = next(i + 1 for i in range(NUM_JOINTS) if not (seen >> i) & 1)
+        raise CommandError(f"joints.{missing}: missing")
 
+    raw_feats = msg["features"]
+    if type(raw_feats) is not dict:
+        raise CommandError("features: must be an object")
+    try:
+        feats = {str(fk): float(fv) for fk, fv in raw_feats.items()}
+    except _CONVERT_ERRORS as e:
+        bad = next(fk for fk, fv in raw_feats.items() if not _is_number(fv))
+        raise CommandError(f"features.{bad}: {e}") from None
 
-def to_command(msg: Dict[str, Any]) -> TeleopCommand:
-    joints = {int(k): int(v) for k, v in msg["joints"].items()}
-    feats = {str(k): float(v) for k, v in msg["features"].items()}
-    return TeleopCommand(
-        seq=int(msg["seq"]),
-        ts=float(msg["ts"]),
-        confidence=float(msg["confidence"]),
+    cmd = TeleopCommand(
+        seq=seq,
+        ts=ts,
+        confidence=conf,
         estop=bool(msg["estop"]),
         torque=bool(msg["torque"]),
         joints=joints,
         features=feats,
     )
+    arm = msg.get("arm")
+    if arm is not None:
+        try:
+            cmd.arm = int(arm)
+        except _CONVERT_ERRORS as e:
+            raise CommandError(f"arm: {e}") from None
+        if not (0 <= cmd.arm <= MAX_ARM):
+            raise CommandError(f"arm: must be in [0,{MAX_ARM}]")
+    trace = msg.get("trace")
+    if trace is not None:
+        if type(trace) is not list or len(trace) != len(TRACE_STAGES):
+            raise CommandError(f"trace: must be a list of {len(TRACE_STAGES)} numbers")
+        try:
+            cmd.trace = [float(v) for v in trace]
+        except _CONVERT_ERRORS as e:
+            raise CommandError(f"trace: {e}") from None
+    return cmd
+
+
+def _is_number(v: Any) -> bool:
+    try:
+        float(v)
+        return True
+    except _CONVERT_ERRORS:
+        return False
+
+
+def validate_cmd(msg: Dict[str, Any]) -> Tuple[bool, str]:
+    # Compatibility wrapper: prefer decode_cmd, which also returns the command.
+    try:
+        decode_cmd(msg)
+    except CommandError as e:
+        return False, str(e)
+    return True, "ok"
+
+
+def to_command(msg: Dict[str, Any]) -> TeleopCommand:
+    # Compatibility wrapper around decode_cmd
+    return decode_cmd(msg)
+
+
+def to_msg(cmd: TeleopCommand) -> Dict[str, Any]:
+    # Inverse of decode_cmd: the NDJSON wire form
+    msg = {
+        "type": "cmd",
+        "seq": int(cmd.seq),
+        "ts": float(cmd.ts),
+        "confidence": float(cmd.confidence),
+        "estop": bool(cmd.estop),
+        "torque": bool(cmd.torque),
+        "joints": {str(i + 1): int(v) for i, v in enumerate(cmd.joints)},
+        "features": {k: float(v) for k, v in cmd.features.items()},
+    }
+    if cmd.arm:
+        msg["arm"] = int(cmd.arm)
+    if cmd.trace is not None:
+        msg["trace"] = list(cmd.trace)
+    return msg
@@ -17,3 +17,27 @@ def wall_time_s() -> float:
 def sleep_s(seconds: float) -> None:
     if seconds > 0:
         time.sleep(seconds)
+
+
+class RateTimer:
+    """
+    Fixed-rate pacing on the monotonic clock.
+    Deadlines are absolute (t0 + k * period), so loop body time does not accumulate as drift.
+    If a tick overruns, the schedule is re-based instead of bursting to catch up.
+    """
+
+    def __init__(self, hz: float) -> None:
+        self.period_s = 1.0 / max(1.0, float(hz))
+        self._next = now_s() + self.period_s
+        self.ticks = 0
+        self.overruns = 0
+
+    def sleep(self) -> None:
+        self.ticks += 1
+        delay = self._next - now_s()
+        if delay > 0:
+            time.sleep(delay)
+            self._next += self.period_s
+        else:
+            self.overruns += 1
+            self._next = now_s() + self.period_s
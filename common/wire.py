@@ -0,0 +1,196 @@
+# common/wire.py
+from __future__ import annotations
+
+import struct
+import zlib
+from typing import Dict, Optional, Tuple
+
+from common.message_schema import NUM_JOINTS, TRACE_STAGES, TeleopCommand
+
+# Compact binary framing for TeleopCommand (alternative to NDJSON).
+#
+# Frame layout (little-endian):
+#   header : magic u8 | version u8 | body_len u16
+#   body   : seq u32 | ts f64 | confidence f32 | flags u8 | n_features u8
+#            | joints 6 x i32 (motor ids 1..6) | features n_features x f32
+#            | [v2, if FLAG_TRACE] trace 5 x f64 (laptop monotonic stage stamps, TRACE_STAGES)
+#            | [v3, if FLAG_ARM] arm u8 (target arm on a multi-arm Pi; absent = arm 0)
+#   trailer: crc32 u32 over header + body
+#
+# Features travel in FEATURE_NAMES order, so no keys go on the wire.
+# Version 1 and 2 frames (no trace / arm block) are still accepted.
+#
+# Clock-sync frames (Pi ping -> laptop pong) share the header with SYNC_MAGIC instead:
+#   body   : kind u8 (1 ping, 2 pong) | id u32 | t0 f64 | t1 f64 | t2 f64
+# NDJSON uses {"type": "ping"|"pong", "id", "t0", "t1", "t2"} lines for the same exchange.
+
+FRAME_MAGIC = 0xA5
+SYNC_MAGIC = 0xA6
+SYNC_PING = 1
+SYNC_PONG = 2
+WIRE_VERSION = 3
+_ACCEPTED_VERSIONS = (1, 2, 3)
+
+FLAG_ESTOP = 0x01
+FLAG_TORQUE = 0x02
+FLAG_HOME = 0x04
+FLAG_TRACE = 0x08
+FLAG_ARM = 0x10
+
+FEATURE_NAMES: Tuple[str, ...] = ("wrist_x", "wrist_y", "index_mcp_y", "pinch", "roll", "home")
+
+_HDR = struct.Struct("<BBH")
+_FIXED = struct.Struct(f"<IdfBB{NUM_JOINTS}i")
+_CRC = struct.Struct("<I")
+_FLAGS_OFFSET = _HDR.size + struct.calcsize("<Idf")
+_NFEAT_OFFSET = _FLAGS_OFFSET + 1
+_TRACE = struct.Struct(f"<{len(TRACE_STAGES)}d")
+_ARM = struct.Struct("<B")
+_SYNC = struct.Struct("<BIddd")
+_J0 = 5  # index of the first joint in the unpacked body tuple
+_J1 = _J0 + NUM_JOINTS
+
+HEADER_SIZE = _HDR.size
+MAX_FEATURES = 32
+MAX_FRAME_SIZE = _HDR.size + _FIXED.size + 4 * MAX_FEATURES + _TRACE.size + _ARM.size + _CRC.size
+
+# One precompiled body struct per feature count (normally only len(FEATURE_NAMES) is used)
+_BODY_CACHE: Dict[int, struct.Struct] = {}
+
+
+class WireError(ValueError):
+    pass
+
+
+def _body_struct(n_features: int) -> struct.Struct:
+    st = _BODY_CACHE.get(n_features)
+    if st is None:
+        st = struct.Struct(f"<IdfBB{NUM_JOINTS}i{n_features}f")
+        _BODY_CACHE[n_features] = st
+    return st
+
+
+_FULL_BODY = _body_struct(len(FEATURE_NAMES))
+
+
+def encode_command(cmd: TeleopCommand) -> bytes:
+    feats = cmd.features
+    home = float(feats.get("home", 0.0))
+    flags = (FLAG_ESTOP if cmd.estop else 0) | (FLAG_TORQUE if cmd.torque else 0) | (FLAG_HOME if home >= 0.5 else 0)
+    trace = cmd.trace
+    if trace is not None:
+        flags |= FLAG_TRACE
+    if cmd.arm:
+        flags |= FLAG_ARM
+    try:
+        body = _FULL_BODY.pack(
+            cmd.seq,
+            cmd.ts,
+            cmd.confidence,
+            flags,
+            len(FEATURE_NAMES),
+            *cmd.joints,
+            *[float(feats.get(k, 0.0)) for k in FEATURE_NAMES],
+        )
+        if trace is not None:
+            body += _TRACE.pack(*trace)
+        if cmd.arm:
+            body += _ARM.pack(cmd.arm)
+    except struct.error as e:
+        raise WireError(f"Cannot encode command seq={cmd.seq}: {e}") from e
+    head = _HDR.pack(FRAME_MAGIC, WIRE_VERSION, len(body))
+    return head + body + _CRC.pack(zlib.crc32(body, zlib.crc32(head)))
+
+
+def frame_length(buf, start: int = 0) -> Optional[int]:
+    """
+    Total size of the frame starting at buf[start], or None if the header isn't complete yet.
+    Raises WireError if buf[start] is not a frame header (caller should resync).
+    """
+    if len(buf) - start < HEADER_SIZE:
+        return None
+    magic, version, body_len = _HDR.unpack_from(buf, start)
+    if magic == SYNC_MAGIC:
+        if body_len != _SYNC.size:
+            raise WireError(f"Bad sync body length {body_len}")
+        return HEADER_SIZE + body_len + _CRC.size
+    if magic != FRAME_MAGIC:
+        raise WireError(f"Bad magic 0x{magic:02x}")
+    if version not in _ACCEPTED_VERSIONS:
+        raise WireError(f"Unsupported wire version {version}")
+    total = HEADER_SIZE + body_len + _CRC.size
+    if body_len < _FIXED.size or total > MAX_FRAME_SIZE:
+        raise WireError(f"Bad body length {body_len}")
+    return total
+
+
+def decode_frame(buf, start: int = 0) -> TeleopCommand:
+    """Decode one complete frame at buf[start:]. Raises WireError on any inconsistency."""
+    total = frame_length(buf, start)
+    if total is None or len(buf) - start < total:
+        raise WireError("Truncated frame")
+    end = start + total - _CRC.size
+    (crc,) = _CRC.unpack_from(buf, end)
+    if zlib.crc32(memoryview(buf)[start:end]) != crc:
+        raise WireError("Checksum mismatch")
+
+    n = buf[start + _NFEAT_OFFSET]
+    st = _FULL_BODY if n == len(FEATURE_NAMES) else _body_struct(n)
+    fl = buf[start + _FLAGS_OFFSET]
+    has_trace = bool(fl & FLAG_TRACE)
+    has_arm = bool(fl & FLAG_ARM)
+    if HEADER_SIZE + st.size + (_TRACE.size if has_trace else 0) + (_ARM.size if has_arm else 0) + _CRC.size != total:
+        raise WireError(f"Body length does not match n_features={n}")
+    vals = st.unpack_from(buf, start + HEADER_SIZE)
+
+    seq, ts, conf, flags = vals[0], vals[1], vals[2], vals[3]
+    if not (0.0 <= conf <= 1.0):
+        raise WireError("confidence must be in [0,1]")
+    feats = dict(zip(FEATURE_NAMES, vals[_J1:]))
+    cmd = TeleopCommand(
+        seq=seq,
+        ts=ts,
+        confidence=conf,
+        estop=bool(flags & FLAG_ESTOP),
+        torque=bool(flags & FLAG_TORQUE),
+        joints=list(vals[_J0:_J1]),
+        features=feats,
+    )
+    off = start + HEADER_SIZE + st.size
+    if has_trace:
+        cmd.trace = list(_TRACE.unpack_from(buf, off))
+        off += _TRACE.size
+    if has_arm:
+        cmd.arm = buf[off]
+    return cmd
+
+
+def encode_sync(kind: int, sync_id: int, t0: float, t1: float = 0.0, t2: float = 0.0) -> bytes:
+    body = _SYNC.pack(kind, sync_id & 0xFFFFFFFF, t0, t1, t2)
+    head = _HDR.pack(SYNC_MAGIC, WIRE_VERSION, len(body))
+    return head + body + _CRC.pack(zlib.crc32(body, zlib.crc32(head)))
+
+
+def decode_sync(buf, start: int = 0) -> Tuple[int, int, float, float, float]:
+    """(kind, id, t0, t1, t2) of a complete clock-sync frame. Raises WireError."""
+    total = frame_length(buf, start)
+    if total is None or len(buf) - start < total or buf[start] != SYNC_MAGIC:
+        raise WireError("Not a complete sync frame")
+    end = start + total - _CRC.size
+    (crc,) = _CRC.unpack_from(buf, end)
+    if zlib.crc32(memoryview(buf)[start:end]) != crc:
+        raise WireError("Checksum mismatch")
+    return _SYNC.unpack_from(buf, start + HEADER_SIZE)
+
+
+def sync_msg(kind: int, sync_id: int, t0: float, t1: float = 0.0, t2: float = 0.0) -> Dict[str, object]:
+    # NDJSON form; "type" first so receivers can spot pongs without parsing
+    return {"type": "ping" if kind == SYNC_PING else "pong", "id": sync_id, "t0": t0, "t1": t1, "t2": t2}
+
+
+def hello_msg(framing: str) -> Dict[str, object]:
+    return {"type": "hello", "framing": framing, "version": WIRE_VERSION}
+
+
+def hello_ack_msg(framing: str) -> Dict[str, object]:
+    return {"type": "hello_ack", "framing": framing, "version": WIRE_VERSION}
@@ -3,22 +3,38 @@ from __future__ import annotations
 
 import sys
 import time
+from typing import Optional
 
 import cv2
+import numpy as np
 
 from common.config import load_calibration, load_yaml
-from common.timeutil import wall_time_s, sleep_s
-from laptop.features import FeatureExtractor
+from common.message_schema import TeleopCommand
+from common.timeutil import now_s, wall_time_s, sleep_s
+from laptop.capture import ThreadedCapture
+from laptop.features import FEATURE_COLUMNS, FeatureExtractor
+from laptop.governor import InferenceGovernor, default_levels
 from laptop.hand_tracking import MediaPipeHandTracker
 from laptop.keyboard import KeyboardController
 from laptop.mapping import HandToJointMapper
-from laptop.net_sender import TeleopSender
+from laptop.net_sender import BackgroundSender, make_sender
 
 
 def main() -> int:
     mapping_cfg = load_yaml("config/mapping.yaml")
     net_cfg = load_yaml("config/network.yaml")
-    calib = load_calibration("config/robot_calibration.json")
+    vision_cfg = load_yaml("config/vision.yaml")
+
+    # One entry per driven arm. With a single entry the best-scoring hand drives it, whatever its
+    # label; with more, each stably-labeled hand drives its own arm (same inference for all).
+    hands_y = mapping_cfg.get("hands") or [{"label": "Right", "arm": 0}]
+    labels = [str(h.get("label", "Right")) for h in hands_y]
+    arm_ids = [int(h.get("arm", i)) for i, h in enumerate(hands_y)]
+    calibs = [
+        load_calibration(str(h.get("calibration", "config/robot_calibration.json")), h.get("motor_ids"))
+        for h in hands_y
+    ]
+    n_hands = len(hands_y)
 
     tcp = net_cfg["tcp"]
     host = tcp["pi_host"]
@@ -32,106 +48,188 @@ def main() -> int:
         dz_wrist_xy=fx_cfg["deadzone_wrist_xy"],
         dz_roll=fx_cfg["deadzone_roll"],
         dz_pinch=fx_cfg["deadzone_pinch"],
+        slots=n_hands,
     )
-    mapper = HandToJointMapper(mapping_cfg, calib)
+    mapper = HandToJointMapper(mapping_cfg, calibs)
 
     gate_cfg = mapping_cfg["confidence_gate"]
     min_conf = float(gate_cfg["min_confidence"])
-    hold_last = bool(gate_cfg["hold_last_on_low_conf"])
 
+    trk_cfg = vision_cfg.get("tracker", {})
+    roi_cfg = trk_cfg.get("roi", {})
     tracker = MediaPipeHandTracker(
-        max_num_hands=1,
-        min_detection_confidence=0.6,
-        min_tracking_confidence=0.6,
+        max_num_hands=n_hands,
+        min_detection_confidence=float(trk_cfg.get("min_detection_confidence", 0.6)),
+        min_tracking_confidence=float(trk_cfg.get("min_tracking_confidence", 0.6)),
+        model_complexity=int(trk_cfg.get("model_complexity", 1)),
+        inference_width=int(trk_cfg.get("inference_width", 0)),
+        roi_enabled=bool(roi_cfg.get("enabled", False)),
+        roi_padding=float(roi_cfg.get("padding", 0.35)),
+        roi_min_score=float(roi_cfg.get("min_score", 0.8)),
+        roi_min_size=float(roi_cfg.get("min_size", 0.15)),
+        roi_width=int(roi_cfg.get("inference_width", 256)),
     )
 
-    sender = TeleopSender(host, port)
-    print(f"[laptop] Connecting to Pi {host}:{port} ...")
-    sender.connect()
-    print("[laptop] Connected.")
+    gov_cfg = vision_cfg.get("governor", {})
+    governor: Optional[InferenceGovernor] = None
+    if bool(gov_cfg.get("enabled", False)):
+        governor = InferenceGovernor(
+            default_levels(tracker.model_complexity, tracker.inference_width),
+            budget_ms=float(gov_cfg.get("budget_ms", 25.0)),
+            percentile=float(gov_cfg.get("percentile", 90)),
+            window=int(gov_cfg.get("window", 60)),
+            cooldown_s=float(gov_cfg.get("cooldown_s", 2.0)),
+            upgrade_ratio=float(gov_cfg.get("upgrade_ratio", 0.6)),
+        )
+        print(f"[laptop] Inference governor: budget {governor.budget_ms:.0f} ms, {len(governor.levels)} levels")
+
+    # Headless: no window, no drawing, no frame copies (keyboard controls need the window)
+    pv_cfg = vision_cfg.get("preview", {})
+    show_preview = bool(pv_cfg.get("show", True))
+    draw_landmarks = bool(pv_cfg.get("draw_landmarks", True))
+    if not show_preview:
+        print("[laptop] Headless mode: keyboard controls disabled, Ctrl-C to quit.")
+
+    # Network I/O runs on its own thread: connect/reconnect never blocks the vision loop
+    sender = BackgroundSender(make_sender(net_cfg))
+    print(f"[laptop] Connecting to Pi {host}:{port} (in background) ...")
+    sender.start()
 
     kb = KeyboardController()
 
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
+    cam = ThreadedCapture(int(vision_cfg.get("camera", {}).get("index", 0)))
+    try:
+        cam.start()
+    except RuntimeError:
         print("ERROR: Could not open webcam.")
         return 1
 
     seq = 0
-    last_joints = {i: int((calib[i].range_min + calib[i].range_max) / 2) for i in range(1, 7)}
+    # (hands, 6) joint targets per configured hand; each starts at its arm's range centers
+    last_joints = np.array(
+        [[int((c[m].range_min + c[m].range_max) / 2) for m in sorted(c)] for c in calibs], dtype=np.int64
+    )
+    confidence = np.zeros(n_hands)
     last_send = time.perf_counter()
-
-    while True:
-        ok, frame = cap.read()
-        if not ok:
-            print("WARN: camera read failed")
-            continue
-
-        res = tracker.process(frame)
-        kb.poll()
-
-        if kb.quit:
-            break
-
-        # Build command
-        cmd_joints = last_joints
-        confidence = 0.0
-        features = {
-            "wrist_x": extractor.state.wrist_x,
-            "wrist_y": extractor.state.wrist_y,
-            "index_mcp_y": extractor.state.index_mcp_y,
-            "pinch": extractor.state.pinch,
-            "roll": extractor.state.roll,
-            "home": 1.0 if kb.consume_home_request() else 0.0,
-        }
-
-        if res is not None:
-            confidence = float(res.score)
-            features = extractor.extract(res.landmarks) | {
-                "home": 1.0 if kb.consume_home_request() else 0.0
-            }
-            if confidence >= min_conf:
-                cmd_joints = mapper.map(features)
-                last_joints = cmd_joints
+    last_res = None
+
+    try:
+        while True:
+            captured = cam.read(timeout_s=1.0)
+            if captured is None:
+                print("WARN: no camera frame")
+                continue
+            frame = captured.image
+
+            if governor is None or governor.should_process():
+                t_inf = now_s()
+                res = tracker.process(frame)
+                if governor is not None:
+                    new_level = governor.record((now_s() - t_inf) * 1000.0)
+                    if new_level is not None:
+                        tracker.set_quality(new_level.model_complexity, new_level.inference_width)
+                        print(f"[laptop] governor -> {governor.describe()}")
             else:
-                # Confidence gate behavior
-                if not hold_last:
-                    cmd_joints = last_joints  # keep but you could also freeze-sending if desired
-
-            frame_show = res.image_bgr
-        else:
-            frame_show = frame.copy()
-
-        # HUD
-        hud = f"seq={seq} conf={confidence:.2f} EStop={kb.estop} Torque={kb.torque}"
-        cv2.putText(frame_show, hud, (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
-        cv2.putText(frame_show, "Keys: e=ESTOP  t=TORQUE  h=HOME  q=QUIT",
-                    (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
-
-        # Rate limit sending
-        now = time.perf_counter()
-        if now - last_send >= period:
-            msg = {
-                "type": "cmd",
-                "seq": seq,
-                "ts": wall_time_s(),
-                "confidence": confidence if res is not None else 0.0,
-                "estop": kb.estop,
-                "torque": kb.torque,
-                "joints": {str(k): int(v) for k, v in cmd_joints.items()},
-                "features": {k: float(v) for k, v in features.items()},
-            }
-            try:
-                sender.send_json_line(msg)
-            except Exception as e:
-                cv2.putText(frame_show, f"NET ERROR: {e}", (10, 120),
+                res = last_res  # skipped frame: landmarks from the last inference are still current
+            t_inf_done = now_s()
+            last_res = res
+            if show_preview:
+                kb.poll()
+
+            if kb.quit:
+                break
+
+            # Features and joints for every visible hand in one batch; a hand that is missing
+            # or below the confidence gate keeps its last joints (the Pi gates on confidence too)
+            home = 1.0 if kb.consume_home_request() else 0.0
+            confidence[:] = 0.0
+            t_feat_done = t_map_done = t_inf_done
+            if res is not None:
+                if n_hands == 1:
+                    # One hand: scalar path, cheaper than a batch of one
+                    i = int(np.argmax(res.scores))
+                    feats = extractor.extract(res.landmarks[i])
+                    t_feat_done = t_map_done = now_s()
+                    confidence[0] = res.scores[i]
+                    if confidence[0] >= min_conf:
+                        last_joints[0] = list(mapper.map(feats).values())
+                        t_map_done = now_s()
+                else:
+                    found = [(res.index(lab), s) for s, lab in enumerate(labels)]
+                    pick = [i for i, _ in found if i is not None]
+                    slots = [s for i, s in found if i is not None]
+                    if pick:
+                        sl = np.array(slots, dtype=np.intp)
+                        # Every hand visible: slots are 0..H-1, no gather/scatter of state needed
+                        full = len(pick) == n_hands
+                        feats = extractor.extract_batch(res.landmarks[pick], None if full else sl)
+                        t_feat_done = t_map_done = now_s()
+                        confidence[sl] = res.scores[pick]
+                        ok = confidence[sl] >= min_conf
+                        if ok.all():
+                            last_joints[sl] = mapper.map_batch(feats, None if full else sl)
+                            t_map_done = now_s()
+                        elif ok.any():
+                            last_joints[sl[ok]] = mapper.map_batch(feats[ok], sl[ok])
+                            t_map_done = now_s()
+
+            # Rate limit sending
+            now = time.perf_counter()
+            if now - last_send >= period:
+                # One command per arm, all from this frame; seq runs across the whole stream
+                cmds = []
+                for s in range(n_hands):
+                    cmd = TeleopCommand(
+                        seq=seq,
+                        ts=wall_time_s(),
+                        confidence=float(confidence[s]),
+                        estop=kb.estop,
+                        torque=kb.torque,
+                        joints=last_joints[s].tolist(),
+                        features=dict(zip(FEATURE_COLUMNS, extractor.states[s].tolist())) | {"home": home},
+                    )
+                    cmd.arm = arm_ids[s]
+                    # Stage stamps for the Pi's latency breakdown; "sent" is filled in by the sender
+                    cmd.trace = [captured.t_capture, t_inf_done, t_feat_done, t_map_done, 0.0]
+                    cmds.append(cmd)
+                    seq += 1
+                sender.submit(*cmds)
+                last_send = now
+
+            if not show_preview:
+                continue
+
+            # Preview: draw straight onto the captured frame (it's ours, no copy needed)
+            if res is not None and draw_landmarks:
+                tracker.draw(frame, res)
+
+            # HUD
+            age_ms = (now_s() - captured.t_capture) * 1000.0
+            conf_s = " ".join(f"{lab}={c:.2f}" for lab, c in zip(labels, confidence.tolist()))
+            hud = (f"seq={seq} conf {conf_s} EStop={kb.estop} Torque={kb.torque} "
+                   f"age={age_ms:.0f}ms drop={cam.stats.dropped}")
+            cv2.putText(frame, hud, (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
+            cv2.putText(frame, "Keys: e=ESTOP  t=TORQUE  h=HOME  q=QUIT",
+                        (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
+            cv2.putText(frame, f"infer[{tracker.stats.last_mode}] {tracker.stats.summary()}",
+                        (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 1)
+            if governor is not None:
+                cv2.putText(frame, f"governor {governor.describe()}",
+                            (10, 170), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 1)
+            if not sender.connected:
+                cv2.putText(frame, f"NET ERROR: {sender.last_error or 'connecting'}", (10, 120),
                             cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
-            seq += 1
-            last_send = now
+            else:
+                ss = sender.stats
+                cv2.putText(frame, f"net send={ss.avg_send_ms:.2f}ms max={ss.max_send_ms:.1f}ms "
+                                   f"overwritten={ss.overwritten} reconnects={ss.reconnects}",
+                            (10, 120), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 1)
 
-        cv2.imshow("SO101 Vision Teleop (Laptop)", frame_show)
+            cv2.imshow("SO101 Vision Teleop (Laptop)", frame)
+    except KeyboardInterrupt:
+        print("[laptop] Interrupted.")
 
-    cap.release()
+    cam.stop()
     sender.close()
     cv2.destroyAllWindows()
     return 0
@@ -0,0 +1,84 @@
+# laptop/capture.py
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from common.mailbox import LatestMailbox
+from common.timeutil import now_s
+
+
+@dataclass
+class Frame:
+    image: np.ndarray  # BGR, owned by the consumer once taken
+    t_capture: float   # monotonic time right after the driver returned the frame
+    index: int
+
+
+@dataclass
+class CaptureStats:
+    captured: int = 0
+    delivered: int = 0
+    dropped: int = 0        # frames replaced by a newer one before the main loop took them
+    read_failures: int = 0
+
+
+class ThreadedCapture:
+    """
+    Camera reader on its own thread. Only the newest frame is kept, so the vision loop
+    always works on the freshest image instead of draining the driver's queue.
+    """
+
+    def __init__(self, source: int = 0) -> None:
+        self.source = source
+        self._cap: Optional[cv2.VideoCapture] = None
+        self._slot: LatestMailbox[Frame] = LatestMailbox()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = CaptureStats()
+
+    def start(self) -> None:
+        cap = cv2.VideoCapture(self.source)
+        if not cap.isOpened():
+            raise RuntimeError(f"Could not open camera {self.source}")
+        # Ask the driver not to queue frames either (ignored by some backends)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self._cap = cap
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="camera", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        cap = self._cap
+        idx = 0
+        while not self._stop.is_set():
+            ok, img = cap.read()
+            t = now_s()
+            if not ok:
+                self.stats.read_failures += 1
+                self._stop.wait(0.01)
+                continue
+            self.stats.captured += 1
+            if self._slot.publish(Frame(image=img, t_capture=t, index=idx)):
+                self.stats.dropped += 1
+            idx += 1
+
+    def read(self, timeout_s: float = 1.0) -> Optional[Frame]:
+        """Newest frame not yet returned, waiting up to timeout_s. None on timeout."""
+        fr = self._slot.take(timeout_s)
+        if fr is not None:
+            self.stats.delivered += 1
+        return fr
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
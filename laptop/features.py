@@ -1,6 +1,7 @@
 # laptop/features.py
 from __future__ import annotations
 
+import math
 from dataclasses import dataclass
 from typing import Dict, Optional
 
@@ -27,6 +28,12 @@ class FeatureState:
     roll: float = 0.5
 
 
+# Column order of extract_batch() output (and of per-hand state rows)
+FEATURE_COLUMNS = ("wrist_x", "wrist_y", "index_mcp_y", "pinch", "roll")
+_NEUTRAL = (0.5, 0.5, 0.5, 0.3, 0.5)
+_POINTS = [0, 5, 4, 8, 17]  # landmarks the features use
+
+
 class FeatureExtractor:
     """
     v1 features from 2D landmarks (normalized):
@@ -34,53 +41,122 @@ class FeatureExtractor:
     2) index_mcp_y (landmark 5) helps with wrist pitch mapping
     3) pinch distance between thumb tip (4) and index tip (8)
     4) roll proxy using relative x of index_mcp (5) vs pinky_mcp (17)
+
+    extract_batch() does this for every tracked hand at once on an (H,21,3) array, as whole-array
+    NumPy ops into preallocated buffers (no per-hand Python loop); extract() is the single-hand
+    form. Each hand has its own smoothing state, selected by slot (one slot per configured hand,
+    so a hand keeps its filter state when the other one drops out).
     """
 
-    def __init__(self, ema_alpha: float, dz_wrist_xy: float, dz_roll: float, dz_pinch: float) -> None:
+    def __init__(self, ema_alpha: float, dz_wrist_xy: float, dz_roll: float, dz_pinch: float, slots: int = 1) -> None:
         self.alpha = float(ema_alpha)
         self.dz_wrist_xy = float(dz_wrist_xy)
         self.dz_roll = float(dz_roll)
         self.dz_pinch = float(dz_pinch)
-        self.state = FeatureState()
+        # (slots, 5) smoothed features in FEATURE_COLUMNS order
+        self.states = np.tile(np.array(_NEUTRAL, dtype=np.float64), (max(1, int(slots)), 1))
+        self._dz = np.array([self.dz_wrist_xy] * 3 + [self.dz_pinch, self.dz_roll])
+        self._center = np.array(_NEUTRAL)
+        # (pinch, roll) raw -> [0..1]: (x - off) * scale
+        self._off = np.array([0.02, -0.25])
+        self._scale = np.array([1.0 / 0.23, 2.0])
+        # Weights over flattened landmarks (index i*3 + axis) for extract_batch(); columns:
+        # wrist x, wrist y, index mcp y, thumb-index tip dx, index-pinky mcp dx, thumb-index tip dy
+        terms = [((0, 0),), ((0, 1),), ((5, 1),), ((4, 0), (8, 0)), ((5, 0), (17, 0)), ((4, 1), (8, 1))]
+        self._pick = np.zeros((21 * 3, len(terms)))
+        for col, pts in enumerate(terms):
+            for k, (i, axis) in enumerate(pts):
+                self._pick[i * 3 + axis, col] = -1.0 if k else 1.0
+        self._bufs: Dict[int, tuple] = {}
+
+    @property
+    def state(self) -> FeatureState:
+        """Smoothed features of slot 0 (single-hand view)."""
+        return self.state_of(0)
+
+    def state_of(self, slot: int) -> FeatureState:
+        return FeatureState(*(float(v) for v in self.states[slot]))
+
+    def _buffers(self, h: int) -> tuple:
+        b = self._bufs.get(h)
+        if b is None:
+            n = len(FEATURE_COLUMNS)
+            b = (
+                np.empty((h, n + 1)),           # raw features + thumb-index dy
+                np.tile(self._center, (h, 1)),  # deadzone centers (pinch column set per call)
+                np.empty((h, n)),               # |raw - center|
+                np.empty((h, n), dtype=bool),   # inside the deadzone
+                np.empty((h, n)),               # smoothed (gathered slots)
+            )
+            self._bufs[h] = b
+        return b
+
+    def extract_batch(self, landmarks: np.ndarray, slots: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        landmarks: (H,21,3), x/y normalized; slots: (H,) state slot of each hand (None = 0..H-1).
+        Returns the smoothed features, (H,5) in FEATURE_COLUMNS order. The array is owned by the
+        extractor (preallocated per H, nothing allocated per call) and overwritten by the next call.
+        """
+        h = landmarks.shape[0]
+        y, center, dev, dead, gathered = self._buffers(h)
+        # One product picks wrist x/y and index mcp y, and forms thumb-index dx, index-pinky
+        # mcp dx (roll proxy) and thumb-index dy (last column)
+        np.matmul(landmarks.reshape(h, -1), self._pick, out=y)
+        raw = y[:, :-1]
+        np.hypot(y[:, 3], y[:, 5], out=raw[:, 3])
+        # (pinch, roll) -> [0..1]: pinch typical range ~0.02..0.25, roll centered on 0.5
+        pr = raw[:, 3:]
+        pr -= self._off
+        pr *= self._scale
+        np.minimum(pr, 1.0, out=pr)
+        np.maximum(pr, 0.0, out=pr)
+
+        if slots is None:
+            prev = self.states[:h]      # view: smoothed in place
+        else:
+            prev = gathered
+            np.take(self.states, slots, axis=0, out=prev)
+
+        # Deadzones around neutral; pinch around its own smoothed value (reduces micro jitter)
+        center[:, 3] = prev[:, 3]
+        np.subtract(raw, center, out=dev)
+        np.abs(dev, out=dev)
+        np.less(dev, self._dz, out=dead)
+        np.copyto(raw, center, where=dead)
 
-    def extract(self, landmarks: np.ndarray) -> Dict[str, float]:
-        # landmarks: (21,3), x/y normalized
-        wrist = landmarks[0]
-        index_mcp = landmarks[5]
-        thumb_tip = landmarks[4]
-        index_tip = landmarks[8]
-        pinky_mcp = landmarks[17]
-
-        wrist_x = float(wrist[0])
-        wrist_y = float(wrist[1])
-        index_mcp_y = float(index_mcp[1])
+        # EMA smoothing
+        prev *= self.alpha
+        raw *= 1.0 - self.alpha
+        prev += raw
+        if slots is not None:
+            self.states[slots] = prev
+        return prev
+
+    def extract(self, landmarks: np.ndarray, slot: int = 0) -> Dict[str, float]:
+        """One hand, (21,3) x/y normalized: plain float math, cheaper than a batch of one."""
+        (wx, wy), (ix, iy), (tx, ty), (jx, jy), (px, _) = landmarks[_POINTS, :2].tolist()
+        s_wx, s_wy, s_iy, s_pinch, s_roll = self.states[slot].tolist()
 
-        pinch = float(np.linalg.norm((thumb_tip[:2] - index_tip[:2])))
         # normalize pinch somewhat (typical range ~0.02..0.25). clamp to [0..1]
-        pinch_n = float(np.clip((pinch - 0.02) / 0.23, 0.0, 1.0))
-
+        pinch_n = min(1.0, max(0.0, (math.hypot(tx - jx, ty - jy) - 0.02) / 0.23))
         # roll proxy: compare knuckle x positions. Map to [0..1]
-        roll_raw = float(np.clip((index_mcp[0] - pinky_mcp[0]) * 2.0 + 0.5, 0.0, 1.0))
+        roll_raw = min(1.0, max(0.0, (ix - px) * 2.0 + 0.5))
 
         # Deadzones around neutral
-        wrist_x = _deadzone(wrist_x, self.dz_wrist_xy, center=0.5)
-        wrist_y = _deadzone(wrist_y, self.dz_wrist_xy, center=0.5)
-        index_mcp_y = _deadzone(index_mcp_y, self.dz_wrist_xy, center=0.5)
+        wx = _deadzone(wx, self.dz_wrist_xy, center=0.5)
+        wy = _deadzone(wy, self.dz_wrist_xy, center=0.5)
+        iy = _deadzone(iy, self.dz_wrist_xy, center=0.5)
         roll_raw = _deadzone(roll_raw, self.dz_roll, center=0.5)
-        pinch_n = _deadzone(pinch_n, self.dz_pinch, center=self.state.pinch)  # reduce micro jitter
+        pinch_n = _deadzone(pinch_n, self.dz_pinch, center=s_pinch)  # reduce micro jitter
 
         # EMA smoothing
-        s = self.state
-        s.wrist_x = _ema(s.wrist_x, wrist_x, self.alpha)
-        s.wrist_y = _ema(s.wrist_y, wrist_y, self.alpha)
-        s.index_mcp_y = _ema(s.index_mcp_y, index_mcp_y, self.alpha)
-        s.pinch = _ema(s.pinch, pinch_n, self.alpha)
-        s.roll = _ema(s.roll, roll_raw, self.alpha)
-
-        return {
-            "wrist_x": s.wrist_x,
-            "wrist_y": s.wrist_y,
-            "index_mcp_y": s.index_mcp_y,
-            "pinch": s.pinch,
-            "roll": s.roll,
-        }
+        a = self.alpha
+        row = (
+            _ema(s_wx, wx, a),
+            _ema(s_wy, wy, a),
+            _ema(s_iy, iy, a),
+            _ema(s_pinch, pinch_n, a),
+            _ema(s_roll, roll_raw, a),
+        )
+        self.states[slot] = row
+        return dict(zip(FEATURE_COLUMNS, row))
@@ -0,0 +1,102 @@
+# laptop/governor.py
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass
+from typing import List, Optional
+
+from common.timeutil import now_s
+
+
+@dataclass(frozen=True)
+class QualityLevel:
+    model_complexity: int  # MediaPipe Hands model_complexity (0 = lite, 1 = full)
+    inference_width: int   # frames wider than this are downscaled (0 = native)
+    frame_skip: int        # run inference on 1 of every (frame_skip + 1) frames
+
+    def describe(self) -> str:
+        return f"mc={self.model_complexity} w={self.inference_width or 'native'} skip={self.frame_skip}"
+
+
+def default_levels(model_complexity: int, inference_width: int) -> List[QualityLevel]:
+    """Best quality first; each step is cheaper than the one before."""
+    w = inference_width or 640
+    levels = [QualityLevel(model_complexity, inference_width, 0)]
+    if model_complexity > 0:
+        levels.append(QualityLevel(0, inference_width, 0))
+    for width in (480, 320):
+        if width < w:
+            levels.append(QualityLevel(0, width, 0))
+    last_w = levels[-1].inference_width
+    levels.append(QualityLevel(0, last_w, 1))
+    levels.append(QualityLevel(0, last_w, 2))
+    return levels
+
+
+class InferenceGovernor:
+    """
+    Keeps per-frame inference time inside a budget.
+    Tracks a rolling percentile of measured inference time; steps down one quality level when
+    it exceeds budget_ms and back up when it stays below upgrade_ratio * budget_ms.
+    A cooldown after each change lets the new level fill the window before the next decision.
+    """
+
+    def __init__(
+        self,
+        levels: List[QualityLevel],
+        budget_ms: float = 25.0,
+        percentile: float = 90.0,
+        window: int = 60,
+        cooldown_s: float = 2.0,
+        upgrade_ratio: float = 0.6,
+    ) -> None:
+        if not levels:
+            raise ValueError("governor needs at least one quality level")
+        self.levels = list(levels)
+        self.budget_ms = float(budget_ms)
+        self.percentile = float(percentile)
+        self.cooldown_s = float(cooldown_s)
+        self.upgrade_ratio = float(upgrade_ratio)
+        self.index = 0
+        self.last_pct_ms = 0.0
+        self.changes = 0
+        self._samples: deque = deque(maxlen=max(4, int(window)))
+        self._last_change = now_s()
+        self._frame = 0
+
+    @property
+    def level(self) -> QualityLevel:
+        return self.levels[self.index]
+
+    def should_process(self) -> bool:
+        """Call once per captured frame; False means reuse the previous result (frame skipping)."""
+        self._frame += 1
+        return self._frame % (self.level.frame_skip + 1) == 0
+
+    def record(self, infer_ms: float) -> Optional[QualityLevel]:
+        """
+        Add one inference time sample. With frame skipping the cost is amortized over the
+        skipped frames. Returns the new level if the governor changed it.
+        """
+        self._samples.append(float(infer_ms) / (self.level.frame_skip + 1))
+        if len(self._samples) < self._samples.maxlen or now_s() - self._last_change < self.cooldown_s:
+            return None
+
+        s = sorted(self._samples)
+        self.last_pct_ms = s[min(len(s) - 1, int(len(s) * self.percentile / 100.0))]
+
+        if self.last_pct_ms > self.budget_ms and self.index < len(self.levels) - 1:
+            self.index += 1
+        elif self.last_pct_ms < self.budget_ms * self.upgrade_ratio and self.index > 0:
+            self.index -= 1
+        else:
+            return None
+
+        self.changes += 1
+        self._samples.clear()
+        self._last_change = now_s()
+        return self.level
+
+    def describe(self) -> str:
+        return (f"L{self.index} {self.level.describe()} "
+                f"p{self.percentile:.0f}={self.last_pct_ms:.1f}/{self.budget_ms:.0f}ms")
@@ -1,75 +1,290 @@
 # laptop/hand_tracking.py
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Optional, Tuple
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
 
 import cv2
 import mediapipe as mp
 import numpy as np
 
+from common.timeutil import now_s
+
+NUM_LANDMARKS = 21
+
 
 @dataclass
-class HandResult:
-    # Normalized landmarks: (21, 3) in [0..1] for x/y, z is relative
+class HandsResult:
+    # Normalized landmarks of every detected hand: (H, 21, 3), x/y in [0..1] of the FULL frame,
+    # z relative. A view of a tracker-owned buffer, overwritten by the next process() call.
     landmarks: np.ndarray
-    handedness: str
-    score: float
-    image_bgr: np.ndarray  # annotated frame
+    handedness: List[str]   # per hand, stabilized over time (HandednessFilter)
+    scores: np.ndarray      # (H,) classifier confidence per hand
+
+    @property
+    def count(self) -> int:
+        return len(self.handedness)
+
+    @property
+    def score(self) -> float:
+        """Confidence of the weakest hand (gates the ROI and single-hand checks)."""
+        return float(self.scores.min())
+
+    def index(self, label: str) -> Optional[int]:
+        return self.handedness.index(label) if label in self.handedness else None
+
+
+class HandednessFilter:
+    """
+    MediaPipe classifies handedness per frame, and the label flips now and then (hands crossing,
+    partial views, a low-confidence first frame). Labels here follow the hand instead: each
+    frame's hands are matched to the wrist positions last seen under each label (the cheaper of
+    the two assignments for two hands, nearest within max_jump for one), and the classifier only
+    decides for hands that match nothing -- a new hand, or one unseen for more than hold_frames.
+    """
+
+    LABELS = ("Left", "Right")
+
+    def __init__(self, max_jump: float = 0.25, hold_frames: int = 15) -> None:
+        self.max_jump = float(max_jump)
+        self.hold_frames = int(hold_frames)
+        self._last: Dict[str, Tuple[np.ndarray, int]] = {}  # label -> (wrist xy, frame seen)
+        self._frame = 0
+        self.swaps = 0  # classifier labels overridden by tracking
+
+    def reset(self) -> None:
+        self._last.clear()
+
+    def assign(self, wrists: np.ndarray, labels: List[str]) -> List[str]:
+        self._frame += 1
+        known = {k: xy for k, (xy, f) in self._last.items() if self._frame - f <= self.hold_frames}
+        out: List[str] = [""] * len(labels)  # "" = not matched yet
+        if len(labels) == 2 and len(known) == 2:
+            a, b = self.LABELS
+            keep = np.hypot(*(wrists[0] - known[a])) + np.hypot(*(wrists[1] - known[b]))
+            swap = np.hypot(*(wrists[0] - known[b])) + np.hypot(*(wrists[1] - known[a]))
+            out = [a, b] if keep <= swap else [b, a]
+        elif known:
+            for i, xy in enumerate(wrists):
+                near = min(known, key=lambda k: np.hypot(*(xy - known[k])))
+                if np.hypot(*(xy - known[near])) <= self.max_jump and near not in out:
+                    out[i] = near
+        # Unmatched: the classifier's label if still free, else the other one
+        for i, lab in enumerate(out):
+            if not lab:
+                free = [k for k in self.LABELS if k not in out]
+                out[i] = labels[i] if labels[i] in free else free[0]
+        for i, lab in enumerate(out):
+            if lab != labels[i]:
+                self.swaps += 1
+            self._last[lab] = (wrists[i].copy(), self._frame)
+        return out
+
+    def miss(self) -> None:
+        """A frame without hands: ages the remembered positions."""
+        self._frame += 1
+
+
+@dataclass
+class ModeTiming:
+    count: int = 0
+    total_ms: float = 0.0
+    last_ms: float = 0.0
+
+    @property
+    def mean_ms(self) -> float:
+        return self.total_ms / self.count if self.count else 0.0
+
+
+@dataclass
+class TrackerStats:
+    modes: Dict[str, ModeTiming] = field(default_factory=lambda: {"full": ModeTiming(), "roi": ModeTiming()})
+    roi_fallbacks: int = 0  # ROI inference lost the hand, redone on the full frame
+    last_mode: str = "full"
+
+    def summary(self) -> str:
+        return " ".join(
+            f"{k}={v.mean_ms:.1f}ms/{v.count}" for k, v in self.modes.items()
+        ) + f" fallbacks={self.roi_fallbacks}"
 
 
 class MediaPipeHandTracker:
+    """
+    MediaPipe Hands with two cost controls:
+    - inference_width: frames (or crops) wider than this are downscaled before inference.
+      Normalized landmarks don't depend on the input scale, so nothing needs remapping.
+    - ROI mode: while tracking is confident, only a padded box around the previous frame's
+      hand is processed; landmarks are mapped back to full-frame coordinates.
+      If the hand is lost in the crop, the same frame is re-run on the full image.
+    """
+
     def __init__(
         self,
         max_num_hands: int = 1,
         min_detection_confidence: float = 0.6,
         min_tracking_confidence: float = 0.6,
+        model_complexity: int = 1,
+        inference_width: int = 0,
+        roi_enabled: bool = False,
+        roi_padding: float = 0.35,
+        roi_min_score: float = 0.8,
+        roi_min_size: float = 0.15,
+        roi_width: int = 256,
     ) -> None:
         self._mp_hands = mp.solutions.hands
-        self._mp_draw = mp.solutions.drawing_utils
-        self._mp_styles = mp.solutions.drawing_styles
-
-        self._hands = self._mp_hands.Hands(
+        self._hands_args = dict(
             static_image_mode=False,
             max_num_hands=max_num_hands,
             min_detection_confidence=min_detection_confidence,
             min_tracking_confidence=min_tracking_confidence,
-            model_complexity=1,
+            model_complexity=int(model_complexity),
         )
+        self._hands = self._mp_hands.Hands(**self._hands_args)
+        # Separate graph for crops: its internal tracking state stays in crop coordinates
+        self._hands_roi = self._mp_hands.Hands(**self._hands_args) if roi_enabled else None
+
+        self.inference_width = int(inference_width)
+        self.roi_enabled = bool(roi_enabled)
+        self.roi_padding = float(roi_padding)
+        self.roi_min_score = float(roi_min_score)
+        self.roi_min_size = float(roi_min_size)
+        self.roi_width = int(roi_width)
+        self._roi: Optional[Tuple[int, int, int, int]] = None  # x0, y0, x1, y1 in pixels
 
-    def process(self, frame_bgr: np.ndarray) -> Optional[HandResult]:
-        frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
-        res = self._hands.process(frame_rgb)
+        # Reused output buffer for all hands (no per-frame landmark allocation besides the fromiter temp)
+        self.max_num_hands = max(1, int(max_num_hands))
+        self._lms = np.zeros((self.max_num_hands, NUM_LANDMARKS, 3), dtype=np.float32)
+        self._lms_flat = self._lms.reshape(-1)
+        self._roi_hands = 0  # hands inside the current ROI; the crop must find all of them
+        self.handedness = HandednessFilter()
+        self.stats = TrackerStats()
+
+    def process(self, frame_bgr: np.ndarray) -> Optional[HandsResult]:
+        """Landmarks of every hand (one inference for all of them): no copy of the frame, no drawing."""
+        h, w = frame_bgr.shape[:2]
+        out = None
+        if self._roi is not None:
+            t0 = now_s()
+            x0, y0, x1, y1 = self._roi
+            crop = (x0, y0, x1 - x0, y1 - y0, w, h)
+            out = self._infer(self._hands_roi, frame_bgr[y0:y1, x0:x1], self.roi_width, crop)
+            self._record("roi", t0)
+            if out is None or out.count < self._roi_hands:
+                out = None
+                self.stats.roi_fallbacks += 1
+
+        if out is None:
+            t0 = now_s()
+            out = self._infer(self._hands, frame_bgr, self.inference_width, None)
+            self._record("full", t0)
+
+        self._roi = self._next_roi(out, w, h) if self.roi_enabled else None
+        self._roi_hands = out.count if self._roi is not None else 0
+        if out is None:
+            self.handedness.miss()
+            return None
+        out.handedness = self.handedness.assign(out.landmarks[:, 0, :2], out.handedness)
+        return out
 
-        annotated = frame_bgr.copy()
+    def set_quality(self, model_complexity: int, inference_width: int) -> None:
+        """Runtime quality change (used by the inference governor). Rebuilding the graph is slow, so only on change."""
+        self.inference_width = int(inference_width)
+        if int(model_complexity) == self._hands_args["model_complexity"]:
+            return
+        self._hands_args["model_complexity"] = int(model_complexity)
+        self._hands.close()
+        self._hands = self._mp_hands.Hands(**self._hands_args)
+        if self._hands_roi is not None:
+            self._hands_roi.close()
+            self._hands_roi = self._mp_hands.Hands(**self._hands_args)
+        self._roi = None
+
+    @property
+    def model_complexity(self) -> int:
+        return int(self._hands_args["model_complexity"])
+
+    def _record(self, mode: str, t0: float) -> None:
+        m = self.stats.modes[mode]
+        m.last_ms = (now_s() - t0) * 1000.0
+        m.total_ms += m.last_ms
+        m.count += 1
+        self.stats.last_mode = mode
+
+    def _infer(self, hands: Any, img_bgr: np.ndarray, max_width: int, crop) -> Optional[HandsResult]:
+        ih, iw = img_bgr.shape[:2]
+        if 0 < max_width < iw:
+            img_bgr = cv2.resize(img_bgr, (max_width, max(1, int(ih * max_width / iw))), interpolation=cv2.INTER_AREA)
+        res = hands.process(cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB))
 
         if not res.multi_hand_landmarks or not res.multi_handedness:
             return None
 
-        # Choose first hand
-        hand_lms = res.multi_hand_landmarks[0]
-        handness = res.multi_handedness[0].classification[0].label
-        score = float(res.multi_handedness[0].classification[0].score)
-
-        self._mp_draw.draw_landmarks(
-            annotated,
-            hand_lms,
-            self._mp_hands.HAND_CONNECTIONS,
-            self._mp_styles.get_default_hand_landmarks_style(),
-            self._mp_styles.get_default_hand_connections_style(),
+        # All hands into one (H, 21, 3) block
+        hands_lms = res.multi_hand_landmarks[:self.max_num_hands]
+        n = len(hands_lms)
+        cls = [c.classification[0] for c in res.multi_handedness[:n]]
+        self._lms_flat[:n * NUM_LANDMARKS * 3] = np.fromiter(
+            (v for hl in hands_lms for lm in hl.landmark for v in (lm.x, lm.y, lm.z)),
+            dtype=np.float32,
+            count=n * NUM_LANDMARKS * 3,
+        )
+        lms = self._lms[:n]
+        if crop is not None:
+            # crop-normalized -> full-frame-normalized (z scales with width like x)
+            cx, cy, cw, ch, fw, fh = crop
+            lms[..., 0] *= cw / fw
+            lms[..., 0] += cx / fw
+            lms[..., 1] *= ch / fh
+            lms[..., 1] += cy / fh
+            lms[..., 2] *= cw / fw
+        return HandsResult(
+            landmarks=lms,
+            handedness=[c.label for c in cls],
+            scores=np.array([c.score for c in cls], dtype=np.float32),
         )
 
-        lms = np.array([[lm.x, lm.y, lm.z] for lm in hand_lms.landmark], dtype=np.float32)
+    def _next_roi(self, res: Optional[HandsResult], w: int, h: int) -> Optional[Tuple[int, int, int, int]]:
+        if res is None or res.score < self.roi_min_score:
+            return None
+        # One box around all hands (with two hands far apart this is close to the full frame)
+        xy = res.landmarks[:, :, :2].reshape(-1, 2)
+        lo = xy.min(axis=0)
+        hi = xy.max(axis=0)
+        # Square box in pixels around the hand, padded, at least roi_min_size of the frame height
+        cx = (lo[0] + hi[0]) * 0.5 * w
+        cy = (lo[1] + hi[1]) * 0.5 * h
+        side = max((hi[0] - lo[0]) * w, (hi[1] - lo[1]) * h) * (1.0 + 2.0 * self.roi_padding)
+        side = max(side, self.roi_min_size * h)
+        x0 = int(max(0, cx - side / 2))
+        y0 = int(max(0, cy - side / 2))
+        x1 = int(min(w, cx + side / 2))
+        y1 = int(min(h, cy + side / 2))
+        if x1 - x0 < 16 or y1 - y0 < 16:
+            return None
+        return x0, y0, x1, y1
+
+    def draw(self, frame_bgr: np.ndarray, res: HandsResult) -> None:
+        """Draw landmarks + labels onto frame_bgr in place. Only call when a preview is shown."""
+        h, w = frame_bgr.shape[:2]
+        for k, hand in enumerate((res.landmarks[..., :2] * (w, h)).astype(np.int32).tolist()):
+            pts = [tuple(p) for p in hand]
+            for a, b in self._mp_hands.HAND_CONNECTIONS:
+                cv2.line(frame_bgr, pts[a], pts[b], (255, 255, 255), 2)
+            for p in pts:
+                cv2.circle(frame_bgr, p, 3, (0, 0, 255), -1)
+            cv2.putText(frame_bgr, res.handedness[k], (pts[0][0] + 8, pts[0][1] + 20),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+        if self._roi is not None:
+            x0, y0, x1, y1 = self._roi
+            cv2.rectangle(frame_bgr, (x0, y0), (x1, y1), (255, 128, 0), 1)
 
         # HUD
         cv2.putText(
-            annotated,
-            f"{handness} score={score:.2f}",
+            frame_bgr,
+            " ".join(f"{lab}={sc:.2f}" for lab, sc in zip(res.handedness, res.scores.tolist())),
             (10, 30),
             cv2.FONT_HERSHEY_SIMPLEX,
             0.8,
             (0, 255, 0),
             2,
         )
-
-        return HandResult(landmarks=lms, handedness=handness, score=score, image_bgr=annotated)
@@ -2,9 +2,12 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Dict
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
 
 from common.config import JointCalib
+from laptop.features import FEATURE_COLUMNS
 
 
 @dataclass
@@ -16,8 +19,19 @@ class MapRule:
 
 
 class HandToJointMapper:
-    def __init__(self, mapping_cfg: Dict, calib: Dict[int, JointCalib]) -> None:
-        self.calib = calib
+    """
+    Features -> joint ticks, per the rules in config/mapping.yaml.
+    `calib` is one arm's calibration, or a list of them (one per arm driven from this laptop):
+    map() serves the first arm; map_batch() maps every hand onto its own arm in one pass.
+    Joint slot i of an arm is its i-th motor id in ascending order.
+    """
+
+    def __init__(
+        self, mapping_cfg: Dict, calib: Union[Dict[int, JointCalib], Sequence[Dict[int, JointCalib]]]
+    ) -> None:
+        calibs: List[Dict[int, JointCalib]] = [calib] if isinstance(calib, dict) else list(calib)
+        self.calibs = calibs
+        self.calib = calibs[0]
         self.margin = int(mapping_cfg.get("soft_limit_margin_ticks", 0))
 
         m = mapping_cfg["mapping"]
@@ -30,6 +44,30 @@ class HandToJointMapper:
             6: MapRule(**m["joint_6_gripper"]),
         }
 
+        # Joint slot k: rule k (by rule id) drives the first arm's k-th motor id, for map()
+        rules = [self.rules[mid] for mid in sorted(self.rules)]
+        self._slot_rules = list(zip(sorted(self.calib), rules))
+
+        # map_batch() tables: rules as (6,) arrays, calibration as (arms, 6)
+        self._col = np.array([FEATURE_COLUMNS.index(r.feature) for r in rules], dtype=np.intp)
+        self._fc = np.array([r.feature_center for r in rules])
+        self._gain = np.array([-r.gain if r.invert else r.gain for r in rules])
+        lo = np.array([[c[mid].range_min for mid in sorted(c)] for c in calibs], dtype=np.float64)
+        hi = np.array([[c[mid].range_max for mid in sorted(c)] for c in calibs], dtype=np.float64)
+        self._center = (lo + hi) / 2.0
+        self._span = (hi - lo) / 2.0
+        # Soft limits; where the margin would invert the range, fall back to the hard limits
+        slo, shi = lo + self.margin, hi - self.margin
+        bad = slo > shi
+        self._lo = np.where(bad, lo, slo)
+        self._hi = np.where(bad, hi, shi)
+        # (5,6) feature -> rule column picks, doubled: (features @ _pick2 - _fc2) == 2 * (f - center)
+        self._pick2 = np.zeros((len(FEATURE_COLUMNS), len(rules)))
+        self._pick2[self._col, np.arange(len(rules))] = 2.0
+        self._fc2 = self._fc * 2.0
+        self._gain_span = self._span * self._gain
+        self._bufs: Dict[int, tuple] = {}
+
     def _clamp(self, mid: int, val: int) -> int:
         c = self.calib[mid]
         lo = c.range_min + self.margin
@@ -39,8 +77,9 @@ class HandToJointMapper:
         return max(lo, min(hi, val))
 
     def map(self, features: Dict[str, float]) -> Dict[int, int]:
+        """First arm: {motor id: ticks} in joint slot order (same slots as map_batch)."""
         out: Dict[int, int] = {}
-        for mid, rule in self.rules.items():
+        for mid, rule in self._slot_rules:
             c = self.calib[mid]
             center = (c.range_min + c.range_max) / 2.0
             span = (c.range_max - c.range_min) / 2.0
@@ -57,3 +96,28 @@ class HandToJointMapper:
             out[mid] = self._clamp(mid, target)
 
         return out
+
+    def map_batch(self, features: np.ndarray, arms: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        features: (H,5) in FEATURE_COLUMNS order (FeatureExtractor.extract_batch);
+        arms: (H,) index into the calibration list for each hand (None = 0..H-1).
+        Returns (H,6) int64 ticks in a buffer owned by the mapper, overwritten by the next call.
+        """
+        h = features.shape[0]
+        b = self._bufs.get(h)
+        if b is None:
+            b = self._bufs[h] = (np.empty((h, len(self._col))), np.empty((h, len(self._col)), dtype=np.int64))
+        d, out = b
+        # normalized delta in [-1..+1]: 2 * (feature - center), columns picked by the product
+        np.matmul(features, self._pick2, out=d)
+        d -= self._fc2
+        np.minimum(d, 1.0, out=d)
+        np.maximum(d, -1.0, out=d)
+        if arms is None:
+            arms = slice(0, h)
+        d *= self._gain_span[arms]
+        d += self._center[arms]
+        np.rint(d, out=d)
+        np.minimum(d, self._hi[arms], out=d)
+        np.maximum(d, self._lo[arms], out=out, casting="unsafe")
+        return out
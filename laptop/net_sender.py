@@ -1,46 +1,327 @@
 # laptop/net_sender.py
 from __future__ import annotations
 
+from abc import ABC, abstractmethod
 import json
 import socket
+import threading
 from dataclasses import dataclass
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple
+
+from common.mailbox import LatestMailbox
+from common.message_schema import TRACE_SENT, TeleopCommand, to_msg
+from common.timeutil import now_s
+from common.wire import (
+    SYNC_MAGIC,
+    SYNC_PING,
+    SYNC_PONG,
+    WireError,
+    decode_sync,
+    encode_command,
+    encode_sync,
+    frame_length,
+    hello_msg,
+    sync_msg,
+)
 
 
 @dataclass
 class SenderStats:
     connected: bool = False
     sent: int = 0
+    pongs: int = 0  # clock-sync pings from the Pi answered
+
 
+class CommandSender(ABC):
+    """
+    Transport-independent send side. laptop/app.py only uses this interface:
+      connect(), send_command(cmd), close(), framing, stats
+    After connect() a reader thread answers the Pi's clock-sync pings right away
+    (receive and reply stamped on the laptop's monotonic clock).
+    """
 
-class TeleopSender:
-    def __init__(self, host: str, port: int) -> None:
+    def __init__(self, host: str, port: int, framing: str = "ndjson") -> None:
         self.host = host
         self.port = int(port)
+        self.requested_framing = framing
+        self.framing = "ndjson"  # framing actually in use after connect()
         self.sock: Optional[socket.socket] = None
         self.stats = SenderStats()
+        self._send_lock = threading.Lock()  # commands and pongs share the socket
+
+    @abstractmethod
+    def connect(self, timeout_s: float = 3.0) -> None:
+        ...
+
+    def send_command(self, cmd: TeleopCommand) -> None:
+        if not self.sock:
+            raise RuntimeError("Not connected")
+        if cmd.trace is not None:
+            cmd.trace[TRACE_SENT] = now_s()
+        if self.framing == "binary":
+            payload = encode_command(cmd)
+        else:
+            payload = (json.dumps(to_msg(cmd), separators=(",", ":")) + "\n").encode("utf-8")
+        with self._send_lock:
+            self.sock.sendall(payload)
+        self.stats.sent += 1
+
+    def _start_reader(self) -> None:
+        threading.Thread(target=self._read_pings, args=(self.sock,), name="teleop-clock-sync", daemon=True).start()
+
+    def _read_pings(self, sock: socket.socket) -> None:
+        """Reader thread body; ends when the socket is closed or replaced."""
+        buf = bytearray()
+        while self.sock is sock:
+            try:
+                data = sock.recv(4096)
+            except (socket.timeout, ConnectionRefusedError):
+                continue  # UDP: ICMP unreachable while the Pi is down
+            except OSError:
+                return
+            t1 = now_s()
+            if not data:
+                return
+            buf += data
+            for sync_id, t0 in self._parse_pings(buf):
+                self._pong(sock, sync_id, t0, t1)
+
+    def _parse_pings(self, buf: bytearray) -> List[Tuple[int, float]]:
+        """Consume complete ping messages from buf (binary sync frames or JSON lines)."""
+        out: List[Tuple[int, float]] = []
+        while buf:
+            if buf[0] == SYNC_MAGIC:
+                try:
+                    n = frame_length(buf)
+                    if n is None or len(buf) < n:
+                        break
+                    kind, sync_id, t0, _, _ = decode_sync(buf)
+                except WireError:
+                    del buf[:1]
+                    continue
+                del buf[:n]
+                if kind == SYNC_PING:
+                    out.append((sync_id, t0))
+                continue
+            i = buf.find(b"\n")
+            if i < 0:
+                if len(buf) > 4096:
+                    buf.clear()
+                break
+            line = bytes(buf[:i])
+            del buf[: i + 1]
+            try:
+                msg = json.loads(line)
+                if isinstance(msg, dict) and msg.get("type") == "ping":
+                    out.append((int(msg["id"]), float(msg["t0"])))
+            except (ValueError, KeyError, TypeError):
+                continue
+        return out
+
+    def _pong(self, sock: socket.socket, sync_id: int, t0: float, t1: float) -> None:
+        binary = self.framing == "binary"
+        try:
+            with self._send_lock:
+                t2 = now_s()
+                if binary:
+                    payload = encode_sync(SYNC_PONG, sync_id, t0, t1, t2)
+                else:
+                    msg = sync_msg(SYNC_PONG, sync_id, t0, t1, t2)
+                    payload = (json.dumps(msg, separators=(",", ":")) + "\n").encode("utf-8")
+                sock.sendall(payload)
+            self.stats.pongs += 1
+        except OSError:
+            pass  # the send path notices a dead socket and reconnects
+
+    def close(self) -> None:
+        if self.sock:
+            try:
+                self.sock.close()
+            except Exception:
+                pass
+        self.sock = None
+        self.stats.connected = False
+
+
+class TeleopSender(CommandSender):
+    """TCP stream; binary framing is requested with a hello handshake, NDJSON otherwise."""
+
+    def __init__(self, host: str, port: int, framing: str = "ndjson", send_timeout_s: float = 1.0) -> None:
+        super().__init__(host, port, framing)
+        # A send blocked this long means the Pi (or link) is gone: fail so the caller reconnects
+        self.send_timeout_s = float(send_timeout_s)
 
     def connect(self, timeout_s: float = 3.0) -> None:
         self.close()
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Small, latency-critical messages: never wait for Nagle coalescing
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         s.settimeout(timeout_s)
         s.connect((self.host, self.port))
-        s.settimeout(None)
         self.sock = s
+        self.framing = self._negotiate(timeout_s) if self.requested_framing != "ndjson" else "ndjson"
+        s.settimeout(self.send_timeout_s)
         self.stats.connected = True
+        self._start_reader()
+
+    def _negotiate(self, timeout_s: float) -> str:
+        # Ask for the requested framing; any failure or silence falls back to NDJSON.
+        assert self.sock is not None
+        self.send_json_line(hello_msg(self.requested_framing))
+        buf = b""
+        try:
+            while b"\n" not in buf and len(buf) < 1024:
+                data = self.sock.recv(256)
+                if not data:
+                    raise ConnectionError("Pi closed connection during handshake")
+                buf += data
+            ack = json.loads(buf.split(b"\n", 1)[0])
+        except (socket.timeout, ValueError):
+            return "ndjson"
+        if isinstance(ack, dict) and ack.get("type") == "hello_ack":
+            return str(ack.get("framing", "ndjson"))
+        return "ndjson"
 
     def send_json_line(self, obj: dict) -> None:
         if not self.sock:
             raise RuntimeError("Not connected")
         line = json.dumps(obj, separators=(",", ":")) + "\n"
-        self.sock.sendall(line.encode("utf-8"))
+        with self._send_lock:
+            self.sock.sendall(line.encode("utf-8"))
         self.stats.sent += 1
 
-    def close(self) -> None:
-        if self.sock:
+
+class UDPTeleopSender(CommandSender):
+    """
+    One command per datagram, no handshake: the Pi tells binary frames from JSON by the first byte.
+    A lost datagram is never resent; the next command supersedes it anyway.
+    """
+
+    def connect(self, timeout_s: float = 3.0) -> None:
+        self.close()
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.connect((self.host, self.port))  # fixes the destination, no packets sent
+        self.sock = s
+        s.settimeout(1.0)
+        self.framing = self.requested_framing
+        self.stats.connected = True
+        self._start_reader()
+
+
+def make_sender(net_cfg: Dict[str, Any]) -> CommandSender:
+    tcp = net_cfg["tcp"]
+    proto = net_cfg.get("protocol", {})
+    transport = str(proto.get("transport", "tcp"))
+    framing = str(proto.get("framing", "ndjson"))
+    if transport == "udp":
+        return UDPTeleopSender(tcp["pi_host"], int(tcp["pi_port"]), framing=framing)
+    if transport == "tcp":
+        return TeleopSender(tcp["pi_host"], int(tcp["pi_port"]), framing=framing)
+    raise ValueError(f"Unknown transport: {transport}")
+
+
+@dataclass
+class BackgroundSenderStats:
+    submitted: int = 0
+    sent: int = 0
+    overwritten: int = 0      # submissions replaced by a newer one before they were sent
+    send_errors: int = 0
+    encode_errors: int = 0    # of send_errors: commands dropped as unencodable, no reconnect
+    reconnects: int = 0
+    last_send_ms: float = 0.0
+    avg_send_ms: float = 0.0  # EMA of time spent in send_command
+    max_send_ms: float = 0.0
+
+
+class BackgroundSender:
+    """
+    Runs any CommandSender on its own thread so the vision loop never blocks on the network.
+    submit() drops the command into a single-slot mailbox (latest wins) and returns at once.
+    Commands submitted together (one per arm, from the same frame) share the slot and are sent
+    back to back, so a newer frame replaces all of them but never only some.
+    The thread (re)connects with exponential backoff and sends whatever is newest.
+    """
+
+    def __init__(self, sender: CommandSender, backoff_initial_s: float = 0.2, backoff_max_s: float = 5.0) -> None:
+        self.sender = sender
+        self.backoff_initial_s = float(backoff_initial_s)
+        self.backoff_max_s = float(backoff_max_s)
+        self.stats = BackgroundSenderStats()
+        self.last_error = ""
+        self._slot: LatestMailbox[Tuple[TeleopCommand, ...]] = LatestMailbox()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def connected(self) -> bool:
+        return self.sender.stats.connected
+
+    @property
+    def framing(self) -> str:
+        return self.sender.framing
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="teleop-sender", daemon=True)
+        self._thread.start()
+
+    def submit(self, *cmds: TeleopCommand) -> None:
+        self.stats.submitted += 1
+        if self._slot.publish(cmds):
+            self.stats.overwritten += 1
+
+    def _run(self) -> None:
+        backoff = self.backoff_initial_s
+        ever_connected = False
+        while not self._stop.is_set():
+            if not self.sender.stats.connected:
+                try:
+                    self.sender.connect()
+                except OSError as e:
+                    self.last_error = f"connect: {e}"
+                    self._stop.wait(backoff)
+                    backoff = min(self.backoff_max_s, backoff * 2.0)
+                    continue
+                if ever_connected:
+                    self.stats.reconnects += 1
+                ever_connected = True
+                backoff = self.backoff_initial_s
+                self.last_error = ""
+                print(f"[laptop] Connected ({type(self.sender).__name__}, {self.sender.framing} framing).")
+
+            cmds = self._slot.take(timeout_s=0.2)
+            if cmds is None:
+                continue
+            t0 = now_s()
             try:
-                self.sock.close()
-            except Exception:
-                pass
-        self.sock = None
-        self.stats.connected = False
+                for cmd in cmds:
+                    try:
+                        self.sender.send_command(cmd)
+                    except ValueError as e:  # WireError, or a bad field on the NDJSON path
+                        # Not encodable (arm id or seq out of the wire format's range): drop just
+                        # this command, the connection is fine
+                        self.stats.send_errors += 1
+                        self.stats.encode_errors += 1
+                        self.last_error = f"encode: {e}"
+                        if self.stats.encode_errors == 1 or self.stats.encode_errors % 100 == 0:
+                            print(f"[laptop] DROP unencodable command ({self.stats.encode_errors}x): {e}")
+            except (OSError, RuntimeError) as e:
+                # Drop these commands (newer ones will follow) and reconnect
+                self.stats.send_errors += 1
+                self.last_error = f"send: {e}"
+                print(f"[laptop] NET ERROR: {e}; reconnecting")
+                self.sender.close()
+                continue
+            ms = (now_s() - t0) * 1000.0
+            st = self.stats
+            st.sent += 1
+            st.last_send_ms = ms
+            st.avg_send_ms = ms if st.sent == 1 else 0.9 * st.avg_send_ms + 0.1 * ms
+            st.max_send_ms = max(st.max_send_ms, ms)
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        self.sender.close()
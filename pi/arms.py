@@ -0,0 +1,53 @@
+# pi/arms.py
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+from common.message_schema import MAX_ARM, NUM_JOINTS
+
+DEFAULT_CALIBRATION = "config/robot_calibration.json"
+
+
+@dataclass
+class ArmConfig:
+    name: str
+    arm_id: int              # TeleopCommand.arm routed to this arm
+    device: str              # serial adapter of this arm's bus
+    motor_ids: List[int]     # command slot i drives motor_ids[i]
+    calibration: str         # path to the arm's calibration JSON
+
+
+def load_arm_configs(dxl_cfg_y: Dict[str, Any]) -> List[ArmConfig]:
+    """
+    Arms from the optional `arms:` list in config/dynamixel.yaml. Without it: one arm (id 0)
+    on dynamixel.device with motor ids 1..6 and config/robot_calibration.json, as before.
+    """
+    dev = str(dxl_cfg_y["dynamixel"]["device"])
+    default_ids = list(range(1, NUM_JOINTS + 1))
+    arms_y = dxl_cfg_y.get("arms") or []
+    if not arms_y:
+        return [ArmConfig(name="arm0", arm_id=0, device=dev, motor_ids=default_ids, calibration=DEFAULT_CALIBRATION)]
+
+    arms: List[ArmConfig] = []
+    for i, a in enumerate(arms_y):
+        arm_id = int(a.get("arm_id", i))
+        arm = ArmConfig(
+            name=str(a.get("name", f"arm{arm_id}")),
+            arm_id=arm_id,
+            device=str(a.get("device", dev)),
+            motor_ids=[int(m) for m in a.get("motor_ids", default_ids)],
+            calibration=str(a.get("calibration", DEFAULT_CALIBRATION)),
+        )
+        if not (0 <= arm.arm_id <= MAX_ARM):
+            raise ValueError(f"arms[{i}].arm_id: must be in [0,{MAX_ARM}]")
+        if len(arm.motor_ids) != NUM_JOINTS or len(set(arm.motor_ids)) != NUM_JOINTS:
+            raise ValueError(f"arms[{i}].motor_ids: need {NUM_JOINTS} distinct ids, got {arm.motor_ids}")
+        arms.append(arm)
+
+    for key in ("arm_id", "name", "device"):
+        seen = [getattr(a, key) for a in arms]
+        dup = next((v for v in seen if seen.count(v) > 1), None)
+        if dup is not None:
+            raise ValueError(f"arms: duplicate {key} {dup!r}")
+    return arms
@@ -0,0 +1,257 @@
+# pi/bus_scheduler.py
+from __future__ import annotations
+
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from common.timeutil import now_s
+from pi.telemetry import TelemetryReader
+
+# Hardware Error Status bits (X-series)
+HW_ERROR_BITS = {0: "input_voltage", 2: "overheating", 3: "encoder", 4: "electrical_shock", 5: "overload"}
+
+
+def describe_hw_error(val: int) -> str:
+    names = [name for bit, name in HW_ERROR_BITS.items() if val & (1 << bit)]
+    return ",".join(names) or f"0x{val:02x}"
+
+
+@dataclass
+class SlotStats:
+    runs: int = 0
+    busy_s: float = 0.0      # bus time spent in this slot
+    max_ms: float = 0.0
+    est_ms: float = 0.0      # expected duration used for budgeting (2nd largest of the recent runs)
+    deferred: int = 0        # background: gaps skipped because the slot didn't fit the budget
+    overruns: int = 0        # background: ran into the next expected goal write
+    yielded: int = 0         # background: stepped aside for a critical caller waiting on the bus
+    waits: int = 0           # critical: found the bus busy
+    max_wait_ms: float = 0.0
+    recent_ms: deque = field(default_factory=lambda: deque(maxlen=20))
+
+    def record(self, dur_s: float) -> None:
+        ms = dur_s * 1e3
+        self.runs += 1
+        self.busy_s += dur_s
+        self.max_ms = max(self.max_ms, ms)
+        # Near-worst case, but one scheduling hiccup doesn't starve the slot
+        self.recent_ms.append(ms)
+        r = sorted(self.recent_ms)
+        self.est_ms = r[-2] if len(r) > 1 else r[0]
+
+
+class _Task:
+    __slots__ = ("name", "fn", "period_s", "next_due")
+
+    def __init__(self, name: str, fn: Callable[[], object], hz: float) -> None:
+        self.name = name
+        self.fn = fn
+        self.period_s = 1.0 / hz
+        self.next_due = now_s()
+
+
+class BusScheduler:
+    """
+    Single owner of the servo bus. Exposes the bus API the control loop and watchdog use
+    (sync_write_positions, torque_all, lock, stats, ...) and runs everything else in slots.
+
+    Critical slots -- goal writes and torque changes -- execute immediately on the caller's thread.
+    Background slots -- telemetry, torque verification, hardware error polls -- run on the
+    scheduler thread in the gaps between goal writes, in that priority order. The cycle is
+    anchored to the goal stream: after each goal write the next one is expected one cycle later,
+    and a background transaction is only started if its measured duration fits before that
+    (minus guard_us). Critical callers also announce themselves before taking the bus lock, and a
+    background slot that finds one waiting steps aside (`yielded`) instead of starting. A serial
+    transaction can't be preempted, though: a critical call that arrives while one is already on
+    the wire still waits for it to finish. `waits` and `overruns` count those cases.
+    """
+
+    def __init__(
+        self,
+        bus,
+        cycle_hz: float = 100.0,
+        telemetry: Optional[TelemetryReader] = None,
+        telemetry_hz: float = 50.0,
+        torque_verify_hz: float = 1.0,
+        error_poll_hz: float = 0.5,
+        guard_us: float = 300.0,
+        name: str = "",
+    ) -> None:
+        self.bus = bus
+        self.tag = f"[pi:{name}]" if name else "[pi]"  # prefix of every line this scheduler prints
+        self.cfg = bus.cfg
+        self.ids = bus.ids
+        self.stats = bus.stats
+        self.lock = bus.lock
+        self.period_s = 1.0 / max(1.0, float(cycle_hz))
+        self.guard_s = max(0.0, float(guard_us)) * 1e-6
+        self.telemetry = telemetry
+        self.hw_errors: Dict[int, int] = {}
+
+        self.slots: Dict[str, SlotStats] = {"goal": SlotStats(), "torque": SlotStats()}
+        self._tasks: List[_Task] = []
+        if telemetry is not None and telemetry_hz > 0:
+            self._add_task("telemetry", telemetry.read_once, telemetry_hz)
+        if torque_verify_hz > 0:
+            self._add_task("torque_verify", self._verify_torque, torque_verify_hz)
+        if error_poll_hz > 0 and hasattr(bus, "read_hardware_errors"):
+            self._add_task("error_poll", self._poll_errors, error_poll_hz)
+
+        self._last_goal_t: Optional[float] = None  # start of the latest goal write
+        self._critical_waiting = 0                  # critical callers queued for / holding the lock
+        self._waiting_lock = threading.Lock()
+        self._goal_done = threading.Event()
+        self._t_start = now_s()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _add_task(self, name: str, fn: Callable[[], object], hz: float) -> None:
+        self._tasks.append(_Task(name, fn, float(hz)))
+        self.slots[name] = SlotStats()
+
+    # ---- lifecycle (the bus itself is opened/closed by its creator) ----
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._t_start = now_s()
+        self._thread = threading.Thread(target=self._run, name="pi-bus-sched", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._goal_done.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    # ---- critical slots (caller's thread) ----
+
+    def _critical(self, slot: str, fn: Callable, *args):
+        st = self.slots[slot]
+        with self._waiting_lock:
+            self._critical_waiting += 1
+        try:
+            t0 = now_s()
+            with self.lock:
+                t1 = now_s()
+                out = fn(*args)
+                t2 = now_s()
+        finally:
+            with self._waiting_lock:
+                self._critical_waiting -= 1
+        wait = t1 - t0
+        if wait > self.guard_s:
+            st.waits += 1
+            st.max_wait_ms = max(st.max_wait_ms, wait * 1e3)
+        return out, t1, t2
+
+    def sync_write_positions(self, targets: Dict[int, int], force: bool = False) -> int:
+        filt = getattr(self.bus, "goal_filter", None)
+        if not force and filt is not None and not filt.changed(targets):
+            # Nothing to send: don't wait for the lock just to find that out
+            self.stats.goal_skipped += 1
+            self._last_goal_t = now_s()
+            return 0
+        n, t1, t2 = self._critical("goal", self.bus.sync_write_positions, targets, force)
+        if n:
+            self.slots["goal"].record(t2 - t1)
+        # Anchor on every goal tick, written or deduplicated: the next one may well change
+        self._last_goal_t = t1
+        self._goal_done.set()
+        return n
+
+    def torque_all(self, enable: bool, force: bool = False) -> None:
+        # Called every tick: answer from the cache without touching the lock when nothing changes
+        enable = bool(enable)
+        if not force and all(self.bus.torque_cached(mid) is enable for mid in self.ids):
+            self.stats.torque_skipped += 1
+            return
+        writes = self.stats.torque_writes
+        _, t1, t2 = self._critical("torque", self.bus.torque_all, enable, force)
+        if self.stats.torque_writes != writes:
+            self.slots["torque"].record(t2 - t1)
+
+    def torque_cached(self, mid: int) -> Optional[bool]:
+        return self.bus.torque_cached(mid)
+
+    def verify_torque(self) -> List[int]:
+        with self.lock:
+            return self.bus.verify_torque()
+
+    def sync_read_positions(self) -> Dict[int, int]:
+        with self.lock:
+            return self.bus.sync_read_positions()
+
+    # ---- background slots (scheduler thread) ----
+
+    def _budget(self, now: float) -> float:
+        """Bus time available before the next expected goal write starts (minus the guard)."""
+        last = self._last_goal_t
+        if last is None or now - last > 2.0 * self.period_s:
+            return self.period_s - self.guard_s  # no goal stream: the whole cycle is free
+        return last + self.period_s - now - self.guard_s
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            # Right after a goal write is the largest gap; without goals, run once per cycle
+            self._goal_done.wait(self.period_s)
+            self._goal_done.clear()
+            for task in self._tasks:
+                now = now_s()
+                if now < task.next_due:
+                    continue
+                st = self.slots[task.name]
+                if st.est_ms * 1e-3 > self._budget(now):
+                    st.deferred += 1
+                    continue
+                if self._critical_waiting:
+                    st.yielded += 1
+                    continue
+                with self.lock:
+                    if self._critical_waiting:
+                        # One queued up while we took the lock: let it go first, nothing sent yet
+                        st.yielded += 1
+                        continue
+                    t0 = now_s()
+                    try:
+                        task.fn()
+                    except Exception as e:
+                        print(f"{self.tag} WARN bus {task.name} failed:", e)
+                    t1 = now_s()
+                st.record(t1 - t0)
+                last = self._last_goal_t
+                if last is not None and t0 < last + self.period_s < t1:
+                    st.overruns += 1
+                # Absolute cadence; after a long deferral, resume without bursting
+                task.next_due = max(task.next_due + task.period_s, t1)
+
+    def _verify_torque(self) -> None:
+        bad = self.bus.verify_torque()
+        if bad:
+            print(f"{self.tag} WARN torque state drifted on ids {bad}, rewriting")
+
+    def _poll_errors(self) -> None:
+        errs = {mid: v for mid, v in self.bus.read_hardware_errors().items() if v}
+        if errs != self.hw_errors:
+            if errs:
+                desc = " ".join(f"j{mid}={describe_hw_error(v)}" for mid, v in errs.items())
+                print(f"{self.tag} WARN servo hardware error: {desc}")
+            else:
+                print(f"{self.tag} servo hardware errors cleared")
+        self.hw_errors = errs
+
+    # ---- reporting ----
+
+    def summary(self) -> str:
+        elapsed = max(1e-9, now_s() - self._t_start)
+        parts = []
+        for name, st in self.slots.items():
+            s = f"{name} n={st.runs} busy={100.0 * st.busy_s / elapsed:.1f}% max={st.max_ms:.2f}ms"
+            if name in ("goal", "torque"):
+                s += f" waits={st.waits}/{st.max_wait_ms:.2f}ms"
+            else:
+                s += f" deferred={st.deferred} yielded={st.yielded} overruns={st.overruns}"
+            parts.append(s)
+        return " | ".join(parts)
@@ -0,0 +1,183 @@
+# pi/clock_sync.py
+from __future__ import annotations
+
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from common.timeutil import RateTimer, now_s
+
+
+@dataclass
+class ClockSyncStats:
+    pings: int = 0
+    pongs: int = 0
+    lost: int = 0            # pings that never got a pong (or came back too late)
+    last_rtt_ms: float = 0.0
+    min_rtt_ms: float = 0.0  # of the current window
+    offset_ms: float = 0.0   # laptop clock - Pi clock, current estimate
+    drift_ppm: float = 0.0
+    synced: bool = False
+
+    def summary(self) -> str:
+        if not self.synced:
+            return f"unsynced pings={self.pings} pongs={self.pongs}"
+        return (f"offset={self.offset_ms:+.2f}ms drift={self.drift_ppm:+.1f}ppm "
+                f"rtt min={self.min_rtt_ms:.2f} last={self.last_rtt_ms:.2f}ms lost={self.lost}")
+
+
+class ClockSync:
+    """
+    NTP-style offset estimate between the laptop's and the Pi's monotonic clocks.
+
+    The Pi sends ping(id, t0); the laptop answers pong(id, t0, t1 = its receive time,
+    t2 = its send time); the Pi notes t3 on arrival. Per exchange:
+        rtt    = (t3 - t0) - (t2 - t1)
+        offset = ((t1 - t0) + (t2 - t3)) / 2        (laptop - Pi)
+    The error of one sample is at most rtt/2, so the estimate uses the minimum-RTT sample:
+    the window is cut into `bucket` consecutive exchanges, the best sample of each bucket is kept,
+    and a least-squares line through those gives offset and drift. Until those span
+    `min_drift_span_s` (drift over a short baseline is mostly RTT noise) the single best
+    sample's offset is used as-is.
+    """
+
+    def __init__(
+        self, window: int = 64, bucket: int = 8, max_rtt_s: float = 0.5, min_drift_span_s: float = 10.0
+    ) -> None:
+        self.window = max(2, int(window))
+        self.bucket = max(1, int(bucket))
+        self.max_rtt_s = float(max_rtt_s)
+        self.min_drift_span_s = float(min_drift_span_s)
+        self.stats = ClockSyncStats()
+        self._samples: Deque[Tuple[float, float, float]] = deque(maxlen=self.window)  # (t_pi, rtt, offset)
+        self._pending: Dict[int, float] = {}
+        self._next_id = 0
+        # offset(t) = _a + _b * (t - _t_ref); written as one tuple so readers never see a torn update
+        self._model: Optional[Tuple[float, float, float]] = None
+        self._lock = threading.Lock()  # ping/pong bookkeeping only (sync thread vs. receive thread)
+
+    def reset(self) -> None:
+        """Forget the estimate (new client: possibly another clock)."""
+        with self._lock:
+            self._pending.clear()
+            self._samples.clear()
+            self._model = None
+            self.stats.synced = False
+
+    # ---- exchange ----
+
+    def make_ping(self) -> Tuple[int, float]:
+        with self._lock:
+            sid = self._next_id
+            self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+            # Anything still pending this long is lost
+            t0 = now_s()
+            for k in [k for k, t in self._pending.items() if t0 - t > self.max_rtt_s]:
+                del self._pending[k]
+                self.stats.lost += 1
+            self._pending[sid] = t0
+            self.stats.pings += 1
+        return sid, t0
+
+    def cancel(self, sync_id: int) -> None:
+        """Forget a ping that could not be sent."""
+        with self._lock:
+            if self._pending.pop(int(sync_id), None) is not None:
+                self.stats.pings -= 1
+
+    def on_pong(self, sync_id: int, t0: float, t1: float, t2: float, t3: float) -> bool:
+        with self._lock:
+            sent = self._pending.pop(int(sync_id), None)
+        if sent is None or sent != t0:
+            return False  # unknown, duplicate or expired
+        rtt = (t3 - t0) - (t2 - t1)
+        if rtt < 0.0 or rtt > self.max_rtt_s:
+            self.stats.lost += 1
+            return False
+        st = self.stats
+        st.pongs += 1
+        st.last_rtt_ms = rtt * 1e3
+        self._samples.append((t3, rtt, ((t1 - t0) + (t2 - t3)) * 0.5))
+        self._refit()
+        return True
+
+    # ---- estimate ----
+
+    def _refit(self) -> None:
+        samples = list(self._samples)
+        best: List[Tuple[float, float, float]] = []
+        for i in range(0, len(samples), self.bucket):
+            best.append(min(samples[i:i + self.bucket], key=lambda s: s[1]))
+        st = self.stats
+        st.min_rtt_ms = min(s[1] for s in samples) * 1e3
+
+        if len(best) < 2 or best[-1][0] - best[0][0] < self.min_drift_span_s:
+            t, _, off = min(best, key=lambda s: s[1])
+            self._model = (off, 0.0, t)
+        else:
+            n = float(len(best))
+            t_ref = sum(s[0] for s in best) / n
+            o_mean = sum(s[2] for s in best) / n
+            sxx = sum((s[0] - t_ref) ** 2 for s in best)
+            sxy = sum((s[0] - t_ref) * (s[2] - o_mean) for s in best)
+            b = sxy / sxx if sxx > 0.0 else 0.0
+            self._model = (o_mean, b, t_ref)
+        a, b, t_ref = self._model
+        st.offset_ms = (a + b * (now_s() - t_ref)) * 1e3
+        st.drift_ppm = b * 1e6
+        st.synced = True
+
+    @property
+    def synced(self) -> bool:
+        return self._model is not None
+
+    def offset_s(self, t_pi: Optional[float] = None) -> float:
+        m = self._model
+        if m is None:
+            return 0.0
+        a, b, t_ref = m
+        return a + b * ((now_s() if t_pi is None else t_pi) - t_ref)
+
+    def to_pi_time(self, t_laptop: float) -> Optional[float]:
+        """Laptop monotonic time -> Pi monotonic time, or None until the first exchange."""
+        m = self._model
+        if m is None:
+            return None
+        a, b, t_ref = m
+        # offset(t_pi) = t_laptop - t_pi; solve for t_pi with the offset evaluated near t_laptop
+        return t_laptop - (a + b * (t_laptop - a - t_ref))
+
+
+class ClockSyncPinger:
+    """Sends pings at a fixed rate through `send_ping(id, t0)` (the receiver's transport)."""
+
+    def __init__(self, clock: ClockSync, send_ping: Callable[[int, float], bool], hz: float = 2.0) -> None:
+        self.clock = clock
+        self.send_ping = send_ping
+        self.hz = float(hz)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="pi-clock-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def _run(self) -> None:
+        rate = RateTimer(self.hz)
+        while not self._stop.is_set():
+            sid, t0 = self.clock.make_ping()
+            try:
+                sent = self.send_ping(sid, t0)
+            except OSError:
+                sent = False
+            if not sent:
+                self.clock.cancel(sid)  # no client (or handshake not done) right now
+            rate.sleep()
@@ -0,0 +1,311 @@
+# pi/control.py
+from __future__ import annotations
+
+import threading
+import traceback
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Union
+
+from common.latency import StageLatency
+from common.mailbox import LatestMailbox
+from common.message_schema import TeleopCommand
+from common.timeutil import RateTimer, now_s
+from pi.bus_scheduler import BusScheduler
+from pi.clock_sync import ClockSync
+from pi.dxl_driver import DynamixelBus
+from pi.flight_log import FlightLogger
+from pi.logger import CSVLogger
+from pi.net_receiver import NetStats
+from pi.safety import SafetyLayer
+from pi.telemetry import Telemetry, TelemetryReader
+from pi.trajectory import SetpointInterpolator
+from pi.watchdog import StaleWatchdog
+
+
+# Per-command latency breakdown, photon to servo write. Laptop stages come from cmd.trace
+# (laptop clock, differences only); Pi stages from the receiver and this loop (Pi clock).
+# Stages crossing the two clocks need the clock-sync offset and are skipped until it exists.
+LATENCY_STAGES = (
+    "inference",     # frame captured -> landmarks ready
+    "features",      # -> features extracted
+    "mapping",       # -> joint targets mapped
+    "send",          # -> written to the socket (send-rate wait + sender queue)
+    "network",       # -> bytes received on the Pi (one-way delay, clock-synced)
+    "decode",        # bytes received on the Pi -> decoded and published
+    "queue",         # -> taken by the control tick
+    "safety",        # -> safety decision made
+    "bus_write",     # -> goal sync write finished
+    "laptop_total",  # capture -> sent
+    "pi_total",      # received -> bus write done
+    "end_to_end",    # capture -> bus write done (clock-synced)
+)
+_S = {name: i for i, name in enumerate(LATENCY_STAGES)}
+
+
+@dataclass
+class ControlStats:
+    ticks: int = 0
+    overruns: int = 0
+    cmds_applied: int = 0
+
+
+class ControlLoop:
+    """
+    Fixed-rate control thread.
+    Each tick takes the newest command from the mailbox (if any), runs it through the safety layer,
+    evaluates the stale policy and drives the bus. Network burstiness never queues up motion here:
+    anything older than the newest command has already been overwritten in the mailbox.
+    Between setpoints the interpolator streams intermediate goals at the tick rate; every goal
+    written passes the safety layer's velocity/acceleration envelope.
+    """
+
+    def __init__(
+        self,
+        bus: Union[BusScheduler, DynamixelBus],
+        safety: SafetyLayer,
+        logger: Union[FlightLogger, CSVLogger],
+        mailbox: LatestMailbox[TeleopCommand],
+        ids: List[int],
+        home_targets: Dict[int, int],
+        control_hz: float = 100.0,
+        min_confidence: float = 0.60,
+        telemetry: Optional[TelemetryReader] = None,
+        torque_verify_hz: float = 1.0,
+        net_stats: Optional[NetStats] = None,
+        interpolator: Optional[SetpointInterpolator] = None,
+        watchdog: Optional[StaleWatchdog] = None,
+        clock: Optional[ClockSync] = None,
+        name: str = "",
+    ) -> None:
+        self.bus = bus
+        self.safety = safety
+        self.logger = logger
+        self.mailbox = mailbox
+        self.ids = list(ids)
+        self.control_hz = float(control_hz)
+        self.min_confidence = float(min_confidence)
+        self.stats = ControlStats()
+        self.net_stats = net_stats
+        self.watchdog = watchdog
+        self.clock = clock
+        self.name = name
+        self.tag = f"[pi:{name}]" if name else "[pi]"  # prefix of every line this loop prints
+        self.latency = StageLatency(LATENCY_STAGES)
+        # Default "none": every setpoint is written as-is, one step
+        self.interp = interpolator or SetpointInterpolator(ids, clamp=safety.clamp, mode="none")
+
+        self.last_cmd: Optional[TeleopCommand] = None
+        self.last_targets: Dict[int, int] = dict(home_targets)
+        self._mode = "WAIT"
+        self._logged_mode = ""
+        self._decision_torque = True
+
+        # Present position and servo health come from the telemetry thread's snapshot;
+        # the tick itself never reads the bus.
+        self.telemetry = telemetry
+        self._snap: Optional[Telemetry] = None
+        self.last_present: Optional[Dict[int, int]] = None
+
+        # Torque cache re-check against hardware (0 = never)
+        self.torque_verify_period = 1.0 / torque_verify_hz if torque_verify_hz > 0 else 0.0
+        self._last_verify_t = now_s()
+
+    def tick(self) -> None:
+        cmd = self.mailbox.take()
+        t_taken = now_s()
+        t_safety = t_write = 0.0
+        joints = None
+        if cmd is not None:
+            self.last_cmd = cmd
+            self.stats.cmds_applied += 1
+            if self.watchdog is not None:
+                self.watchdog.armed = True
+            home_req = bool(cmd.features.get("home", 0.0) >= 0.5)
+
+            # Confidence gate: treat >= min_conf as OK (same as laptop default)
+            # Pi is final authority though — if you want stricter safety, raise this.
+            confidence_ok = cmd.confidence >= self.min_confidence
+
+            # With clock sync, freshness counts from the camera frame, not from arrival
+            origin = None
+            if cmd.trace is not None and self.clock is not None:
+                origin = self.clock.to_pi_time(cmd.trace[0])
+
+            decision = self.safety.apply(
+                seq=cmd.seq,
+                estop=cmd.estop,
+                torque=cmd.torque,
+                confidence_ok=confidence_ok,
+                joints=cmd.joints_by_id(self.ids),
+                home_req=home_req,
+                origin_mono_s=origin,
+            )
+            t_safety = now_s()
+            self._mode = decision["mode"]
+            self._decision_torque = bool(decision["torque"])
+            joints = decision["joints"]
+
+        if self.last_cmd is None:
+            # Nothing received yet: keep the startup pose, don't touch the bus.
+            return
+
+        # Stale policy, evaluated every tick, not only when a message arrives. With a watchdog
+        # this is its verdict (one attribute read, at most one check period behind); it also
+        # cuts torque on HARD_STOP by itself, even if this loop is stuck.
+        stale = self.watchdog.verdict if self.watchdog is not None else self.safety.stale_policy()
+        if cmd is not None and stale != "OK" and self.watchdog is not None:
+            # The verdict may predate the command this tick just applied: re-check freshness
+            stale = self.safety.stale_policy()
+        mode = self._mode
+
+        if stale == "HARD_STOP":
+            mode = "HARD_STOP"
+        elif stale == "SOFT_HOLD" and mode == "LOW_CONF":
+            mode = "SOFT_HOLD"
+
+        # Newest telemetry snapshot (one attribute read); a servo fault overrides everything
+        fault = self._update_telemetry()
+        if fault:
+            mode = "FAULT"
+
+        # Periodically re-check the bus torque cache against the servos;
+        # any drift is corrected by the torque_all() call right below.
+        if self.torque_verify_period and (now_s() - self._last_verify_t) >= self.torque_verify_period:
+            try:
+                bad = self.bus.verify_torque()
+                if bad:
+                    print(f"{self.tag} WARN torque state drifted on ids {bad}, rewriting")
+            except Exception as e:
+                print(f"{self.tag} WARN torque verify failed:", e)
+            self._last_verify_t = now_s()
+
+        # Apply torque state (unless estop/hard stop overrides).
+        # The bus caches torque state, so this only touches the wire on a change.
+        torque_should_be = self._decision_torque and stale != "HARD_STOP" and not fault
+        try:
+            self.bus.torque_all(torque_should_be)
+        except Exception as e:
+            print(f"{self.tag} WARN torque_all failed:", e)
+
+        # Apply motion: new setpoints feed the interpolator, which is sampled every tick
+        t = now_s()
+        if joints is not None and stale != "HARD_STOP":
+            self.interp.push(joints, t)
+        if torque_should_be and mode not in ("ESTOP", "HARD_STOP"):
+            if mode == "SOFT_HOLD":
+                # Low confidence gone stale: stop streaming goals, the servos keep the last one
+                # (torque stays on). A HOME move or tracking setpoint still plays out.
+                self.interp.hold(t)
+            elif self.interp.active:
+                targets = self.safety.limit_motion(self.interp.sample(t), t)
+                self.last_targets = targets
+                # The bus skips joints that didn't move (beyond the deadband) and empty writes
+                if self.bus.sync_write_positions(targets):
+                    t_write = now_s()
+        else:
+            # No motion while torque is off; resume from a standstill later
+            self.interp.hold(t)
+            self.safety.reset_motion(self.last_present)
+
+        lat = self._trace(cmd, t_taken, t_safety, t_write) if cmd is not None else None
+
+        if cmd is not None or mode != self._logged_mode:
+            self._logged_mode = mode
+            c = self.last_cmd
+            self.logger.write(
+                seq=c.seq,
+                confidence=c.confidence,
+                mode=mode,
+                estop=c.estop,
+                torque=torque_should_be,
+                features=c.features,
+                cmd=self.last_targets,
+                pos=self.last_present,
+                latency=lat,
+                telemetry=self._snap,
+            )
+
+    def _update_telemetry(self) -> Optional[str]:
+        snap = self.telemetry.latest if self.telemetry is not None else None
+        if snap is not None and snap is not self._snap:
+            self._snap = snap
+            self.last_present = snap.position
+            before = self.safety.telemetry_fault
+            fault = self.safety.check_telemetry(snap)
+            if bool(fault) != bool(before):
+                print(f"{self.tag} WARN servo fault, torque off: {fault}" if fault
+                      else f"{self.tag} servo fault cleared")
+        return self.safety.telemetry_fault
+
+    def _trace(self, cmd: TeleopCommand, t_taken: float, t_safety: float, t_write: float) -> List[Optional[float]]:
+        """Stage latencies (ms, None = not measured) for one command; also fed to the histograms."""
+        out: List[Optional[float]] = [None] * len(LATENCY_STAGES)
+        tr = cmd.trace
+        # Pi-clock times of the laptop stamps (None until synced, or right after a clock reset)
+        to_pi = self.clock.to_pi_time if tr is not None and self.clock is not None else None
+        cap_pi = to_pi(tr[0]) if to_pi is not None else None
+        if tr is not None:
+            cap, inf, feat, mapped, sent = tr
+            out[_S["inference"]] = (inf - cap) * 1e3
+            out[_S["features"]] = (feat - inf) * 1e3
+            out[_S["mapping"]] = (mapped - feat) * 1e3
+            out[_S["send"]] = (sent - mapped) * 1e3
+            out[_S["laptop_total"]] = (sent - cap) * 1e3
+            sent_pi = to_pi(sent) if to_pi is not None else None
+            if sent_pi is not None and cmd.t_rx:
+                out[_S["network"]] = (cmd.t_rx - sent_pi) * 1e3
+        if cmd.t_rx:
+            out[_S["decode"]] = (cmd.t_decoded - cmd.t_rx) * 1e3
+        if cmd.t_decoded:
+            out[_S["queue"]] = (t_taken - cmd.t_decoded) * 1e3
+        out[_S["safety"]] = (t_safety - t_taken) * 1e3
+        if t_write:
+            # Write may be skipped (unchanged targets, hold, torque off): no bus stage then
+            out[_S["bus_write"]] = (t_write - t_safety) * 1e3
+            if cmd.t_rx:
+                out[_S["pi_total"]] = (t_write - cmd.t_rx) * 1e3
+            if cap_pi is not None:
+                out[_S["end_to_end"]] = (t_write - cap_pi) * 1e3
+        lat = self.latency
+        for stage, ms in zip(LATENCY_STAGES, out):
+            if ms is not None:
+                lat.record(stage, ms)
+        return out
+
+    def run(self, stop: threading.Event, stats_period_s: float = 5.0) -> None:
+        rate = RateTimer(self.control_hz)
+        next_stats = now_s() + stats_period_s
+        while not stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"{self.tag} ERROR in control tick:", e)
+                traceback.print_exc()
+            rate.sleep()
+            self.stats.ticks = rate.ticks
+            self.stats.overruns = rate.overruns
+
+            if stats_period_s > 0 and now_s() >= next_stats:
+                next_stats += stats_period_s
+                mb = self.mailbox.stats
+                bs = self.bus.stats
+                print(
+                    f"{self.tag} ticks={self.stats.ticks} overruns={self.stats.overruns} "
+                    f"cmds={self.stats.cmds_applied} rx={mb.published} overwritten={mb.overwritten} "
+                    f"torque_writes={bs.torque_writes} torque_skipped={bs.torque_skipped} "
+                    f"goal_writes={bs.goal_writes} goal_skipped={bs.goal_skipped} goal_partial={bs.goal_partial}"
+                )
+                if self.net_stats is not None:
+                    ns = self.net_stats
+                    print(f"{self.tag} net seq={ns.last_seq} gaps={ns.seq_gaps} reordered={ns.reordered} bad={ns.bad_frames}")
+                print(f"{self.tag} latency {self.latency.summary()}")
+                if self.clock is not None and self.net_stats is not None:  # stream-wide, like net stats
+                    print(f"{self.tag} clock {self.clock.stats.summary()}")
+                if isinstance(self.bus, BusScheduler):
+                    print(f"{self.tag} bus {self.bus.summary()}")
+                if self.telemetry is not None:
+                    print(f"{self.tag} telemetry {self.telemetry.stats.summary()}")
+                if self.watchdog is not None:
+                    print(f"{self.tag} watchdog {self.watchdog.stats.summary()}")
+                if self.safety.limits_enabled:
+                    print(f"{self.tag} limit hits (vel/acc) {self.safety.limit_hits()}")
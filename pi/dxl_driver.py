@@ -1,15 +1,21 @@
 # pi/dxl_driver.py
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Dict, List, Optional
+import struct
+import threading
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Union
 
-from dynamixel_sdk import (
-    PortHandler,
-    PacketHandler,
-    GroupSyncWrite,
-    GroupSyncRead,
-)
+
+# X-series telemetry block (Protocol 2.0): load, velocity, position ... voltage, temperature are
+# contiguous from 126 to 146, so one sync read of TELEMETRY_LEN bytes returns all of them.
+ADDR_PRESENT_LOAD = 126      # 2 bytes, 0.1 % units, signed
+ADDR_PRESENT_VELOCITY = 128  # 4 bytes, 0.229 rpm units, signed
+ADDR_PRESENT_VOLTAGE = 144   # 2 bytes, 0.1 V
+ADDR_PRESENT_TEMP = 146      # 1 byte, deg C
+TELEMETRY_ADDR = ADDR_PRESENT_LOAD
+TELEMETRY_LEN = ADDR_PRESENT_TEMP + 1 - TELEMETRY_ADDR
+ADDR_HARDWARE_ERROR = 70     # 1 byte bitfield: voltage, overheat, encoder, shock, overload
 
 
 def _int_to_le_bytes(val: int, length: int) -> bytes:
@@ -28,8 +34,75 @@ class DxlConfig:
     len_present_position: int
 
 
+@dataclass
+class BusStats:
+    torque_writes: int = 0      # sync-write transactions actually sent to the torque address
+    torque_skipped: int = 0     # torque_all() calls answered from the cache
+    torque_verifies: int = 0
+    torque_mismatches: int = 0  # servos whose hardware state disagreed with the cache
+    goal_writes: int = 0        # goal sync writes sent
+    goal_skipped: int = 0       # sync_write_positions() calls with nothing to send
+    goal_partial: int = 0       # goal writes that left out unchanged joints
+
+
+class GoalFilter:
+    """
+    Decides which goal positions actually need to go out: a joint is written only when its target
+    moved more than its deadband (ticks) away from the last value written to it. deadband 0 skips
+    exact repeats only. Unknown state (startup, torque change, failed write) writes everything.
+    """
+
+    def __init__(self, ids: List[int], deadband: Union[int, Dict[int, int]] = 0) -> None:
+        self.ids = list(ids)
+        if isinstance(deadband, dict):
+            self.deadband = {mid: int(deadband.get(mid, 0)) for mid in self.ids}
+        else:
+            self.deadband = {mid: int(deadband) for mid in self.ids}
+        self._sent: Dict[int, Optional[int]] = {mid: None for mid in self.ids}
+
+    def changed(self, targets: Dict[int, int], force: bool = False) -> List[int]:
+        out: List[int] = []
+        sent, band = self._sent, self.deadband
+        for mid in self.ids:
+            if mid not in targets:
+                continue
+            last = sent[mid]
+            if force or last is None or abs(targets[mid] - last) > band[mid]:
+                out.append(mid)
+        return out
+
+    def commit(self, mids: List[int], targets: Dict[int, int]) -> None:
+        for mid in mids:
+            self._sent[mid] = int(targets[mid])
+
+    def invalidate(self) -> None:
+        for mid in self.ids:
+            self._sent[mid] = None
+
+
+def load_dxl_config(dxl_cfg_y: Dict[str, Any]) -> DxlConfig:
+    """DxlConfig from the parsed config/dynamixel.yaml."""
+    dxy = dxl_cfg_y["dynamixel"]
+    cty = dxl_cfg_y["control_table"]
+    return DxlConfig(
+        device=str(dxy["device"]),
+        baudrate=int(dxy["baudrate"]),
+        protocol_version=float(dxy["protocol_version"]),
+        addr_torque_enable=int(cty["addr_torque_enable"]),
+        addr_goal_position=int(cty["addr_goal_position"]),
+        addr_present_position=int(cty["addr_present_position"]),
+        len_goal_position=int(cty["len_goal_position"]),
+        len_present_position=int(cty["len_present_position"]),
+    )
+
+
 class DynamixelBus:
-    def __init__(self, cfg: DxlConfig, motor_ids: List[int]) -> None:
+    def __init__(
+        self, cfg: DxlConfig, motor_ids: List[int], goal_deadband: Union[int, Dict[int, int]] = 0
+    ) -> None:
+        # Imported here so the simulated backend works without dynamixel_sdk installed
+        from dynamixel_sdk import GroupSyncRead, GroupSyncWrite, PacketHandler, PortHandler
+
         self.cfg = cfg
         self.ids = list(motor_ids)
 
@@ -38,6 +111,23 @@ class DynamixelBus:
 
         self.sync_write = GroupSyncWrite(self.port, self.packet, cfg.addr_goal_position, cfg.len_goal_position)
         self.sync_read = GroupSyncRead(self.port, self.packet, cfg.addr_present_position, cfg.len_present_position)
+        self.sync_write_torque = GroupSyncWrite(self.port, self.packet, cfg.addr_torque_enable, 1)
+        self.sync_read_telemetry = GroupSyncRead(self.port, self.packet, TELEMETRY_ADDR, TELEMETRY_LEN)
+        self.sync_read_hw_error = GroupSyncRead(self.port, self.packet, ADDR_HARDWARE_ERROR, 1)
+
+        # What we believe each servo's torque enable is. None = unknown (forces a write).
+        self._torque: Dict[int, Optional[bool]] = {mid: None for mid in self.ids}
+        self.stats = BusStats()
+
+        # Goal write params: one buffer per servo, encoded in place and handed to the SDK by
+        # reference; the param list is only rebuilt when the set of joints being written changes.
+        self.goal_filter = GoalFilter(self.ids, goal_deadband)
+        self._goal_pack = struct.Struct({1: "<B", 2: "<H", 4: "<I"}[cfg.len_goal_position]).pack_into
+        self._goal_buf: Dict[int, bytearray] = {mid: bytearray(cfg.len_goal_position) for mid in self.ids}
+        self._goal_param_ids: List[int] = []
+
+        # One transaction at a time: the control loop and the watchdog both talk to the bus
+        self.lock = threading.RLock()
 
         self.is_open = False
 
@@ -52,6 +142,10 @@ class DynamixelBus:
         for mid in self.ids:
             if not self.sync_read.addParam(mid):
                 raise RuntimeError(f"Failed to addParam for sync_read id={mid}")
+            if not self.sync_read_telemetry.addParam(mid):
+                raise RuntimeError(f"Failed to addParam for telemetry sync_read id={mid}")
+            if not self.sync_read_hw_error.addParam(mid):
+                raise RuntimeError(f"Failed to addParam for hardware error sync_read id={mid}")
 
     def close(self) -> None:
         try:
@@ -61,43 +155,180 @@ class DynamixelBus:
             self.is_open = False
 
     def torque_enable(self, mid: int, enable: bool) -> None:
-        val = 1 if enable else 0
-        dxl_comm_result, dxl_error = self.packet.write1ByteTxRx(
-            self.port, mid, self.cfg.addr_torque_enable, val
-        )
-        if dxl_comm_result != 0:
-            raise RuntimeError(f"Torque write comm error id={mid}: {self.packet.getTxRxResult(dxl_comm_result)}")
-        if dxl_error != 0:
-            raise RuntimeError(f"Torque write dxl error id={mid}: {self.packet.getRxPacketError(dxl_error)}")
+        with self.lock:
+            val = 1 if enable else 0
+            dxl_comm_result, dxl_error = self.packet.write1ByteTxRx(
+                self.port, mid, self.cfg.addr_torque_enable, val
+            )
+            if dxl_comm_result != 0:
+                raise RuntimeError(f"Torque write comm error id={mid}: {self.packet.getTxRxResult(dxl_comm_result)}")
+            if dxl_error != 0:
+                raise RuntimeError(f"Torque write dxl error id={mid}: {self.packet.getRxPacketError(dxl_error)}")
+            self._torque[mid] = bool(enable)
+            self.goal_filter.invalidate()
 
-    def torque_all(self, enable: bool) -> None:
-        for mid in self.ids:
-            self.torque_enable(mid, enable)
+    def torque_all(self, enable: bool, force: bool = False) -> None:
+        """
+        Set torque on every servo with one sync write, but only for servos whose cached
+        state differs (all of them if force=True). Calling this every tick is free once settled.
+        """
+        with self.lock:
+            enable = bool(enable)
+            pending = [mid for mid in self.ids if force or self._torque[mid] is not enable]
+            if not pending:
+                self.stats.torque_skipped += 1
+                return
 
-    def sync_write_positions(self, targets: Dict[int, int]) -> None:
-        self.sync_write.clearParam()
-        for mid in self.ids:
-            if mid not in targets:
-                continue
-            param = _int_to_le_bytes(targets[mid], self.cfg.len_goal_position)
-            if not self.sync_write.addParam(mid, param):
-                raise RuntimeError(f"Failed to addParam for sync_write id={mid}")
+            self.sync_write_torque.clearParam()
+            param = [1 if enable else 0]
+            for mid in pending:
+                if not self.sync_write_torque.addParam(mid, param):
+                    raise RuntimeError(f"Failed to addParam for torque sync_write id={mid}")
+
+            # Sync write has no status packet: until it succeeds the state is unknown.
+            # Goals are resent after any torque change (the servo may have been moved meanwhile).
+            for mid in pending:
+                self._torque[mid] = None
+            self.goal_filter.invalidate()
+            dxl_comm_result = self.sync_write_torque.txPacket()
+            if dxl_comm_result != 0:
+                raise RuntimeError(f"Torque SyncWrite comm error: {self.packet.getTxRxResult(dxl_comm_result)}")
+            for mid in pending:
+                self._torque[mid] = enable
+            self.stats.torque_writes += 1
+
+    def torque_cached(self, mid: int) -> Optional[bool]:
+        return self._torque.get(mid)
+
+    def verify_torque(self) -> List[int]:
+        """
+        Read back torque enable from every servo and correct the cache.
+        Meant to run at a low rate (~1 Hz); returns the ids that disagreed with the cache.
+        A servo that doesn't answer is marked unknown so the next torque_all() rewrites it.
+        """
+        with self.lock:
+            mismatched: List[int] = []
+            for mid in self.ids:
+                val, dxl_comm_result, dxl_error = self.packet.read1ByteTxRx(
+                    self.port, mid, self.cfg.addr_torque_enable
+                )
+                actual = bool(val) if (dxl_comm_result == 0 and dxl_error == 0) else None
+                if actual is None or actual is not self._torque[mid]:
+                    if self._torque[mid] is not None:
+                        mismatched.append(mid)
+                    self._torque[mid] = actual
+            self.stats.torque_verifies += 1
+            self.stats.torque_mismatches += len(mismatched)
+            return mismatched
+
+    def sync_write_positions(self, targets: Dict[int, int], force: bool = False) -> int:
+        """
+        Write the goals that changed (see GoalFilter) in one sync write.
+        Returns the number of joints written; 0 means no transaction was sent.
+        """
+        with self.lock:
+            mids = self.goal_filter.changed(targets, force)
+            if not mids:
+                self.stats.goal_skipped += 1
+                return 0
+
+            for mid in mids:
+                self._goal_pack(self._goal_buf[mid], 0, targets[mid])
+            if mids != self._goal_param_ids:
+                self.sync_write.clearParam()
+                for mid in mids:
+                    if not self.sync_write.addParam(mid, self._goal_buf[mid]):
+                        raise RuntimeError(f"Failed to addParam for sync_write id={mid}")
+                self._goal_param_ids = mids
+            else:
+                for mid in mids:
+                    self.sync_write.changeParam(mid, self._goal_buf[mid])  # marks the packet for rebuild
 
-        dxl_comm_result = self.sync_write.txPacket()
-        if dxl_comm_result != 0:
-            raise RuntimeError(f"SyncWrite comm error: {self.packet.getTxRxResult(dxl_comm_result)}")
+            dxl_comm_result = self.sync_write.txPacket()
+            if dxl_comm_result != 0:
+                self.goal_filter.invalidate()
+                raise RuntimeError(f"SyncWrite comm error: {self.packet.getTxRxResult(dxl_comm_result)}")
+            self.goal_filter.commit(mids, targets)
+            self.stats.goal_writes += 1
+            if len(mids) < sum(1 for mid in self.ids if mid in targets):
+                self.stats.goal_partial += 1
+            return len(mids)
 
     def sync_read_positions(self) -> Dict[int, int]:
-        dxl_comm_result = self.sync_read.txRxPacket()
-        if dxl_comm_result != 0:
-            raise RuntimeError(f"SyncRead comm error: {self.packet.getTxRxResult(dxl_comm_result)}")
+        with self.lock:
+            dxl_comm_result = self.sync_read.txRxPacket()
+            if dxl_comm_result != 0:
+                raise RuntimeError(f"SyncRead comm error: {self.packet.getTxRxResult(dxl_comm_result)}")
 
-        out: Dict[int, int] = {}
-        for mid in self.ids:
-            if self.sync_read.isAvailable(mid, self.cfg.addr_present_position, self.cfg.len_present_position):
-                out[mid] = self.sync_read.getData(mid, self.cfg.addr_present_position, self.cfg.len_present_position)
-        return out
+            out: Dict[int, int] = {}
+            for mid in self.ids:
+                if self.sync_read.isAvailable(mid, self.cfg.addr_present_position, self.cfg.len_present_position):
+                    out[mid] = self.sync_read.getData(mid, self.cfg.addr_present_position, self.cfg.len_present_position)
+            return out
+
+    def read_telemetry(self) -> Dict[int, bytes]:
+        """
+        Raw TELEMETRY_LEN-byte block (from TELEMETRY_ADDR) of every servo that answered,
+        in one sync read transaction. Decode with pi.telemetry.decode_telemetry.
+        """
+        with self.lock:
+            dxl_comm_result = self.sync_read_telemetry.txRxPacket()
+            if dxl_comm_result != 0:
+                raise RuntimeError(f"Telemetry SyncRead comm error: {self.packet.getTxRxResult(dxl_comm_result)}")
+
+            out: Dict[int, bytes] = {}
+            for mid in self.ids:
+                # getData() only handles 1/2/4-byte values; take the whole block as received
+                if self.sync_read_telemetry.isAvailable(mid, TELEMETRY_ADDR, TELEMETRY_LEN):
+                    out[mid] = bytes(self.sync_read_telemetry.data_dict[mid][:TELEMETRY_LEN])
+            return out
+
+    def read_hardware_errors(self) -> Dict[int, int]:
+        """Hardware Error Status of every servo that answered (0 = healthy)."""
+        with self.lock:
+            dxl_comm_result = self.sync_read_hw_error.txRxPacket()
+            if dxl_comm_result != 0:
+                raise RuntimeError(f"Error status SyncRead comm error: {self.packet.getTxRxResult(dxl_comm_result)}")
+
+            out: Dict[int, int] = {}
+            for mid in self.ids:
+                if self.sync_read_hw_error.isAvailable(mid, ADDR_HARDWARE_ERROR, 1):
+                    out[mid] = self.sync_read_hw_error.getData(mid, ADDR_HARDWARE_ERROR, 1)
+            return out
 
     def ping(self, mid: int) -> bool:
-        _, dxl_comm_result, dxl_error = self.packet.ping(self.port, mid)
-        return (dxl_comm_result == 0 and dxl_error == 0)
+        with self.lock:
+            _, dxl_comm_result, dxl_error = self.packet.ping(self.port, mid)
+            return (dxl_comm_result == 0 and dxl_error == 0)
+
+
+def make_bus(dxl_cfg_y: Dict[str, Any], motor_ids: List[int], device: Optional[str] = None):
+    """
+    Bus backend selected by dynamixel.backend: "sdk" (real servos, default) or "sim".
+    `device` overrides dynamixel.device (one serial adapter per arm).
+    """
+    cfg = load_dxl_config(dxl_cfg_y)
+    if device is not None:
+        cfg = replace(cfg, device=str(device))
+    backend = str(dxl_cfg_y["dynamixel"].get("backend", "sdk")).lower()
+    beh = dxl_cfg_y.get("behavior", {}) or {}
+    deadband: Union[int, Dict[int, int]] = int(beh.get("goal_deadband_ticks", 0))
+    per_joint = beh.get("goal_deadband_per_joint") or {}
+    if per_joint:
+        deadband = {mid: int(per_joint.get(mid, deadband)) for mid in motor_ids}
+    if backend == "sdk":
+        return DynamixelBus(cfg, motor_ids, goal_deadband=deadband)
+    if backend == "sim":
+        from pi.sim_bus import SimDynamixelBus
+
+        sim = dxl_cfg_y.get("sim", {}) or {}
+        return SimDynamixelBus(
+            cfg,
+            motor_ids,
+            time_constant_s=float(sim.get("time_constant_s", 0.08)),
+            return_delay_us=float(sim.get("return_delay_us", 250.0)),
+            realtime=bool(sim.get("realtime", True)),
+            initial_position=int(sim.get("initial_position", 2048)),
+            goal_deadband=deadband,
+        )
+    raise ValueError(f"Unknown dynamixel.backend {backend!r}, expected 'sdk' or 'sim'")
@@ -0,0 +1,384 @@
+# pi/flight_log.py
+from __future__ import annotations
+
+import csv
+import json
+import math
+import mmap
+import struct
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from common.timeutil import now_s, wall_time_s
+
+# File layout: preamble (magic, header length), JSON header, then fixed-size little-endian records.
+# The header names every column with its struct code, so a reader needs nothing but the file.
+MAGIC = b"TLFLOG\x00\x01"
+_PREAMBLE = struct.Struct("<8sI")
+FORMAT_VERSION = 1
+
+FEATURE_KEYS = ("wrist_x", "wrist_y", "index_mcp_y", "pinch", "roll", "home")
+# Modes the control loop logs; stored as an index into this table (kept in the header)
+MODES = ("WAIT", "TRACK", "HOME", "ESTOP", "LOW_CONF", "SOFT_HOLD", "HARD_STOP", "FAULT")
+MODE_UNKNOWN = 255
+
+FLAG_ESTOP = 0x01
+FLAG_TORQUE = 0x02
+FLAG_HAS_POS = 0x04  # pos_j* columns hold a present read (else zeros, as in the CSV log)
+FLAG_HAS_TELEMETRY = 0x08  # vel/load/volt/temp columns hold a telemetry snapshot (else zeros)
+
+
+def _columns(joint_ids: Sequence[int], latency_stages: Sequence[str]) -> List[Tuple[str, str]]:
+    return (
+        [("wall_s", "d"), ("mono_s", "d"), ("seq", "I"), ("confidence", "f"), ("mode", "B"), ("flags", "B")]
+        + [(k, "f") for k in FEATURE_KEYS]
+        + [(f"cmd_j{i}", "i") for i in joint_ids]
+        + [(f"pos_j{i}", "i") for i in joint_ids]
+        + [(f"vel_j{i}", "i") for i in joint_ids]    # raw telemetry units, see pi/telemetry.py
+        + [(f"load_j{i}", "h") for i in joint_ids]
+        + [(f"volt_j{i}", "H") for i in joint_ids]
+        + [(f"temp_j{i}", "B") for i in joint_ids]
+        + [(f"lat_{s}_ms", "f") for s in latency_stages]  # NaN = not measured
+    )
+
+
+@dataclass
+class FlightLogStats:
+    rows: int = 0
+    dropped: int = 0     # ring full (writer thread behind): record discarded, control loop never waits
+    batches: int = 0
+    bytes: int = 0
+    max_batch: int = 0   # records in the largest single write
+
+    def summary(self) -> str:
+        return (f"rows={self.rows} dropped={self.dropped} batches={self.batches} "
+                f"max_batch={self.max_batch} bytes={self.bytes}")
+
+
+class FlightLogger:
+    """
+    Drop-in for CSVLogger (same start/write/stop) that keeps formatting and file I/O off the
+    control thread. write() packs one fixed-size record into a preallocated ring; a background
+    thread drains the ring to disk in large contiguous writes every flush_interval_s (or sooner
+    when the ring is half full). The control thread only advances `_head`, the writer only
+    `_tail`, so the two never share a lock.
+    """
+
+    def __init__(
+        self,
+        out_dir: str = "logs",
+        latency_stages: Sequence[str] = (),
+        joint_ids: Sequence[int] = (1, 2, 3, 4, 5, 6),
+        ring_records: int = 8192,
+        flush_interval_s: float = 0.25,
+        name: str = "",
+    ) -> None:
+        self.dir = Path(out_dir)
+        self.name = name  # file name suffix (one log per arm)
+        self.latency_stages = tuple(latency_stages)
+        self.joint_ids = tuple(joint_ids)
+        self.columns = _columns(self.joint_ids, self.latency_stages)
+        self.record = struct.Struct("<" + "".join(code for _, code in self.columns))
+        self.capacity = max(16, int(ring_records))
+        self.flush_interval_s = float(flush_interval_s)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.stats = FlightLogStats()
+        self.path: Optional[Path] = None
+
+        self._ring = bytearray(self.record.size * self.capacity)
+        self._head = 0  # records written into the ring (control thread)
+        self._tail = 0  # records flushed to disk (writer thread)
+        self._mode_codes = {m: i for i, m in enumerate(MODES)}
+        self._no_pos = (0,) * len(self.joint_ids)
+        self._no_telemetry = (0,) * (4 * len(self.joint_ids))
+        self._no_lat = (math.nan,) * len(self.latency_stages)
+        self._fh = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def header(self) -> Dict[str, Any]:
+        return {
+            "format": "teleop-flight-log",
+            "version": FORMAT_VERSION,
+            "created_wall_s": wall_time_s(),
+            "record_format": self.record.format,
+            "record_size": self.record.size,
+            "columns": [[name, code] for name, code in self.columns],
+            "modes": list(MODES),
+            "flags": {"estop": FLAG_ESTOP, "torque": FLAG_TORQUE, "has_pos": FLAG_HAS_POS,
+                      "has_telemetry": FLAG_HAS_TELEMETRY},
+            "joint_ids": list(self.joint_ids),
+            "latency_stages": list(self.latency_stages),
+        }
+
+    def start(self) -> Path:
+        ts = int(wall_time_s())
+        self.path = self.dir / (f"run_{ts}_{self.name}.flog" if self.name else f"run_{ts}.flog")
+        self._fh = self.path.open("wb")
+        body = json.dumps(self.header()).encode("utf-8")
+        # Pad so records start 8-byte aligned in the file (and in a mapping of it)
+        body += b" " * (-(_PREAMBLE.size + len(body)) % 8)
+        self._fh.write(_PREAMBLE.pack(MAGIC, len(body)) + body)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="pi-flight-log", daemon=True)
+        self._thread.start()
+        return self.path
+
+    def write(
+        self,
+        seq: int,
+        confidence: float,
+        mode: str,
+        estop: bool,
+        torque: bool,
+        features: Dict[str, float],
+        cmd: Dict[int, int],
+        pos: Optional[Dict[int, int]],
+        latency: Optional[List[Optional[float]]] = None,
+        telemetry=None,
+    ) -> None:
+        if self._fh is None:
+            return
+        head = self._head
+        if head - self._tail >= self.capacity:
+            self.stats.dropped += 1
+            return
+
+        flags = (FLAG_ESTOP if estop else 0) | (FLAG_TORQUE if torque else 0)
+        ids = self.joint_ids
+        if pos is None:
+            pos_v = self._no_pos
+        else:
+            flags |= FLAG_HAS_POS
+            pos_v = [pos.get(i, 0) for i in ids]
+        if telemetry is None:
+            tel_v = self._no_telemetry
+        else:
+            flags |= FLAG_HAS_TELEMETRY
+            tel_v = [d.get(i, 0) for d in (telemetry.velocity, telemetry.load, telemetry.voltage,
+                                           telemetry.temperature) for i in ids]
+        if latency is None or not self.latency_stages:
+            lat_v = self._no_lat
+        else:
+            lat_v = [math.nan if v is None else v for v in latency]
+
+        self.record.pack_into(
+            self._ring, (head % self.capacity) * self.record.size,
+            wall_time_s(), now_s(), seq & 0xFFFFFFFF, confidence,
+            self._mode_codes.get(mode, MODE_UNKNOWN), flags,
+            *[features.get(k, 0.0) for k in FEATURE_KEYS],
+            *[cmd.get(i, 0) for i in ids],
+            *pos_v,
+            *tel_v,
+            *lat_v,
+        )
+        self._head = head + 1
+        if head + 1 - self._tail >= self.capacity // 2:
+            self._wake.set()
+
+    def stop(self) -> None:
+        try:
+            self._stop.set()
+            self._wake.set()
+            if self._thread is not None:
+                self._thread.join(timeout=2.0)
+            if self._fh is not None:
+                self._drain()
+                self._fh.close()
+        finally:
+            self._thread = None
+            self._fh = None
+
+    # ---- writer thread ----
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval_s)
+            self._wake.clear()
+            try:
+                self._drain()
+            except OSError as e:
+                print("[pi] WARN flight log write failed:", e)
+                return
+
+    def _drain(self) -> None:
+        head, tail = self._head, self._tail
+        n = head - tail
+        if n <= 0:
+            return
+        size, cap = self.record.size, self.capacity
+        a, b = tail % cap, head % cap
+        ring = memoryview(self._ring)
+        if a < b:
+            self._fh.write(ring[a * size:b * size])
+        else:
+            # Wrapped (or exactly full): tail..end, then start..head
+            self._fh.write(ring[a * size:])
+            if b:
+                self._fh.write(ring[:b * size])
+        self._fh.flush()
+        self._tail = head
+        st = self.stats
+        st.rows += n
+        st.batches += 1
+        st.bytes += n * size
+        st.max_batch = max(st.max_batch, n)
+
+
+class FlightLog:
+    """
+    Memory-mapped reader. Records are decoded on access (no copy of the file); a log cut short
+    by a crash reads up to its last complete record.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self._fh = self.path.open("rb")
+        try:
+            magic, hlen = _PREAMBLE.unpack(self._fh.read(_PREAMBLE.size))
+            if magic != MAGIC:
+                raise ValueError(f"{self.path}: not a flight log")
+            self.header: Dict[str, Any] = json.loads(self._fh.read(hlen).decode("utf-8"))
+            self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._fh.close()
+            raise
+        self.columns: List[str] = [name for name, _ in self.header["columns"]]
+        self.record = struct.Struct(self.header["record_format"])
+        self.modes: List[str] = list(self.header.get("modes", ()))
+        self._index = {name: i for i, name in enumerate(self.columns)}
+        self._offset = _PREAMBLE.size + hlen
+        self._n = (len(self._mm) - self._offset) // self.record.size
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __enter__(self) -> FlightLog:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._mm.close()
+        self._fh.close()
+
+    def __getitem__(self, i: int) -> Tuple[Any, ...]:
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        return self.record.unpack_from(self._mm, self._offset + i * self.record.size)
+
+    def __iter__(self) -> Iterator[Tuple[Any, ...]]:
+        # unpack_from per record rather than iter_unpack over a memoryview: an abandoned
+        # iterator must not keep the mapping exported (close() would fail)
+        unpack, mm, size = self.record.unpack_from, self._mm, self.record.size
+        for off in range(self._offset, self._offset + self._n * size, size):
+            yield unpack(mm, off)
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        """Records as dicts, with mode decoded to its name and flags split into bools."""
+        modes = self.modes
+        for rec in self:
+            r = dict(zip(self.columns, rec))
+            m = r["mode"]
+            r["mode"] = modes[m] if m < len(modes) else "?"
+            f = r.pop("flags")
+            r["estop"] = bool(f & FLAG_ESTOP)
+            r["torque"] = bool(f & FLAG_TORQUE)
+            r["has_pos"] = bool(f & FLAG_HAS_POS)
+            r["has_telemetry"] = bool(f & FLAG_HAS_TELEMETRY)
+            yield r
+
+    def column(self, name: str) -> List[Any]:
+        i = self._index[name]
+        return [rec[i] for rec in self]
+
+    def to_numpy(self):
+        """
+        Structured array view over the mapping (numpy optional; not needed for anything else).
+        Drop the array before close().
+        """
+        import numpy as np
+
+        dtype = np.dtype([(name, "<" + code) for name, code in self.header["columns"]])
+        return np.frombuffer(self._mm, dtype=dtype, count=self._n, offset=self._offset)
+
+
+def to_csv(log_path: str | Path, csv_path: str | Path) -> int:
+    """
+    Write a flight log as the CSV layout pi/logger.py produces (what replay.py reads),
+    followed by the telemetry columns when the log has them.
+    """
+    with FlightLog(log_path) as log:
+        ids = log.header["joint_ids"]
+        stages = log.header["latency_stages"]
+        tel_cols = [c for c in log.columns if c.split("_j")[0] in ("vel", "load", "volt", "temp")]
+        header = (
+            ["wall_s", "seq", "confidence", "mode", "estop", "torque"]
+            + list(FEATURE_KEYS)
+            + [f"cmd_j{i}" for i in ids]
+            + [f"pos_j{i}" for i in ids]
+            + [f"lat_{s}_ms" for s in stages]
+            + tel_cols
+        )
+        n = 0
+        with Path(csv_path).open("w", newline="", encoding="utf-8") as fh:
+            w = csv.writer(fh)
+            w.writerow(header)
+            for r in log.rows():
+                row = [f"{r['wall_s']:.6f}", r["seq"], f"{r['confidence']:.3f}", r["mode"],
+                       int(r["estop"]), int(r["torque"])]
+                row.extend(f"{r[k]:.6f}" for k in FEATURE_KEYS)
+                row.extend(r[f"cmd_j{i}"] for i in ids)
+                row.extend(r[f"pos_j{i}"] for i in ids)
+                for s in stages:
+                    v = r[f"lat_{s}_ms"]
+                    row.append("" if math.isnan(v) else f"{v:.3f}")
+                if r["has_telemetry"]:
+                    row.extend(r[c] for c in tel_cols)
+                else:
+                    row.extend([""] * len(tel_cols))
+                w.writerow(row)
+                n += 1
+    return n
+
+
+def main() -> int:
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Inspect a flight log or convert it to CSV")
+    ap.add_argument("log_path", type=str, help="Path to a .flog produced by pi/flight_log.py")
+    ap.add_argument("--csv", nargs="?", const="", default=None,
+                    help="Convert to CSV (default: next to the log, same name)")
+    args = ap.parse_args()
+
+    path = Path(args.log_path)
+    if not path.exists():
+        print("Log not found:", path)
+        return 1
+
+    if args.csv is not None:
+        out = Path(args.csv) if args.csv else path.with_suffix(".csv")
+        n = to_csv(path, out)
+        print(f"Wrote {n} rows to {out}")
+        return 0
+
+    with FlightLog(path) as log:
+        h = log.header
+        print(f"{path}: {len(log)} records x {h['record_size']} B, version {h['version']}")
+        print(f"joints={h['joint_ids']} latency_stages={h['latency_stages']}")
+        if len(log):
+            first, last = log[0], log[-1]
+            i = log.columns.index("wall_s")
+            print(f"duration {last[i] - first[i]:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
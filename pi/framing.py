@@ -0,0 +1,163 @@
+# pi/framing.py
+from __future__ import annotations
+
+import socket
+from dataclasses import dataclass
+from typing import List, Optional
+
+from common.wire import FRAME_MAGIC, SYNC_MAGIC, WireError, frame_length
+
+
+@dataclass
+class FramerStats:
+    bytes_in: int = 0
+    lines: int = 0
+    frames: int = 0
+    overlong: int = 0     # lines dropped for exceeding max_line
+    resyncs: int = 0      # binary: bytes skipped to find the next header
+    compactions: int = 0
+
+
+class StreamFramer:
+    """
+    Receive buffer for a byte stream carrying NDJSON lines or binary frames.
+
+    - One preallocated bytearray; the socket writes straight into it with recv_into().
+    - Consumed data is only dropped by advancing an offset; the unconsumed tail is moved
+      to the front when free space runs low, so each byte is copied O(1) times.
+    - The newline scan resumes where it stopped, so a partial line is never rescanned.
+    - Lines are decoded exactly once, directly from the buffer.
+
+    memoryviews returned by next_frame()/frames() point into the buffer and are valid
+    until the next recv_into()/feed().
+    """
+
+    def __init__(self, capacity: int = 64 * 1024, max_line: int = 4096) -> None:
+        if capacity < 2 * max_line:
+            raise ValueError("capacity must be at least 2 * max_line")
+        self.max_line = int(max_line)
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._start = 0      # first unconsumed byte
+        self._end = 0        # end of received data
+        self._scan = 0       # no '\n' in [_start, _scan)
+        self._discard = False  # inside an overlong line: drop until the next '\n'
+        self.stats = FramerStats()
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def clear(self) -> None:
+        self._start = self._end = self._scan = 0
+        self._discard = False
+
+    def _make_room(self) -> int:
+        """Move unconsumed bytes to the front if free space is low. Returns free space."""
+        cap = len(self._buf)
+        if cap - self._end >= self.max_line:
+            return cap - self._end
+        n = self._end - self._start
+        if n:
+            self._buf[0:n] = self._view[self._start : self._end]
+        self._scan -= self._start
+        self._start = 0
+        self._end = n
+        self.stats.compactions += 1
+        return cap - n
+
+    def recv_into(self, sock: socket.socket) -> int:
+        """Read whatever the socket has (one recv) into the buffer. Raises on disconnect."""
+        if self._make_room() == 0:
+            # Nobody is consuming (or it's garbage that never frames): start over
+            self.stats.overlong += 1
+            self.clear()
+        n = sock.recv_into(self._view[self._end :])
+        if n == 0:
+            raise ConnectionError("client disconnected")
+        self._end += n
+        self.stats.bytes_in += n
+        return n
+
+    def feed(self, data: bytes) -> None:
+        """Append bytes from elsewhere (tests, benchmarks, replaying captures)."""
+        mv = memoryview(data)
+        while len(mv):
+            free = self._make_room()
+            if free == 0:
+                raise BufferError("StreamFramer full: consume lines/frames before feeding more")
+            k = min(len(mv), free)
+            self._view[self._end : self._end + k] = mv[:k]
+            self._end += k
+            self.stats.bytes_in += k
+            mv = mv[k:]
+
+    # --- NDJSON ---
+
+    def next_line(self) -> Optional[str]:
+        """Next complete, non-empty line (stripped), or None if none is buffered."""
+        buf = self._buf
+        while True:
+            i = buf.find(b"\n", self._scan, self._end)
+            if i < 0:
+                self._scan = self._end
+                if self._end - self._start > self.max_line:
+                    # Overlong line: drop what we have and everything up to the next '\n'
+                    self.stats.overlong += 1
+                    self._start = self._scan = self._end
+                    self._discard = True
+                return None
+
+            start = self._start
+            self._start = self._scan = i + 1
+            if self._discard:
+                self._discard = False
+                continue
+            if i - start > self.max_line:
+                self.stats.overlong += 1
+                continue
+            line = str(self._view[start:i], "utf-8", "replace").strip()
+            if line:
+                self.stats.lines += 1
+                return line
+
+    def lines(self) -> List[str]:
+        """Batch API: every complete line currently buffered, oldest first."""
+        out: List[str] = []
+        while True:
+            line = self.next_line()
+            if line is None:
+                return out
+            out.append(line)
+
+    # --- binary frames (common/wire.py) ---
+
+    def next_frame(self) -> Optional[memoryview]:
+        data = self._view[: self._end]
+        while self._end - self._start > 0:
+            try:
+                n = frame_length(data, self._start)
+            except WireError:
+                # Lost sync: skip to the next possible header byte
+                self.stats.resyncs += 1
+                i = self._buf.find(FRAME_MAGIC, self._start + 1, self._end)
+                j = self._buf.find(SYNC_MAGIC, self._start + 1, self._end)
+                if i < 0 or 0 <= j < i:
+                    i = j
+                self._start = self._scan = i if i >= 0 else self._end
+                continue
+            if n is None or self._end - self._start < n:
+                return None
+            start = self._start
+            self._start = self._scan = start + n
+            self.stats.frames += 1
+            return self._view[start : start + n]
+        return None
+
+    def frames(self) -> List[memoryview]:
+        """Batch API: every complete frame currently buffered, oldest first."""
+        out: List[memoryview] = []
+        while True:
+            fr = self.next_frame()
+            if fr is None:
+                return out
+            out.append(fr)
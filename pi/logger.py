@@ -4,7 +4,7 @@ from __future__ import annotations
 import csv
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Sequence
 
 from common.timeutil import wall_time_s
 
@@ -16,8 +16,17 @@ class LogState:
 
 
 class CSVLogger:
-    def __init__(self, out_dir: str = "logs") -> None:
+    def __init__(
+        self,
+        out_dir: str = "logs",
+        latency_stages: Sequence[str] = (),
+        joint_ids: Sequence[int] = (1, 2, 3, 4, 5, 6),
+        name: str = "",
+    ) -> None:
         self.dir = Path(out_dir)
+        self.latency_stages = tuple(latency_stages)
+        self.joint_ids = tuple(joint_ids)
+        self.name = name  # file name suffix (one log per arm)
         self.dir.mkdir(parents=True, exist_ok=True)
         self.state: Optional[LogState] = None
         self._fh = None
@@ -25,15 +34,16 @@ class CSVLogger:
 
     def start(self) -> Path:
         ts = int(wall_time_s())
-        path = self.dir / f"run_{ts}.csv"
+        path = self.dir / (f"run_{ts}_{self.name}.csv" if self.name else f"run_{ts}.csv")
         self._fh = path.open("w", newline="", encoding="utf-8")
         self.state = LogState(path=path)
 
         header = (
             ["wall_s", "seq", "confidence", "mode", "estop", "torque"]
             + ["wrist_x", "wrist_y", "index_mcp_y", "pinch", "roll", "home"]
-            + [f"cmd_j{i}" for i in range(1, 7)]
-            + [f"pos_j{i}" for i in range(1, 7)]
+            + [f"cmd_j{i}" for i in self.joint_ids]
+            + [f"pos_j{i}" for i in self.joint_ids]
+            + [f"lat_{s}_ms" for s in self.latency_stages]
         )
         self._writer = csv.writer(self._fh)
         self._writer.writerow(header)
@@ -50,6 +60,8 @@ class CSVLogger:
         features: Dict[str, float],
         cmd: Dict[int, int],
         pos: Optional[Dict[int, int]],
+        latency: Optional[List[Optional[float]]] = None,
+        telemetry=None,  # full servo telemetry is only kept in the flight log
     ) -> None:
         if not self._writer or not self.state:
             return
@@ -64,15 +76,21 @@ class CSVLogger:
         for k in ["wrist_x", "wrist_y", "index_mcp_y", "pinch", "roll", "home"]:
             row.append(f"{float(features.get(k, 0.0)):.6f}")
 
-        for i in range(1, 7):
+        for i in self.joint_ids:
             row.append(int(cmd.get(i, 0)))
 
         if pos is None:
-            row.extend([0] * 6)
+            row.extend([0] * len(self.joint_ids))
         else:
-            for i in range(1, 7):
+            for i in self.joint_ids:
                 row.append(int(pos.get(i, 0)))
 
+        if self.latency_stages:
+            if latency is None:
+                row.extend([""] * len(self.latency_stages))
+            else:
+                row.extend("" if v is None else f"{v:.3f}" for v in latency)
+
         self._writer.writerow(row)
         self.state.rows += 1
         if self.state.rows % 10 == 0:
@@ -1,28 +1,264 @@
 # pi/net_receiver.py
 from __future__ import annotations
 
+from abc import ABC, abstractmethod
 import json
 import socket
 from dataclasses import dataclass
-from typing import Dict, Optional, Tuple
+from typing import Any, Dict, Iterator, Optional, Tuple, Union
 
-from common.message_schema import validate_cmd, to_command, TeleopCommand
+from common.mailbox import LatestMailbox
+from common.message_schema import CommandError, TeleopCommand, decode_cmd
 from common.timeutil import now_s
+from common.wire import (
+    FRAME_MAGIC,
+    SYNC_MAGIC,
+    SYNC_PING,
+    SYNC_PONG,
+    WireError,
+    decode_frame,
+    decode_sync,
+    encode_sync,
+    hello_ack_msg,
+    sync_msg,
+)
+from pi.clock_sync import ClockSync
+from pi.framing import StreamFramer
+
+MAX_DATAGRAM = 2048
 
 
 @dataclass
 class NetStats:
-    last_seq: int = -1
+    last_seq: int = -1          # newest seq applied
     last_recv_mono_s: float = 0.0
     rx_count: int = 0
-    seq_gaps: int = 0
+    seq_gaps: int = 0           # seqs skipped over (lost, or arrived late)
+    reordered: int = 0          # late/duplicate packets dropped (seq <= last_seq)
+    restarts: int = 0           # sender seq counter restarted (new client)
+    superseded: int = 0         # buffered messages skipped because a newer one was already there
+    bad_frames: int = 0         # malformed messages dropped (binary frames and NDJSON lines)
 
 
-class NDJSONTCPServer:
-    def __init__(self, host: str, port: int) -> None:
+class SeqFilter:
+    """
+    Keeps only commands newer than the newest one applied.
+    Losses show up as seq_gaps, out-of-order arrivals as reordered.
+    A large backwards jump is taken as the sender restarting its counter.
+    """
+
+    def __init__(self, stats: NetStats, restart_window: int = 1000) -> None:
+        self.stats = stats
+        self.restart_window = int(restart_window)
+
+    def reset(self) -> None:
+        self.stats.last_seq = -1
+
+    def accept(self, seq: int, superseded: int = 0) -> bool:
+        """superseded: older messages the caller skipped on purpose (not counted as gaps)."""
+        st = self.stats
+        last = st.last_seq
+        if last < 0 or seq == last + 1:
+            pass
+        elif seq > last:
+            st.seq_gaps += max(0, seq - last - 1 - superseded)
+        elif last - seq > self.restart_window:
+            st.restarts += 1
+        else:
+            st.reordered += 1
+            return False
+        st.last_seq = seq
+        return True
+
+
+@dataclass
+class RouterStats:
+    routed: int = 0
+    unknown_arm: int = 0        # commands for an arm this Pi doesn't drive (dropped)
+
+
+class CommandRouter:
+    """
+    Per-arm mailboxes behind the single-mailbox interface pump() publishes to: each command goes
+    to the mailbox of its `arm`, so every arm's control loop only ever sees its own newest command.
+    """
+
+    def __init__(self, arm_ids) -> None:
+        self.arm_ids = tuple(int(a) for a in arm_ids)
+        self.mailboxes: Dict[int, LatestMailbox[TeleopCommand]] = {a: LatestMailbox() for a in self.arm_ids}
+        self.stats = RouterStats()
+        self._warned: set = set()
+
+    def publish(self, cmd: TeleopCommand) -> bool:
+        mb = self.mailboxes.get(cmd.arm)
+        if mb is None:
+            self.stats.unknown_arm += 1
+            if cmd.arm not in self._warned:
+                self._warned.add(cmd.arm)
+                print(f"[pi] DROP command for unknown arm {cmd.arm} (arms: {list(self.arm_ids)})")
+            return False
+        self.stats.routed += 1
+        return mb.publish(cmd)
+
+
+CommandSink = Union[LatestMailbox[TeleopCommand], CommandRouter]
+
+
+class CommandReceiver(ABC):
+    """
+    Transport-independent receive side. pi/server.py only uses this interface:
+      open()  -> wait for / bind the client
+      pump(mailbox) -> blocking receive loop, publishes the newest valid command
+                       (to a LatestMailbox, or per arm through a CommandRouter)
+      close()
+    Clock sync: send_ping() pushes a ping to the client; pongs arriving on the command
+    stream are handed to `clock` (set by the server) and never reach the mailbox.
+    """
+
+    def __init__(self) -> None:
+        self.stats = NetStats()
+        self.seq = SeqFilter(self.stats)
+        self.rx_mono_s = 0.0  # when the bytes being decoded arrived (latency tracing)
+        self.clock: Optional[ClockSync] = None
+
+    @abstractmethod
+    def open(self) -> None:
+        ...
+
+    @abstractmethod
+    def pump(self, mailbox: CommandSink) -> None:
+        ...
+
+    @abstractmethod
+    def close(self) -> None:
+        ...
+
+    @abstractmethod
+    def send_ping(self, sync_id: int, t0: float) -> bool:
+        """Send a clock-sync ping to the client; False if there is nobody to send to yet."""
+
+    @staticmethod
+    def _ping_payload(binary: bool, sync_id: int, t0: float) -> bytes:
+        if binary:
+            return encode_sync(SYNC_PING, sync_id, t0)
+        return (json.dumps(sync_msg(SYNC_PING, sync_id, t0), separators=(",", ":")) + "\n").encode("utf-8")
+
+    @staticmethod
+    def _is_sync(item) -> bool:
+        # Cheap check for skipped batch items: pong lines are written with "type" first
+        if isinstance(item, str):
+            return item.startswith('{"type":"pong"')
+        return len(item) > 0 and item[0] == SYNC_MAGIC
+
+    def _on_pong(self, sync_id: int, t0: float, t1: float, t2: float) -> None:
+        if self.clock is not None:
+            self.clock.on_pong(sync_id, t0, t1, t2, self.rx_mono_s or now_s())
+
+    def _publish(self, cmd: TeleopCommand, mailbox: CommandSink, superseded: int = 0) -> bool:
+        t = now_s()
+        self.stats.rx_count += 1
+        self.stats.last_recv_mono_s = t
+        if not self.seq.accept(cmd.seq, superseded):
+            return False
+        cmd.t_rx = self.rx_mono_s or t
+        cmd.t_decoded = t
+        mailbox.publish(cmd)
+        return True
+
+    # _handle_* return True if a command was published
+
+    def _handle_line(self, line: str, mailbox: CommandSink, superseded: int = 0) -> bool:
+        cmd = self._decode_line(line)
+        return cmd is not None and self._publish(cmd, mailbox, superseded)
+
+    def _handle_frame(self, frame, mailbox: CommandSink, superseded: int = 0) -> bool:
+        cmd = self._decode_frame(frame)
+        return cmd is not None and self._publish(cmd, mailbox, superseded)
+
+    # _decode_* return the command, or None for pongs (handled here) and dropped messages
+
+    def _decode_line(self, line: str) -> Optional[TeleopCommand]:
+        try:
+            msg = json.loads(line)
+        except ValueError as e:
+            self.stats.bad_frames += 1
+            print(f"[pi] DROP bad json: {e}")
+            return None
+        if type(msg) is dict and msg.get("type") == "pong":
+            try:
+                self._on_pong(int(msg["id"]), float(msg["t0"]), float(msg["t1"]), float(msg["t2"]))
+            except (KeyError, TypeError, ValueError, OverflowError) as e:
+                self.stats.bad_frames += 1
+                print(f"[pi] DROP bad pong: {e}")
+            return None
+        try:
+            return decode_cmd(msg)
+        except CommandError as e:
+            self.stats.bad_frames += 1
+            print(f"[pi] DROP invalid msg: {e}")
+            return None
+
+    def _decode_frame(self, frame) -> Optional[TeleopCommand]:
+        if frame[0] == SYNC_MAGIC:
+            try:
+                kind, sid, t0, t1, t2 = decode_sync(frame)
+            except WireError as e:
+                self.stats.bad_frames += 1
+                print(f"[pi] DROP bad sync frame: {e}")
+                return None
+            if kind == SYNC_PONG:
+                self._on_pong(sid, t0, t1, t2)
+            return None
+        try:
+            return decode_frame(frame)
+        except WireError as e:
+            self.stats.bad_frames += 1
+            print(f"[pi] DROP bad frame: {e}")
+            return None
+
+    def _pump_batch_per_arm(self, batch: list, decode, mailbox: CommandRouter) -> None:
+        """
+        Multi-arm form of the newest-only batch rule: the newest command of *each* arm is kept.
+        Decodes from the end until every arm has one, then publishes those oldest first so the
+        (stream-wide) seq filter sees them in order. Pongs among the skipped items still count.
+        """
+        n_arms = len(mailbox.arm_ids)
+        newest: Dict[int, Tuple[int, TeleopCommand]] = {}
+        for k in range(len(batch) - 1, -1, -1):
+            item = batch[k]
+            if len(newest) == n_arms:
+                if self._is_sync(item):
+                    decode(item)
+                continue
+            cmd = decode(item)
+            if cmd is not None and cmd.arm not in newest:
+                newest[cmd.arm] = (k, cmd)
+        prev = -1
+        for k, cmd in sorted(newest.values(), key=lambda e: e[0]):
+            skipped = k - prev - 1
+            if self._publish(cmd, mailbox, superseded=skipped):
+                self.stats.superseded += skipped
+            prev = k
+
+
+class NDJSONTCPServer(CommandReceiver):
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        framing: str = "ndjson",
+        handshake_timeout_s: float = 2.0,
+        max_line: int = 4096,
+    ) -> None:
+        super().__init__()
         self.host = host
         self.port = int(port)
-        self.stats = NetStats()
+        # Framing we are willing to speak. NDJSON is always accepted as a fallback.
+        self.framing = framing
+        self.handshake_timeout_s = float(handshake_timeout_s)
+        self.conn: Optional[socket.socket] = None
+        self.framer = StreamFramer(max_line=max_line)
+        self.active_framing: Optional[str] = None  # after the handshake
 
     def listen_accept(self) -> socket.socket:
         srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -33,22 +269,190 @@ class NDJSONTCPServer:
         conn, addr = srv.accept()
         print(f"[pi] Client connected from {addr}")
         srv.close()
+        self.framer.clear()
+        self.seq.reset()
+        if self.clock is not None:
+            self.clock.reset()
         return conn
 
-    def recv_loop(self, conn: socket.socket):
-        buf = ""
+    def open(self) -> None:
+        self.active_framing = None
+        self.conn = self.listen_accept()
+
+    def send_ping(self, sync_id: int, t0: float) -> bool:
+        conn, framing = self.conn, self.active_framing
+        if conn is None or framing is None:
+            return False
+        conn.sendall(self._ping_payload(framing == "binary", sync_id, t0))
+        return True
+
+    def close(self) -> None:
+        self.active_framing = None
+        if self.conn:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+        self.conn = None
+
+    def recv_loop(self, conn: socket.socket) -> Iterator[str]:
+        conn.settimeout(0.5)
+        rx = self.framer
+        while True:
+            line = rx.next_line()
+            if line is not None:
+                yield line
+                continue
+            try:
+                rx.recv_into(conn)
+            except socket.timeout:
+                continue
+
+    def recv_batches(self, conn: socket.socket, binary: bool) -> Iterator[list]:
+        """Yield every complete line (or binary frame) that arrived with each recv, as one list."""
         conn.settimeout(0.5)
+        rx = self.framer
+        while True:
+            batch = rx.frames() if binary else rx.lines()
+            if batch:
+                yield batch
+            try:
+                rx.recv_into(conn)
+            except socket.timeout:
+                continue
+            self.rx_mono_s = now_s()
+
+    def negotiate(self, conn: socket.socket) -> Tuple[str, Optional[str]]:
+        """
+        Optional handshake: a client that wants binary framing sends a JSON hello line first.
+        Returns (framing, first_line); first_line is a command line from a client that
+        skipped the handshake (plain NDJSON sender) and must still be processed.
+        """
+        line = next(self.recv_loop(conn))
+        try:
+            msg = json.loads(line)
+        except ValueError:
+            return "ndjson", line
+        if not isinstance(msg, dict) or msg.get("type") != "hello":
+            return "ndjson", line
+
+        wanted = str(msg.get("framing", "ndjson"))
+        framing = wanted if wanted == self.framing else "ndjson"
+        ack = json.dumps(hello_ack_msg(framing), separators=(",", ":")) + "\n"
+        conn.settimeout(self.handshake_timeout_s)
+        conn.sendall(ack.encode("utf-8"))
+        print(f"[pi] Client requested {wanted} framing, using {framing}")
+        return framing, None
+
+    def pump(self, mailbox: CommandSink) -> None:
+        """
+        Receive thread body: decode + validate every message, publish only the newest command.
+        Returns (via exception) when the client disconnects.
+        """
+        conn = self.conn
+        if conn is None:
+            raise RuntimeError("Not connected")
+        framing, first = self.negotiate(conn)
+        self.active_framing = framing
+        if first is not None:
+            self._handle_line(first, mailbox)
+
+        # After a stall several messages can be buffered at once. Only the newest one matters:
+        # decode from the end of the batch and skip everything older than the first valid one.
+        # Clock-sync pongs among the skipped items are still processed.
+        handle = self._handle_frame if framing == "binary" else self._handle_line
+        decode = self._decode_frame if framing == "binary" else self._decode_line
+        is_sync = self._is_sync
+        per_arm = isinstance(mailbox, CommandRouter) and len(mailbox.arm_ids) > 1
+        for batch in self.recv_batches(conn, binary=(framing == "binary")):
+            if per_arm and len(batch) > 1:
+                self._pump_batch_per_arm(batch, decode, mailbox)
+                continue
+            for k in range(len(batch) - 1, -1, -1):
+                if handle(batch[k], mailbox, superseded=k):
+                    self.stats.superseded += k
+                    for item in batch[:k]:
+                        if is_sync(item):
+                            handle(item, mailbox)
+                    break
+
+
+class UDPCommandReceiver(CommandReceiver):
+    """
+    One command per datagram, no handshake. Each datagram is either a binary frame
+    (starts with FRAME_MAGIC) or one JSON line, so the sender's framing needs no negotiation.
+    Lost or late datagrams are never retransmitted: the newest seq simply wins.
+    """
+
+    def __init__(self, host: str, port: int) -> None:
+        super().__init__()
+        self.host = host
+        self.port = int(port)
+        self.sock: Optional[socket.socket] = None
+        self.peer: Optional[Tuple[str, int]] = None
+        self._peer_binary = False  # answer pings in the framing the peer sends
+        self._buf = bytearray(MAX_DATAGRAM)
+
+    def open(self) -> None:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind((self.host, self.port))
+        s.settimeout(0.5)
+        self.sock = s
+        print(f"[pi] Listening (UDP) on {self.host}:{self.port} ...")
+
+    def close(self) -> None:
+        if self.sock:
+            try:
+                self.sock.close()
+            except Exception:
+                pass
+        self.sock = None
+
+    def send_ping(self, sync_id: int, t0: float) -> bool:
+        sock, peer = self.sock, self.peer
+        if sock is None or peer is None:
+            return False
+        sock.sendto(self._ping_payload(self._peer_binary, sync_id, t0), peer)
+        return True
+
+    def pump(self, mailbox: CommandSink) -> None:
+        sock = self.sock
+        if sock is None:
+            raise RuntimeError("Not bound")
+        view = memoryview(self._buf)
         while True:
             try:
-                data = conn.recv(4096)
-                if not data:
-                    raise ConnectionError("client disconnected")
-                buf += data.decode("utf-8", errors="replace")
-                while "\n" in buf:
-                    line, buf = buf.split("\n", 1)
-                    line = line.strip()
-                    if not line:
-                        continue
-                    yield line
+                n, addr = sock.recvfrom_into(self._buf)
             except socket.timeout:
                 continue
+            self.rx_mono_s = now_s()
+            if addr != self.peer:
+                # New sender (or laptop restarted on a new port): its seq starts over
+                print(f"[pi] UDP sender {addr}")
+                self.peer = addr
+                self.seq.reset()
+            if n == 0:
+                continue
+            if self._buf[0] == FRAME_MAGIC or self._buf[0] == SYNC_MAGIC:
+                self._peer_binary = True
+                self._handle_frame(view[:n], mailbox)
+            else:
+                self._peer_binary = False
+                self._handle_line(bytes(view[:n]).decode("utf-8", errors="replace").strip(), mailbox)
+
+
+def make_receiver(net_cfg: Dict[str, Any], host: str = "0.0.0.0") -> CommandReceiver:
+    port = int(net_cfg["tcp"]["pi_port"])
+    proto = net_cfg.get("protocol", {})
+    transport = str(proto.get("transport", "tcp"))
+    if transport == "udp":
+        return UDPCommandReceiver(host, port)
+    if transport == "tcp":
+        return NDJSONTCPServer(
+            host,
+            port,
+            framing=str(proto.get("framing", "ndjson")),
+            max_line=int(proto.get("max_line_bytes", 4096)),
+        )
+    raise ValueError(f"Unknown transport: {transport}")
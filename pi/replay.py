@@ -1,81 +1,263 @@
 # pi/replay.py
 from __future__ import annotations
 
+import bisect
 import csv
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from common.config import load_calibration, load_yaml
-from common.timeutil import sleep_s
-from pi.dxl_driver import DxlConfig, DynamixelBus
+from common.latency import RollingHistogram
+from common.timeutil import now_s, sleep_s
+from pi.arms import load_arm_configs
+from pi.dxl_driver import make_bus
+from pi.flight_log import FlightLog
+
+# (log time s, seq, joint targets). Log time is the Pi's monotonic clock for flight logs
+# (immune to NTP steps during the recording); CSV logs only have wall time.
+Sample = Tuple[float, int, Dict[int, int]]
+
+
+@dataclass
+class ReplayStats:
+    writes: int = 0
+    skipped: int = 0             # samples dropped to catch up (the next one was already due)
+    late: int = 0                # writes issued more than late_threshold_ms after their deadline
+    late_threshold_ms: float = 1.0
+    lateness: RollingHistogram = field(default_factory=lambda: RollingHistogram(4096))
+
+    def summary(self) -> str:
+        p50, p99 = self.lateness.percentiles((50.0, 99.0))
+        return (f"writes={self.writes} skipped={self.skipped} late={self.late} "
+                f"lateness p50={p50:.2f} p99={p99:.2f} max={self.lateness.max_ms:.2f}ms")
+
+
+# ---- sources (lazy: nothing is loaded up front) ----
+
+def _csv_samples(path: Path, ids: List[int]) -> Iterator[Sample]:
+    with path.open("r", encoding="utf-8") as f:
+        for r in csv.DictReader(f):
+            yield float(r["wall_s"]), int(r["seq"]), {j: int(r[f"cmd_j{j}"]) for j in ids}
+
+
+def _flight_samples(log: FlightLog, ids: List[int], first: int) -> Iterator[Sample]:
+    cols = log.columns
+    i_t, i_seq = cols.index("mono_s"), cols.index("seq")
+    i_cmd = [(j, cols.index(f"cmd_j{j}")) for j in ids]
+    for k in range(first, len(log)):
+        rec = log[k]
+        yield rec[i_t], rec[i_seq], {j: rec[i] for j, i in i_cmd}
+
+
+class _Column:
+    """Read-only sequence over one flight-log column, so bisect can search the mapping directly."""
+
+    def __init__(self, log: FlightLog, name: str) -> None:
+        self.log = log
+        self.i = log.columns.index(name)
+
+    def __len__(self) -> int:
+        return len(self.log)
+
+    def __getitem__(self, k: int):
+        return self.log[k][self.i]
+
+
+def _first_seq_at_or_after(log: FlightLog, start_seq: int, first: int) -> int:
+    # seq is not monotonic across a log (the laptop restarting its counter is accepted by the
+    # SeqFilter), so this is a scan, not a bisection
+    i_seq = log.columns.index("seq")
+    for k in range(first, len(log)):
+        if log[k][i_seq] >= start_seq:
+            return k
+    return len(log)
+
+
+def open_samples(
+    path: Path, ids: List[int], start_seq: Optional[int] = None, start_s: Optional[float] = None
+) -> Tuple[Iterator[Sample], Optional[float]]:
+    """
+    Stream (t, seq, targets) from a .flog or .csv log, starting at the first row with
+    t >= log start + start_s and, from there, the first row with seq >= start_seq. Returns the
+    samples and the log's start time (None if the log is empty). Flight logs seek by time with a
+    bisection over the mapping's mono_s column; everything else is a scan.
+    """
+    if path.suffix == ".flog":
+        log = FlightLog(path)
+        if not len(log):
+            log.close()
+            return iter(()), None
+        t_first = log[0][log.columns.index("mono_s")]
+        first = 0
+        if start_s is not None:
+            first = bisect.bisect_left(_Column(log, "mono_s"), t_first + start_s)
+        if start_seq is not None:
+            first = _first_seq_at_or_after(log, start_seq, first)
+
+        def gen() -> Iterator[Sample]:
+            try:
+                yield from _flight_samples(log, ids, first)
+            finally:
+                log.close()
+
+        return gen(), t_first
+
+    rows = _csv_samples(path, ids)
+    head = next(rows, None)
+    if head is None:
+        return iter(()), None
+    t_first = head[0]
+
+    def gen_csv() -> Iterator[Sample]:
+        started = False
+        for s in _chain(head, rows):
+            # Once the start row is found, everything after it plays (seq may restart later on)
+            if not started:
+                if start_s is not None and s[0] < t_first + start_s:
+                    continue
+                if start_seq is not None and s[1] < start_seq:
+                    continue
+                started = True
+            yield s
+
+    return gen_csv(), t_first
+
+
+def _chain(head: Sample, rest: Iterator[Sample]) -> Iterator[Sample]:
+    yield head
+    yield from rest
+
+
+# ---- resampling ----
+
+def resample(samples: Iterator[Sample], rate_hz: float, max_gap_s: float = 0.25) -> Iterator[Sample]:
+    """
+    Linear interpolation of logged setpoints onto a fixed grid of rate_hz (log time).
+    Across gaps longer than max_gap_s (logging paused, hold) the last pose is held instead of
+    sweeping slowly towards the next one.
+    """
+    period = 1.0 / float(rate_hz)
+    a = next(samples, None)
+    if a is None:
+        return
+    t = a[0]
+    for b in samples:
+        t_a, t_b = a[0], b[0]
+        span = t_b - t_a
+        while t < t_b:
+            if span <= 0.0 or span > max_gap_s:
+                yield t, a[1], a[2]
+            else:
+                u = (t - t_a) / span
+                pa, pb = a[2], b[2]
+                yield t, a[1], {j: int(round(pa[j] + (pb[j] - pa[j]) * u)) for j in pa}
+            t += period
+        a = b
+    yield a
+
+
+# ---- playback ----
+
+def play(
+    samples: Iterator[Sample],
+    write,
+    speed: float = 1.0,
+    stats: Optional[ReplayStats] = None,
+    report_period_s: float = 5.0,
+) -> ReplayStats:
+    """
+    Write each sample at its absolute deadline: start + (t - t_first) / speed on the monotonic
+    clock, so write time and sleep overshoot never accumulate. When falling behind, a sample
+    whose successor is already due is skipped rather than written late.
+    """
+    stats = stats or ReplayStats()
+    speed = max(0.01, float(speed))
+    cur = next(samples, None)
+    if cur is None:
+        return stats
+    t_first = cur[0]
+    start = now_s()
+    next_report = start + report_period_s
+    while cur is not None:
+        nxt = next(samples, None)
+        if nxt is not None and now_s() >= start + (nxt[0] - t_first) / speed:
+            stats.skipped += 1
+            cur = nxt
+            continue
+
+        deadline = start + (cur[0] - t_first) / speed
+        sleep_s(deadline - now_s())
+        late_ms = max(0.0, now_s() - deadline) * 1e3
+        stats.lateness.record(late_ms)
+        if late_ms > stats.late_threshold_ms:
+            stats.late += 1
+        write(cur[2])
+        stats.writes += 1
+
+        if report_period_s > 0 and deadline >= next_report:
+            next_report += report_period_s
+            print(f"[pi] replay t={cur[0] - t_first:.1f}s seq={cur[1]} {stats.summary()}")
+        cur = nxt
+    return stats
 
 
 def main() -> int:
     import argparse
 
     ap = argparse.ArgumentParser()
-    ap.add_argument("csv_path", type=str, help="Path to a log CSV produced by pi/logger.py")
+    ap.add_argument("log_path", type=str, help="Flight log (.flog) or CSV produced by the Pi server")
     ap.add_argument("--speed", type=float, default=1.0, help="Playback speed multiplier (1.0 = real-time)")
+    ap.add_argument("--start-seq", type=int, default=None, help="Start at the first row with this seq or later")
+    ap.add_argument("--start-s", type=float, default=None, help="Start this many seconds into the log")
+    ap.add_argument("--rate-hz", type=float, default=0.0,
+                    help="Interpolate to this bus write rate (0 = write logged rows only)")
+    ap.add_argument("--arm", type=str, default=None,
+                    help="Arm name from dynamixel.yaml `arms` to replay on (default: the first arm)")
     args = ap.parse_args()
 
-    net_cfg = load_yaml("config/network.yaml")
     dxl_cfg_y = load_yaml("config/dynamixel.yaml")
-    calib = load_calibration("config/robot_calibration.json")
-
-    ids = [1, 2, 3, 4, 5, 6]
-
-    dxy = dxl_cfg_y["dynamixel"]
-    cty = dxl_cfg_y["control_table"]
-    dxl_cfg = DxlConfig(
-        device=str(dxy["device"]),
-        baudrate=int(dxy["baudrate"]),
-        protocol_version=float(dxy["protocol_version"]),
-        addr_torque_enable=int(cty["addr_torque_enable"]),
-        addr_goal_position=int(cty["addr_goal_position"]),
-        addr_present_position=int(cty["addr_present_position"]),
-        len_goal_position=int(cty["len_goal_position"]),
-        len_present_position=int(cty["len_present_position"]),
-    )
-
-    path = Path(args.csv_path)
-    if not path.exists():
-        print("CSV not found:", path)
+    arms = load_arm_configs(dxl_cfg_y)
+    arm = next((a for a in arms if a.name == args.arm), None) if args.arm else arms[0]
+    if arm is None:
+        print(f"Unknown arm {args.arm!r}, configured: {[a.name for a in arms]}")
         return 1
+    calib = load_calibration(arm.calibration, arm.motor_ids)
 
-    rows: List[Dict[str, str]] = []
-    with path.open("r", encoding="utf-8") as f:
-        rd = csv.DictReader(f)
-        for r in rd:
-            rows.append(r)
+    ids = list(arm.motor_ids)
+
+    path = Path(args.log_path)
+    if not path.exists():
+        print("Log not found:", path)
+        return 1
 
-    if len(rows) < 2:
-        print("Not enough rows to replay.")
+    samples, t_first = open_samples(path, ids, start_seq=args.start_seq, start_s=args.start_s)
+    if t_first is None:
+        print("Nothing to replay.")
         return 1
+    if args.rate_hz > 0:
+        samples = resample(samples, args.rate_hz)
 
-    bus = DynamixelBus(dxl_cfg, ids)
+    bus = make_bus(dxl_cfg_y, ids, device=arm.device)
     bus.open()
     bus.torque_all(True)
 
-    t0 = float(rows[0]["wall_s"])
-    for i in range(1, len(rows)):
-        r_prev = rows[i - 1]
-        r = rows[i]
-        t_prev = float(r_prev["wall_s"])
-        t = float(r["wall_s"])
-        dt = max(0.0, (t - t_prev) / max(0.1, args.speed))
-
-        targets = {j: int(r[f"cmd_j{j}"]) for j in ids}
+    def write(targets: Dict[int, int]) -> None:
         # Clamp to calibration hard limits (extra safety)
         for j in ids:
             lo, hi = calib[j].range_min, calib[j].range_max
             targets[j] = max(lo, min(hi, targets[j]))
-
-        sleep_s(dt)
         bus.sync_write_positions(targets)
 
-    bus.torque_all(False)
-    bus.close()
-    print("Replay complete.")
+    try:
+        stats = play(samples, write, speed=args.speed)
+    except KeyboardInterrupt:
+        print("Replay interrupted.")
+        return 1
+    finally:
+        bus.torque_all(False)
+        bus.close()
+    print(f"Replay complete: {stats.summary()}")
     return 0
 
 
@@ -1,8 +1,10 @@
 # pi/safety.py
 from __future__ import annotations
 
+import math
+from array import array
 from dataclasses import dataclass
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 from common.config import JointCalib
 from common.timeutil import now_s
@@ -16,32 +18,197 @@ class SafetyState:
     last_cmd_seq: int = -1
 
 
+@dataclass
+class JointLimits:
+    max_velocity: float = 0.0  # ticks/s, 0 = unlimited
+    max_accel: float = 0.0     # ticks/s^2, 0 = unlimited
+
+
+def load_joint_limits(limits_cfg: Optional[Dict], ids: List[int]) -> Dict[int, JointLimits]:
+    """
+    limits:
+      max_velocity: 3000      # defaults for every joint
+      max_accel: 20000
+      per_joint:              # optional overrides by motor id
+        6: {max_velocity: 6000}
+    """
+    cfg = limits_cfg or {}
+    per_joint = {int(k): v or {} for k, v in (cfg.get("per_joint") or {}).items()}
+    out: Dict[int, JointLimits] = {}
+    for mid in ids:
+        j = per_joint.get(mid, {})
+        out[mid] = JointLimits(
+            max_velocity=float(j.get("max_velocity", cfg.get("max_velocity", 0.0))),
+            max_accel=float(j.get("max_accel", cfg.get("max_accel", 0.0))),
+        )
+    return out
+
+
 class SafetyLayer:
     def __init__(
         self,
         calib: Dict[int, JointCalib],
         stale_timeout_s: float,
         hard_stop_timeout_s: float,
+        limits: Optional[Dict[int, JointLimits]] = None,
+        max_temperature_c: float = 0.0,
+        min_voltage_v: float = 0.0,
     ) -> None:
         self.calib = calib
         self.stale_timeout_s = float(stale_timeout_s)
         self.hard_stop_timeout_s = float(hard_stop_timeout_s)
         self.state = SafetyState(last_good_cmd_mono_s=now_s())
-        self.home_pose: Dict[int, int] = {
-            mid: int((c.range_min + c.range_max) / 2) for mid, c in calib.items()
-        }
+        # Motion envelope state in fixed slots (index = position in self.ids), allocated once
+        self.ids = sorted(calib.keys())
+        self._slot = {mid: i for i, mid in enumerate(self.ids)}
+        n = len(self.ids)
+        limits = limits or {}
+        self._rmin = array("l", (int(calib[mid].range_min) for mid in self.ids))  # clamp() bounds
+        self._rmax = array("l", (int(calib[mid].range_max) for mid in self.ids))
+        self._lo = array("d", (calib[mid].range_min for mid in self.ids))
+        self._hi = array("d", (calib[mid].range_max for mid in self.ids))
+        self._vmax = array("d", (limits[mid].max_velocity if mid in limits else 0.0 for mid in self.ids))
+        self._amax = array("d", (limits[mid].max_accel if mid in limits else 0.0 for mid in self.ids))
+        self._pos = array("d", [0.0] * n)   # last limited goal (ticks, unrounded)
+        self._vel = array("d", [0.0] * n)   # its velocity (ticks/s)
+        self._motion_t: Optional[float] = None  # None = not seeded yet
+        self.vel_limit_hits = array("L", [0] * n)  # ticks where a joint was held back by max_velocity
+        self.acc_limit_hits = array("L", [0] * n)  # ... by max_accel
+        self.limits_enabled = any(self._vmax) or any(self._amax)
+
+        # Servo health from telemetry (0 = not checked); a fault turns torque off until it clears
+        self.max_temperature_c = float(max_temperature_c)
+        self.min_voltage_v = float(min_voltage_v)
+        self.telemetry_fault: Optional[str] = None
+
+        self.home_pose: Dict[int, int] = {}
+        self._home_targets: Dict[int, int] = {}  # home_pose clamped once, returned by every HOME
+        self.set_home_pose({mid: int((c.range_min + c.range_max) / 2) for mid, c in calib.items()})
 
     def set_home_pose(self, pose: Dict[int, int]) -> None:
         self.home_pose = dict(pose)
+        self._home_targets = self.clamp(dict(pose))
 
     def clamp(self, joints: Dict[int, int]) -> Dict[int, int]:
-        out: Dict[int, int] = {}
+        """Position limits; edits joints in place (no allocation) and returns it."""
+        lo, hi, slot = self._rmin, self._rmax, self._slot
         for mid, val in joints.items():
-            c = self.calib[mid]
-            out[mid] = max(c.range_min, min(c.range_max, int(val)))
-        return out
+            i = slot[mid]
+            v = int(val)
+            joints[mid] = lo[i] if v < lo[i] else hi[i] if v > hi[i] else v
+        return joints
+
+    def reset_motion(self, pose: Optional[Dict[int, int]] = None) -> None:
+        """Standstill for the envelope: zero velocity, optionally at a known pose (e.g. present position)."""
+        for i in range(len(self.ids)):
+            self._vel[i] = 0.0
+        if pose is None or (self._motion_t is None and not all(mid in pose for mid in self.ids)):
+            return  # a partial pose can't seed the envelope
+        for mid, val in pose.items():
+            i = self._slot.get(mid)
+            if i is not None:
+                self._pos[i] = float(val)
+        if self._motion_t is None:
+            self._motion_t = now_s()
+
+    def limit_motion(self, targets: Dict[int, int], t: float) -> Dict[int, int]:
+        """
+        Velocity/acceleration envelope for one goal write at time t; edits targets in place.
+        Each joint moves towards its target no faster than max_velocity, changes speed by at most
+        max_accel * dt, and brakes early enough to stop at the target. Joints without limits pass.
+        The first call seeds the state (no history to limit against yet).
+        A joint counts at most one hit per call, and only when the velocity it gets differs from
+        the unconstrained err/dt: a vel hit if max_velocity had the last word, else an acc hit
+        if max_accel * dt did. Planned braking alone (tracking a moving target) is not a hit.
+        """
+        if not self.limits_enabled:
+            return targets
+        if self._motion_t is None:
+            for mid, val in targets.items():
+                self._pos[self._slot[mid]] = float(val)
+            self._motion_t = t
+            return targets
+
+        dt = t - self._motion_t
+        if dt <= 0.0:
+            dt = 1e-3
+        self._motion_t = t
+        pos, vel, vmax, amax = self._pos, self._vel, self._vmax, self._amax
+        for mid, val in targets.items():
+            i = self._slot[mid]
+            err = float(val) - pos[i]
+            v0 = v = err / dt
+            hit = 0  # 1 = max_accel, 2 = max_velocity clamped v last
+            a = amax[i]
+            if a > 0.0:
+                # Never faster than what can still stop at the target (discrete-time braking distance)
+                vstop = a * (math.sqrt(dt * dt + 2.0 * abs(err) / a) - dt)
+                if abs(v) > vstop:
+                    v = math.copysign(vstop, err)
+                dv = a * dt
+                if v > vel[i] + dv:
+                    v = vel[i] + dv
+                    hit = 1
+                elif v < vel[i] - dv:
+                    v = vel[i] - dv
+                    hit = 1
+            m = vmax[i]
+            if m > 0.0 and (v > m or v < -m):
+                v = m if v > 0.0 else -m
+                hit = 2
+            if hit and v != v0:
+                if hit == 2:
+                    self.vel_limit_hits[i] += 1
+                else:
+                    self.acc_limit_hits[i] += 1
+            p = pos[i] + v * dt
+            if p < self._lo[i]:
+                p, v = self._lo[i], 0.0
+            elif p > self._hi[i]:
+                p, v = self._hi[i], 0.0
+            pos[i] = p
+            vel[i] = v
+            targets[mid] = int(round(p))
+        return targets
 
-    def apply(self, seq: int, estop: bool, torque: bool, confidence_ok: bool, joints: Dict[int, int], home_req: bool):
+    def limit_hits(self) -> str:
+        return " ".join(
+            f"j{mid}={self.vel_limit_hits[i]}/{self.acc_limit_hits[i]}" for i, mid in enumerate(self.ids)
+        )
+
+    def check_telemetry(self, snap) -> Optional[str]:
+        """
+        Update `telemetry_fault` from a pi.telemetry.Telemetry snapshot and return it (None = healthy).
+        Over-temperature clears 5 C below the limit, so a servo at the threshold doesn't flap.
+        """
+        reasons: List[str] = []
+        if self.max_temperature_c > 0.0:
+            limit = self.max_temperature_c - (5.0 if self.telemetry_fault else 0.0)
+            hot = [f"j{mid}={c}C" for mid, c in snap.temperature.items() if c >= limit]
+            if hot:
+                reasons.append("temperature " + " ".join(hot))
+        if self.min_voltage_v > 0.0:
+            low = [f"j{mid}={v / 10.0:.1f}V" for mid, v in snap.voltage.items() if v / 10.0 < self.min_voltage_v]
+            if low:
+                reasons.append("voltage " + " ".join(low))
+        self.telemetry_fault = "; ".join(reasons) if reasons else None
+        return self.telemetry_fault
+
+    def apply(
+        self,
+        seq: int,
+        estop: bool,
+        torque: bool,
+        confidence_ok: bool,
+        joints: Dict[int, int],
+        home_req: bool,
+        origin_mono_s: Optional[float] = None,
+    ):
+        """
+        origin_mono_s: when the command's data originated, on the Pi clock (clock-synced capture
+        time). Freshness then counts from there instead of from arrival, so a command that spent
+        long in transit goes stale sooner.
+        """
         # Update global states from command
         self.state.estop = bool(estop)
         self.state.torque = bool(torque)
@@ -59,11 +226,12 @@ class SafetyLayer:
             return {
                 "mode": "HOME",
                 "torque": self.state.torque,
-                "joints": self.clamp(self.home_pose),
+                "joints": self._home_targets,
             }
 
         if confidence_ok:
-            self.state.last_good_cmd_mono_s = now_s()
+            t = now_s()
+            self.state.last_good_cmd_mono_s = t if origin_mono_s is None else min(t, origin_mono_s)
             self.state.last_cmd_seq = seq
             return {
                 "mode": "TRACK",
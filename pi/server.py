@@ -1,158 +1,265 @@
 # pi/server.py
 from __future__ import annotations
 
-import json
-import traceback
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Union
 
 from common.config import load_calibration, load_yaml
-from common.message_schema import validate_cmd, to_command
-from common.timeutil import now_s, sleep_s
-from pi.dxl_driver import DxlConfig, DynamixelBus
+from common.timeutil import now_s
+from pi.arms import ArmConfig, load_arm_configs
+from pi.bus_scheduler import BusScheduler
+from pi.clock_sync import ClockSync, ClockSyncPinger
+from pi.control import LATENCY_STAGES, ControlLoop
+from pi.dxl_driver import make_bus
+from pi.flight_log import FlightLogger
 from pi.logger import CSVLogger
-from pi.net_receiver import NDJSONTCPServer
-from pi.safety import SafetyLayer
+from pi.net_receiver import CommandRouter, NetStats, make_receiver
+from pi.safety import SafetyLayer, load_joint_limits
+from pi.telemetry import TelemetryReader
+from pi.trajectory import SetpointInterpolator
+from pi.watchdog import StaleWatchdog
 
 
-def main() -> int:
-    net_cfg = load_yaml("config/network.yaml")
-    dxl_cfg_y = load_yaml("config/dynamixel.yaml")
-    calib = load_calibration("config/robot_calibration.json")
+@dataclass
+class ArmStack:
+    """Everything one arm owns: its bus and I/O threads, safety state, log and control loop."""
+    cfg: ArmConfig
+    bus: Any
+    logger: Union[FlightLogger, CSVLogger]
+    scheduler: BusScheduler
+    control: ControlLoop
+    watchdog: Optional[StaleWatchdog] = None
+    thread: Optional[threading.Thread] = None
+    _last_ticks: int = field(default=0, init=False, repr=False)
+    _last_t: float = field(default_factory=now_s, init=False, repr=False)
 
-    tcp = net_cfg["tcp"]
-    host = "0.0.0.0"
-    port = int(tcp["pi_port"])
-    stale_timeout_s = float(tcp.get("stale_timeout_s", 0.35))
-    hard_stop_timeout_s = float(tcp.get("hard_stop_timeout_s", 1.0))
-
-    dxy = dxl_cfg_y["dynamixel"]
-    cty = dxl_cfg_y["control_table"]
-    dxl_cfg = DxlConfig(
-        device=str(dxy["device"]),
-        baudrate=int(dxy["baudrate"]),
-        protocol_version=float(dxy["protocol_version"]),
-        addr_torque_enable=int(cty["addr_torque_enable"]),
-        addr_goal_position=int(cty["addr_goal_position"]),
-        addr_present_position=int(cty["addr_present_position"]),
-        len_goal_position=int(cty["len_goal_position"]),
-        len_present_position=int(cty["len_present_position"]),
-    )
+    def start(self, stop: threading.Event, stats_period_s: float) -> None:
+        self._last_ticks, self._last_t = 0, now_s()
+        if self.watchdog is not None:
+            self.watchdog.start()
+        self.scheduler.start()
+        self.thread = threading.Thread(
+            target=self._run, args=(stop, stats_period_s), name=f"pi-control-{self.cfg.name}", daemon=True
+        )
+        self.thread.start()
 
-    ids = [1, 2, 3, 4, 5, 6]
-    bus = DynamixelBus(dxl_cfg, ids)
-    safety = SafetyLayer(calib, stale_timeout_s=stale_timeout_s, hard_stop_timeout_s=hard_stop_timeout_s)
+    def _run(self, stop: threading.Event, stats_period_s: float) -> None:
+        try:
+            self.control.run(stop, stats_period_s=stats_period_s)
+        finally:
+            stop.set()  # one arm's loop dying takes the whole server down, like a lost connection
 
-    logger = CSVLogger("logs")
-    log_path = logger.start()
-    print(f"[pi] Logging to {log_path}")
+    def stop(self) -> None:
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        if self.watchdog is not None:
+            self.watchdog.stop()
+        self.scheduler.stop()
+        self.logger.stop()
+        if isinstance(self.logger, FlightLogger):
+            print(f"{self.control.tag} log {self.logger.stats.summary()}")
+        try:
+            self.bus.torque_all(False, force=True)
+        except Exception:
+            pass
+        self.bus.close()
+
+    def rate_summary(self) -> str:
+        """Tick rate since the previous call, command count and the Pi/end-to-end latency."""
+        t, ticks = now_s(), self.control.stats.ticks
+        hz = (ticks - self._last_ticks) / max(1e-9, t - self._last_t)
+        self._last_ticks, self._last_t = ticks, t
+        s = f"{self.cfg.name} {hz:.1f}Hz cmds={self.control.stats.cmds_applied}"
+        for stage in ("pi_total", "end_to_end"):
+            h = self.control.latency.hist[stage]
+            if h.count:
+                p50, p99 = h.percentiles((50.0, 99.0))
+                s += f" {stage}={p50:.1f}/{p99:.1f}"
+        return s
+
+
+def _build_arm(
+    arm: ArmConfig,
+    dxl_cfg_y: Dict[str, Any],
+    tcp: Dict[str, Any],
+    router: CommandRouter,
+    clock: Optional[ClockSync],
+    net_stats: Optional[NetStats],
+    name: str,
+) -> ArmStack:
+    calib = load_calibration(arm.calibration, arm.motor_ids)
+    ids = list(arm.motor_ids)
+    tag = f"[pi:{name}]" if name else "[pi]"
+    bus = make_bus(dxl_cfg_y, ids, device=arm.device)
+    limits_y = dxl_cfg_y.get("limits", {}) or {}
+    safety = SafetyLayer(
+        calib,
+        stale_timeout_s=float(tcp.get("stale_timeout_s", 0.35)),
+        hard_stop_timeout_s=float(tcp.get("hard_stop_timeout_s", 1.0)),
+        limits=load_joint_limits(limits_y, ids),
+        max_temperature_c=float(limits_y.get("max_temperature_c", 0.0)),
+        min_voltage_v=float(limits_y.get("min_voltage_v", 0.0)),
+    )
 
     # Default: torque on at start (safer to explicitly control)
+    bus.open()
     try:
-        bus.open()
         bus.torque_all(True)
-        print("[pi] Dynamixel bus opened, torque ON")
+    except Exception:
+        bus.close()
+        raise
+    print(f"{tag} Dynamixel bus opened on {arm.device} ({type(bus).__name__}), torque ON")
+
+    # Start the motion envelope from where the arm actually is
+    try:
+        safety.reset_motion(bus.sync_read_positions())
     except Exception as e:
-        print("[pi] ERROR opening Dynamixel:", e)
-        return 1
+        print(f"{tag} WARN initial present read failed, envelope starts at the first goal:", e)
 
-    server = NDJSONTCPServer(host, port)
-    conn = server.listen_accept()
+    log_cfg = dxl_cfg_y.get("logging", {})
+    if str(log_cfg.get("format", "flight")).lower() == "csv":
+        logger = CSVLogger("logs", latency_stages=LATENCY_STAGES, joint_ids=ids, name=name)
+    else:
+        logger = FlightLogger(
+            "logs",
+            latency_stages=LATENCY_STAGES,
+            joint_ids=ids,
+            ring_records=int(log_cfg.get("ring_records", 8192)),
+            flush_interval_s=float(log_cfg.get("flush_interval_s", 0.25)),
+            name=name,
+        )
+    log_path = logger.start()
+    print(f"{tag} Logging to {log_path}")
 
-    last_targets = {i: int((calib[i].range_min + calib[i].range_max) / 2) for i in ids}
+    behavior = dxl_cfg_y.get("behavior", {})
+    control_y = dxl_cfg_y.get("control", {})
+    interp = SetpointInterpolator(
+        ids,
+        clamp=safety.clamp,
+        mode=str(control_y.get("interpolation", "linear")),
+        expected_period_s=1.0 / max(1.0, float(tcp.get("send_hz", 30))),
+        extrapolation_horizon_s=float(control_y.get("extrapolation_horizon_s", 0.05)),
+    )
+    control_hz = float(control_y.get("control_hz", 100))
+    telemetry = TelemetryReader(bus, name=name) if bool(behavior.get("enable_present_read", False)) else None
+    # Everything below talks to the bus through the scheduler: goal writes and torque changes
+    # go straight out, telemetry and maintenance only fill the gaps between goal writes
+    scheduler = BusScheduler(
+        bus,
+        cycle_hz=control_hz,
+        telemetry=telemetry,
+        telemetry_hz=float(behavior.get("present_read_hz", 50)),
+        torque_verify_hz=float(behavior.get("torque_verify_hz", 1.0)),
+        error_poll_hz=float(behavior.get("error_poll_hz", 0.5)),
+        guard_us=float(behavior.get("bus_guard_us", 300)),
+        name=name,
+    )
+    watchdog_hz = float(tcp.get("watchdog_hz", 200))
+    watchdog = StaleWatchdog(safety, scheduler, check_hz=watchdog_hz, name=name) if watchdog_hz > 0 else None
+    control = ControlLoop(
+        bus=scheduler,
+        safety=safety,
+        logger=logger,
+        mailbox=router.mailboxes[arm.arm_id],
+        ids=ids,
+        home_targets={i: int((calib[i].range_min + calib[i].range_max) / 2) for i in ids},
+        control_hz=control_hz,
+        telemetry=telemetry,
+        torque_verify_hz=0.0,  # scheduler maintenance slot
+        net_stats=net_stats,
+        interpolator=interp,
+        watchdog=watchdog,
+        clock=clock,
+        name=name,
+    )
+    print(f"{tag} Control loop at {control.control_hz:.0f} Hz, interpolation={interp.mode}, "
+          f"bus scheduler: {', '.join(scheduler.slots)}")
+    return ArmStack(cfg=arm, bus=bus, logger=logger, scheduler=scheduler, control=control, watchdog=watchdog)
 
-    enable_present = bool(dxl_cfg_y.get("behavior", {}).get("enable_present_read", False))
-    present_hz = float(dxl_cfg_y.get("behavior", {}).get("present_read_hz", 10))
-    present_period = 1.0 / max(1.0, present_hz)
-    last_present_t = now_s()
-    last_present = None
 
-    try:
-        for line in server.recv_loop(conn):
-            try:
-                msg = json.loads(line)
-                ok, reason = validate_cmd(msg)
-                if not ok:
-                    print(f"[pi] DROP invalid msg: {reason}")
-                    continue
-
-                cmd = to_command(msg)
-                home_req = bool(cmd.features.get("home", 0.0) >= 0.5)
-
-                # Confidence gate: treat >= min_conf as OK (same as laptop default)
-                # Pi is final authority though — if you want stricter safety, raise this.
-                confidence_ok = cmd.confidence >= 0.60
-
-                decision = safety.apply(
-                    seq=cmd.seq,
-                    estop=cmd.estop,
-                    torque=cmd.torque,
-                    confidence_ok=confidence_ok,
-                    joints=cmd.joints,
-                    home_req=home_req,
-                )
-
-                stale = safety.stale_policy()
-                mode = decision["mode"]
-
-                # Apply stale policy
-                if stale == "HARD_STOP":
-                    # optional: torque off after prolonged stale
-                    try:
-                        bus.torque_all(False)
-                    except Exception:
-                        pass
-                    mode = "HARD_STOP"
-                elif stale == "SOFT_HOLD" and mode == "LOW_CONF":
-                    mode = "SOFT_HOLD"
-
-                # Apply torque state (unless estop/hard stop overrides)
-                torque_should_be = bool(decision["torque"]) and stale != "HARD_STOP"
-                try:
-                    bus.torque_all(torque_should_be)
-                except Exception as e:
-                    print("[pi] WARN torque_all failed:", e)
-
-                # Apply motion if we have joints this tick
-                if decision["joints"] is not None and stale != "HARD_STOP":
-                    last_targets = decision["joints"]
-                    bus.sync_write_positions(last_targets)
-
-                # Optional present read
-                if enable_present and (now_s() - last_present_t) >= present_period:
-                    try:
-                        last_present = bus.sync_read_positions()
-                    except Exception as e:
-                        print("[pi] WARN present read failed:", e)
-                        last_present = None
-                    last_present_t = now_s()
-
-                logger.write(
-                    seq=cmd.seq,
-                    confidence=cmd.confidence,
-                    mode=mode,
-                    estop=cmd.estop,
-                    torque=torque_should_be,
-                    features=cmd.features,
-                    cmd=last_targets,
-                    pos=last_present,
-                )
+def main() -> int:
+    net_cfg = load_yaml("config/network.yaml")
+    dxl_cfg_y = load_yaml("config/dynamixel.yaml")
+    arms = load_arm_configs(dxl_cfg_y)
+
+    tcp = net_cfg["tcp"]
+    host = "0.0.0.0"
+    control_y = dxl_cfg_y.get("control", {})
+    stats_period_s = float(control_y.get("stats_period_s", 5.0))
 
+    receiver = make_receiver(net_cfg, host)
+    # Clock sync with the laptop: one-way delay and command age (0 Hz = off)
+    clock_sync_hz = float(net_cfg.get("protocol", {}).get("clock_sync_hz", 2.0))
+    clock = ClockSync() if clock_sync_hz > 0 else None
+    receiver.clock = clock
+
+    # One bus, scheduler, watchdog and control thread per arm: transactions on different
+    # serial adapters overlap, and a slow bus only delays its own arm
+    router = CommandRouter(a.arm_id for a in arms)
+    multi = len(arms) > 1
+    stacks: List[ArmStack] = []
+    for arm in arms:
+        try:
+            stacks.append(_build_arm(
+                arm, dxl_cfg_y, tcp, router, clock,
+                net_stats=receiver.stats if not stacks else None,  # shared stream: print it once
+                name=arm.name if multi else "",
+            ))
+        except Exception as e:
+            print(f"[pi] ERROR opening Dynamixel for arm {arm.name} ({arm.device}):", e)
+            for st in stacks:
+                st.stop()
+            return 1
+    if multi:
+        print("[pi] Arms: " + ", ".join(f"{a.name}=arm {a.arm_id} on {a.device}" for a in arms))
+
+    receiver.open()
+
+    stop = threading.Event()
+
+    def _receive() -> None:
+        # A lost client is not a shutdown: go back to accepting (the laptop reconnects with
+        # backoff). Meanwhile no commands arrive, so the watchdogs hold and then cut torque.
+        while not stop.is_set():
+            try:
+                receiver.pump(router)
             except Exception as e:
-                print("[pi] ERROR processing line:", e)
-                traceback.print_exc()
+                print("[pi] Connection ended:", e)
+            if stop.is_set():
+                break
+            receiver.close()
+            try:
+                receiver.open()
+            except OSError as e:
+                print("[pi] ERROR reopening the command socket:", e)
+                stop.set()
 
-    except Exception as e:
-        print("[pi] Connection ended:", e)
+    rx_thread = threading.Thread(target=_receive, name="pi-rx", daemon=True)
+    rx_thread.start()
+    pinger = ClockSyncPinger(clock, receiver.send_ping, hz=clock_sync_hz) if clock is not None else None
+    if pinger is not None:
+        pinger.start()
+    for st in stacks:
+        st.start(stop, stats_period_s)
+
+    try:
+        # Control runs on the arm threads; this one only reports
+        period = stats_period_s if stats_period_s > 0 else 1.0
+        while not stop.wait(period):
+            if multi and stats_period_s > 0:
+                rs = router.stats
+                print(f"[pi] arms {' | '.join(st.rate_summary() for st in stacks)} "
+                      f"(ms p50/p99) unknown_arm={rs.unknown_arm}")
+    except KeyboardInterrupt:
+        print("[pi] Interrupted.")
     finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
-        logger.stop()
-        try:
-            bus.torque_all(False)
-        except Exception:
-            pass
-        bus.close()
+        stop.set()
+        if pinger is not None:
+            pinger.stop()
+        receiver.close()
+        for st in stacks:
+            st.stop()
         print("[pi] Shutdown complete.")
     return 0
 
@@ -0,0 +1,254 @@
+# pi/sim_bus.py
+from __future__ import annotations
+
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Union
+
+from common.timeutil import now_s
+from pi.dxl_driver import (
+    ADDR_HARDWARE_ERROR,
+    ADDR_PRESENT_LOAD,
+    ADDR_PRESENT_TEMP,
+    ADDR_PRESENT_VELOCITY,
+    ADDR_PRESENT_VOLTAGE,
+    TELEMETRY_ADDR,
+    TELEMETRY_LEN,
+    BusStats,
+    DxlConfig,
+    GoalFilter,
+    _int_to_le_bytes,
+)
+
+CONTROL_TABLE_SIZE = 256
+
+TICKS_PER_REV = 4096
+VELOCITY_UNIT_RPM = 0.229
+
+
+@dataclass
+class SimStats:
+    transactions: int = 0
+    tx_bytes: int = 0
+    rx_bytes: int = 0
+    wire_time_s: float = 0.0  # simulated serial time (bytes on the wire + return delays)
+
+
+class _SimServo:
+    __slots__ = ("table", "pos", "vel", "t")
+
+    def __init__(self, pos: float, t: float) -> None:
+        self.table = bytearray(CONTROL_TABLE_SIZE)
+        self.pos = pos   # ticks
+        self.vel = 0.0   # ticks/s
+        self.t = t
+
+
+class SimDynamixelBus:
+    """
+    Software stand-in for DynamixelBus (same methods, stats and lock), for running and load-testing
+    the Pi pipeline without an arm or dynamixel_sdk.
+
+    Each servo has a byte control table. Goal writes land in it; present position follows the
+    goal with a first-order lag (time_constant_s) while torque is on and stays put while it is off.
+    Every transaction takes the time its packets would need on the wire at cfg.baudrate
+    (10 bits per byte) plus the servos' return delay for each status packet, so bus load and
+    latency behave like the real adapter. realtime=False skips the waiting and only accounts it.
+    """
+
+    def __init__(
+        self,
+        cfg: DxlConfig,
+        motor_ids: List[int],
+        time_constant_s: float = 0.08,
+        return_delay_us: float = 250.0,
+        realtime: bool = True,
+        initial_position: int = 2048,
+        goal_deadband: Union[int, Dict[int, int]] = 0,
+    ) -> None:
+        self.cfg = cfg
+        self.ids = list(motor_ids)
+        self.time_constant_s = max(1e-4, float(time_constant_s))
+        self.return_delay_s = max(0.0, float(return_delay_us)) * 1e-6
+        self.realtime = bool(realtime)
+        self._byte_s = 10.0 / float(cfg.baudrate)
+        # Packet overheads (header, id, length, instruction, [error], crc) and address/length field sizes
+        if cfg.protocol_version >= 2.0:
+            self._inst_overhead, self._status_overhead, self._field = 10, 11, 2
+        else:
+            self._inst_overhead, self._status_overhead, self._field = 6, 6, 1
+
+        t = now_s()
+        self._servos: Dict[int, _SimServo] = {mid: _SimServo(float(initial_position), t) for mid in self.ids}
+        for mid, s in self._servos.items():
+            self._write(s, cfg.addr_goal_position, initial_position, cfg.len_goal_position)
+            self._refresh(s, t)
+
+        self._torque: Dict[int, Optional[bool]] = {mid: None for mid in self.ids}
+        self.stats = BusStats()
+        self.goal_filter = GoalFilter(self.ids, goal_deadband)
+        self.sim_stats = SimStats()
+        self.lock = threading.RLock()
+        self.is_open = False
+
+    # ---- bus API (mirrors DynamixelBus) ----
+
+    def open(self) -> None:
+        self.is_open = True
+
+    def close(self) -> None:
+        self.is_open = False
+
+    def torque_enable(self, mid: int, enable: bool) -> None:
+        with self.lock:
+            self._transact(self._inst_overhead + self._field + 1, 0, statuses=1)
+            self._set_torque(mid, bool(enable))
+            self._torque[mid] = bool(enable)
+            self.goal_filter.invalidate()
+
+    def torque_all(self, enable: bool, force: bool = False) -> None:
+        with self.lock:
+            enable = bool(enable)
+            pending = [mid for mid in self.ids if force or self._torque[mid] is not enable]
+            if not pending:
+                self.stats.torque_skipped += 1
+                return
+            self._transact(self._sync_write_bytes(len(pending), 1), 0)
+            for mid in pending:
+                self._set_torque(mid, enable)
+                self._torque[mid] = enable
+            self.goal_filter.invalidate()
+            self.stats.torque_writes += 1
+
+    def torque_cached(self, mid: int) -> Optional[bool]:
+        return self._torque.get(mid)
+
+    def verify_torque(self) -> List[int]:
+        with self.lock:
+            mismatched: List[int] = []
+            for mid in self.ids:
+                self._transact(self._inst_overhead + 2 * self._field, 1)
+                actual = bool(self._servos[mid].table[self.cfg.addr_torque_enable])
+                if actual is not self._torque[mid]:
+                    if self._torque[mid] is not None:
+                        mismatched.append(mid)
+                    self._torque[mid] = actual
+            self.stats.torque_verifies += 1
+            self.stats.torque_mismatches += len(mismatched)
+            return mismatched
+
+    def sync_write_positions(self, targets: Dict[int, int], force: bool = False) -> int:
+        with self.lock:
+            mids = self.goal_filter.changed(targets, force)
+            if not mids:
+                self.stats.goal_skipped += 1
+                return 0
+            t = now_s()
+            for mid in mids:
+                s = self._servos[mid]
+                self._advance(s, t)
+                s.table[self.cfg.addr_goal_position:self.cfg.addr_goal_position + self.cfg.len_goal_position] = (
+                    _int_to_le_bytes(targets[mid], self.cfg.len_goal_position)
+                )
+            self._transact(self._sync_write_bytes(len(mids), self.cfg.len_goal_position), 0)
+            self.goal_filter.commit(mids, targets)
+            self.stats.goal_writes += 1
+            if len(mids) < sum(1 for mid in self.ids if mid in targets):
+                self.stats.goal_partial += 1
+            return len(mids)
+
+    def sync_read_positions(self) -> Dict[int, int]:
+        with self.lock:
+            return self.read_block(self.cfg.addr_present_position, self.cfg.len_present_position)
+
+    def read_block(self, addr: int, length: int) -> Dict[int, Any]:
+        """Sync read of `length` bytes at `addr` from every servo; ints for <= 4 bytes, else raw bytes."""
+        with self.lock:
+            n = len(self.ids)
+            self._transact(self._inst_overhead + 2 * self._field + n, n * length, statuses=n)
+            t = now_s()
+            out = {}
+            for mid in self.ids:
+                s = self._servos[mid]
+                self._refresh(s, t)
+                raw = bytes(s.table[addr:addr + length])
+                out[mid] = int.from_bytes(raw, "little") if length <= 4 else raw
+            return out
+
+    def read_telemetry(self) -> Dict[int, bytes]:
+        return self.read_block(TELEMETRY_ADDR, TELEMETRY_LEN)
+
+    def read_hardware_errors(self) -> Dict[int, int]:
+        return self.read_block(ADDR_HARDWARE_ERROR, 1)
+
+    def ping(self, mid: int) -> bool:
+        with self.lock:
+            self._transact(self._inst_overhead, 3)
+            return mid in self._servos
+
+    # ---- model ----
+
+    def _sync_write_bytes(self, n: int, data_len: int) -> int:
+        return self._inst_overhead + 2 * self._field + n * (1 + data_len)
+
+    def _transact(self, tx_bytes: int, rx_params: int, statuses: int = -1) -> None:
+        """Account (and, in realtime mode, wait out) one instruction and its status packet(s)."""
+        if statuses < 0:
+            statuses = 1 if rx_params else 0  # sync write: no status packet
+        rx_bytes = statuses * self._status_overhead + rx_params
+        dt = (tx_bytes + rx_bytes) * self._byte_s + statuses * self.return_delay_s
+        st = self.sim_stats
+        st.transactions += 1
+        st.tx_bytes += tx_bytes
+        st.rx_bytes += rx_bytes
+        st.wire_time_s += dt
+        if self.realtime:
+            _busy_wait(dt)
+
+    def _set_torque(self, mid: int, enable: bool) -> None:
+        s = self._servos[mid]
+        self._advance(s, now_s())
+        s.table[self.cfg.addr_torque_enable] = 1 if enable else 0
+
+    def _advance(self, s: _SimServo, t: float) -> None:
+        """First-order lag towards the goal since the last update (frozen while torque is off)."""
+        dt = t - s.t
+        s.t = t
+        if dt <= 0.0:
+            return
+        if not s.table[self.cfg.addr_torque_enable]:
+            s.vel = 0.0
+            return
+        a = self.cfg.addr_goal_position
+        goal = float(int.from_bytes(s.table[a:a + self.cfg.len_goal_position], "little"))
+        new = goal + (s.pos - goal) * math.exp(-dt / self.time_constant_s)
+        s.vel = (new - s.pos) / dt
+        s.pos = new
+
+    def _refresh(self, s: _SimServo, t: float) -> None:
+        self._advance(s, t)
+        self._write(s, self.cfg.addr_present_position, int(round(s.pos)), self.cfg.len_present_position)
+        rpm = s.vel * 60.0 / TICKS_PER_REV
+        self._write(s, ADDR_PRESENT_VELOCITY, int(rpm / VELOCITY_UNIT_RPM), 4, signed=True)
+        a = self.cfg.addr_goal_position
+        err = int.from_bytes(s.table[a:a + self.cfg.len_goal_position], "little") - s.pos
+        load = max(-1000, min(1000, int(err * 2.0))) if s.table[self.cfg.addr_torque_enable] else 0
+        self._write(s, ADDR_PRESENT_LOAD, load, 2, signed=True)
+        self._write(s, ADDR_PRESENT_VOLTAGE, 120, 2)
+        self._write(s, ADDR_PRESENT_TEMP, 35, 1)
+
+    @staticmethod
+    def _write(s: _SimServo, addr: int, val: int, length: int, signed: bool = False) -> None:
+        if addr + length <= CONTROL_TABLE_SIZE:
+            s.table[addr:addr + length] = int(val).to_bytes(length, "little", signed=signed)
+
+
+def _busy_wait(seconds: float) -> None:
+    # time.sleep alone overshoots sub-millisecond waits; sleep most of it, spin the rest
+    deadline = time.perf_counter() + seconds
+    if seconds > 0.0005:
+        time.sleep(seconds - 0.0003)
+    while time.perf_counter() < deadline:
+        pass
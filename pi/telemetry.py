@@ -0,0 +1,93 @@
+# pi/telemetry.py
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from common.timeutil import now_s
+from pi.dxl_driver import (
+    ADDR_PRESENT_LOAD,
+    ADDR_PRESENT_TEMP,
+    ADDR_PRESENT_VELOCITY,
+    ADDR_PRESENT_VOLTAGE,
+    TELEMETRY_ADDR,
+    DxlConfig,
+)
+
+
+@dataclass(frozen=True)
+class Telemetry:
+    """One bus read of every servo, raw control-table units. Never mutated once published."""
+    t: float                      # monotonic time the read finished
+    position: Dict[int, int]      # ticks
+    velocity: Dict[int, int]      # 0.229 rpm units, signed
+    load: Dict[int, int]          # 0.1 % units, signed
+    voltage: Dict[int, int]       # 0.1 V
+    temperature: Dict[int, int]   # deg C
+
+
+def decode_telemetry(raw: Dict[int, bytes], cfg: DxlConfig, t: float) -> Telemetry:
+    pos_off = cfg.addr_present_position - TELEMETRY_ADDR
+    pos_len = cfg.len_present_position
+    pos: Dict[int, int] = {}
+    vel: Dict[int, int] = {}
+    load: Dict[int, int] = {}
+    volt: Dict[int, int] = {}
+    temp: Dict[int, int] = {}
+    o_load = ADDR_PRESENT_LOAD - TELEMETRY_ADDR
+    o_vel = ADDR_PRESENT_VELOCITY - TELEMETRY_ADDR
+    o_volt = ADDR_PRESENT_VOLTAGE - TELEMETRY_ADDR
+    o_temp = ADDR_PRESENT_TEMP - TELEMETRY_ADDR
+    for mid, b in raw.items():
+        pos[mid] = int.from_bytes(b[pos_off:pos_off + pos_len], "little")
+        vel[mid] = int.from_bytes(b[o_vel:o_vel + 4], "little", signed=True)
+        load[mid] = int.from_bytes(b[o_load:o_load + 2], "little", signed=True)
+        volt[mid] = int.from_bytes(b[o_volt:o_volt + 2], "little")
+        temp[mid] = b[o_temp]
+    return Telemetry(t=t, position=pos, velocity=vel, load=load, voltage=volt, temperature=temp)
+
+
+@dataclass
+class TelemetryStats:
+    reads: int = 0
+    failures: int = 0
+    last_read_ms: float = 0.0
+    max_read_ms: float = 0.0
+
+    def summary(self) -> str:
+        return (f"reads={self.reads} failures={self.failures} "
+                f"read last={self.last_read_ms:.2f}ms max={self.max_read_ms:.2f}ms")
+
+
+class TelemetryReader:
+    """
+    Reads the full telemetry block of every servo. read_once() is run by the BusScheduler's
+    telemetry slot (in the gaps between goal writes), so the control tick never does the bus
+    round trip itself. Each read is published by replacing `latest` with a new Telemetry (a single
+    reference assignment): readers take `reader.latest` once and get a consistent snapshot without
+    locks. `latest` is None until the first successful read.
+    """
+
+    def __init__(self, bus, name: str = "") -> None:
+        self.bus = bus
+        self.tag = f"[pi:{name}]" if name else "[pi]"  # prefix of every line this reader prints
+        self.latest: Optional[Telemetry] = None
+        self.stats = TelemetryStats()
+
+    def read_once(self) -> Optional[Telemetry]:
+        st = self.stats
+        t0 = now_s()
+        try:
+            raw = self.bus.read_telemetry()
+        except Exception as e:
+            st.failures += 1
+            if st.failures == 1 or st.failures % 100 == 0:
+                print(f"{self.tag} WARN telemetry read failed ({st.failures}x):", e)
+            return None
+        t1 = now_s()
+        snap = decode_telemetry(raw, self.bus.cfg, t1)
+        self.latest = snap
+        st.reads += 1
+        st.last_read_ms = (t1 - t0) * 1e3
+        st.max_read_ms = max(st.max_read_ms, st.last_read_ms)
+        return snap
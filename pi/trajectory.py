@@ -0,0 +1,133 @@
+# pi/trajectory.py
+from __future__ import annotations
+
+from typing import Callable, Dict, List, Optional
+
+MODES = ("none", "linear", "cubic")
+
+
+class SetpointInterpolator:
+    """
+    Turns sparse setpoints (send_hz, ~30 Hz) into a smooth stream sampled at the bus rate.
+
+    Each new setpoint starts a segment from the currently rendered position to the new target,
+    lasting about one setpoint period (so motion lags the newest setpoint by ~1 period):
+      - linear: constant velocity within the segment
+      - cubic : Hermite segment; start velocity = rendered velocity (continuous across segments),
+                end velocity = slope between the last two setpoints
+    If the next setpoint is late, motion continues along the end velocity for at most
+    extrapolation_horizon_s, then holds. Every sample goes through `clamp` (SafetyLayer.clamp).
+    """
+
+    def __init__(
+        self,
+        ids: List[int],
+        clamp: Callable[[Dict[int, int]], Dict[int, int]],
+        mode: str = "linear",
+        expected_period_s: float = 1.0 / 30.0,
+        extrapolation_horizon_s: float = 0.05,
+    ) -> None:
+        if mode not in MODES:
+            raise ValueError(f"Unknown interpolation mode {mode!r}, expected one of {MODES}")
+        self.ids = list(ids)
+        self.clamp = clamp
+        self.mode = mode
+        self.period_s = float(expected_period_s)
+        self.horizon_s = max(0.0, float(extrapolation_horizon_s))
+
+        n = len(self.ids)
+        self._p0 = [0.0] * n   # segment start position
+        self._v0 = [0.0] * n   # segment start velocity (ticks/s)
+        self._p1 = [0.0] * n   # segment end = newest setpoint
+        self._v1 = [0.0] * n   # segment end velocity (ticks/s)
+        self._t0 = 0.0
+        self._dt = self.period_s
+        self._last_push_t: Optional[float] = None
+        self.active = False
+
+    def reset(self, pose: Dict[int, int], t: float) -> None:
+        """Stand still at pose (startup, or after torque off / hard stop)."""
+        for i, mid in enumerate(self.ids):
+            self._p0[i] = self._p1[i] = float(pose[mid])
+            self._v0[i] = self._v1[i] = 0.0
+        self._t0 = t
+        self._dt = self.period_s
+        self._last_push_t = None
+        self.active = True
+
+    def hold(self, t: float) -> None:
+        """Freeze at the currently rendered position."""
+        if self.active:
+            self.reset(self.sample(t), t)
+
+    def push(self, targets: Dict[int, int], t: float) -> None:
+        if not self.active or self.mode == "none":
+            self.reset(targets, t)
+            return
+
+        # Segment length follows the observed setpoint interval, within sane bounds
+        if self._last_push_t is None:
+            dt = self.period_s
+        else:
+            dt = min(2.0 * self.period_s, max(0.5 * self.period_s, t - self._last_push_t))
+        self._last_push_t = t
+
+        pos, vel = self._eval(t)
+        prev_target = self._p1
+        for i, mid in enumerate(self.ids):
+            p1 = float(targets[mid])
+            self._p0[i] = pos[i]
+            self._v0[i] = vel[i] if self.mode == "cubic" else 0.0
+            self._v1[i] = (p1 - prev_target[i]) / dt
+            self._p1[i] = p1
+        self._t0 = t
+        self._dt = dt
+
+    def _eval(self, t: float):
+        """Rendered position and velocity (ticks, ticks/s) at time t, unclamped."""
+        n = len(self.ids)
+        pos = [0.0] * n
+        vel = [0.0] * n
+        dt = self._dt
+        u = (t - self._t0) / dt
+        if u < 0.0:
+            u = 0.0
+
+        if u >= 1.0:
+            # Late setpoint: bounded extrapolation along the end velocity, then hold
+            te = min((u - 1.0) * dt, self.horizon_s)
+            moving = te < self.horizon_s
+            for i in range(n):
+                v = self._v1[i] if self.mode == "cubic" else (self._p1[i] - self._p0[i]) / dt
+                pos[i] = self._p1[i] + v * te
+                vel[i] = v if moving else 0.0
+            return pos, vel
+
+        if self.mode == "cubic":
+            u2 = u * u
+            u3 = u2 * u
+            h00 = 2 * u3 - 3 * u2 + 1
+            h10 = u3 - 2 * u2 + u
+            h01 = -2 * u3 + 3 * u2
+            h11 = u3 - u2
+            d00 = (6 * u2 - 6 * u) / dt
+            d10 = 3 * u2 - 4 * u + 1
+            d01 = (-6 * u2 + 6 * u) / dt
+            d11 = 3 * u2 - 2 * u
+            for i in range(n):
+                p0, v0, p1, v1 = self._p0[i], self._v0[i], self._p1[i], self._v1[i]
+                pos[i] = h00 * p0 + h10 * dt * v0 + h01 * p1 + h11 * dt * v1
+                vel[i] = d00 * p0 + d10 * v0 + d01 * p1 + d11 * v1
+        else:
+            for i in range(n):
+                v = (self._p1[i] - self._p0[i]) / dt
+                pos[i] = self._p0[i] + v * u * dt
+                vel[i] = v
+        return pos, vel
+
+    def sample(self, t: float) -> Dict[int, int]:
+        """Clamped goal positions for time t."""
+        if self.mode == "none":
+            return self.clamp({mid: int(self._p1[i]) for i, mid in enumerate(self.ids)})
+        pos, _ = self._eval(t)
+        return self.clamp({mid: int(round(pos[i])) for i, mid in enumerate(self.ids)})
@@ -0,0 +1,128 @@
+# pi/watchdog.py
+from __future__ import annotations
+
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional, Union
+
+from common.timeutil import RateTimer, now_s
+from pi.bus_scheduler import BusScheduler
+from pi.dxl_driver import DynamixelBus
+from pi.safety import SafetyLayer
+
+
+@dataclass
+class WatchdogStats:
+    checks: int = 0
+    overruns: int = 0
+    soft_events: int = 0        # OK -> SOFT_HOLD transitions
+    hard_events: int = 0        # -> HARD_STOP transitions
+    torque_off_writes: int = 0  # HARD_STOP torque-offs issued by the watchdog itself
+    torque_off_failures: int = 0
+    # Detection latency = time of detection - time the timeout actually expired (ms)
+    last_detect_ms: float = 0.0
+    max_detect_ms: float = 0.0
+    recent_detect_ms: deque = field(default_factory=lambda: deque(maxlen=64))
+
+    def summary(self) -> str:
+        r = self.recent_detect_ms
+        mean = sum(r) / len(r) if r else 0.0
+        return (f"soft={self.soft_events} hard={self.hard_events} "
+                f"detect mean={mean:.1f}ms max={self.max_detect_ms:.1f}ms checks={self.checks}")
+
+
+class StaleWatchdog:
+    """
+    Freshness check on its own thread, independent of the control loop and the network.
+
+    The only shared state is SafetyLayer.state.last_good_cmd_mono_s (one float, written when a
+    good command is applied) and `verdict` (one str, written here): plain attribute reads and
+    writes, no locks on that path. The control loop takes `verdict` as its stale policy each tick
+    (re-checking freshness itself on a tick that applied a new command, since the verdict can be a
+    check period old): SOFT_HOLD turns low confidence into a hold (no more goals, the servos keep
+    the last one), HARD_STOP keeps torque off. On HARD_STOP the watchdog also turns torque off on the bus itself, so a silent
+    laptop or a stuck control tick can't keep the arm powered past hard_stop_timeout_s.
+    """
+
+    def __init__(
+        self,
+        safety: SafetyLayer,
+        bus: Union[BusScheduler, DynamixelBus],
+        check_hz: float = 200.0,
+        name: str = "",
+    ) -> None:
+        self.safety = safety
+        self.tag = f"[pi:{name}]" if name else "[pi]"  # prefix of every line this watchdog prints
+        self.bus = bus
+        self.check_hz = float(check_hz)
+        self.verdict = "OK"
+        self.armed = False  # set by the control loop once the first command arrived
+        self.stats = WatchdogStats()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="pi-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def _run(self) -> None:
+        rate = RateTimer(self.check_hz)
+        while not self._stop.is_set():
+            if self.armed:
+                self.check()
+            rate.sleep()
+            self.stats.checks = rate.ticks
+            self.stats.overruns = rate.overruns
+
+    def check(self) -> str:
+        safety = self.safety
+        t = now_s()
+        last_good = safety.state.last_good_cmd_mono_s
+        age = t - last_good
+        if age > safety.hard_stop_timeout_s:
+            verdict = "HARD_STOP"
+        elif age > safety.stale_timeout_s:
+            verdict = "SOFT_HOLD"
+        else:
+            verdict = "OK"
+
+        prev = self.verdict
+        if verdict == prev:
+            return verdict
+        self.verdict = verdict
+
+        if verdict == "SOFT_HOLD" and prev == "OK":
+            self.stats.soft_events += 1
+            self._record(t - (last_good + safety.stale_timeout_s), verdict, age)
+        elif verdict == "HARD_STOP":
+            self.stats.hard_events += 1
+            self._torque_off()
+            self._record(t - (last_good + safety.hard_stop_timeout_s), verdict, age)
+        return verdict
+
+    def _torque_off(self) -> None:
+        with self.bus.lock:
+            # A command may have landed while we waited for the bus
+            if now_s() - self.safety.state.last_good_cmd_mono_s <= self.safety.hard_stop_timeout_s:
+                return
+            try:
+                self.bus.torque_all(False)
+                self.stats.torque_off_writes += 1
+            except Exception as e:
+                self.stats.torque_off_failures += 1
+                print(f"{self.tag} WARN watchdog torque off failed:", e)
+
+    def _record(self, late_s: float, verdict: str, age: float) -> None:
+        ms = max(0.0, late_s) * 1000.0
+        self.stats.last_detect_ms = ms
+        self.stats.max_detect_ms = max(self.stats.max_detect_ms, ms)
+        self.stats.recent_detect_ms.append(ms)
+        print(f"{self.tag} watchdog {verdict}: no good command for {age:.3f}s (detected +{ms:.1f} ms)")